@@ -1,6 +1,6 @@
 {
     'name': 'HerbaProgram - Sistema Integral',
-    'version': '1.0.0',
+    'version': '1.0.5',
     'sequence': 10,
     'category': 'Education',
     'summary': 'Sistema de Gestión Integral de Registros Botánicos e Imágenes del Herbario ESPOCH',
@@ -26,6 +26,9 @@
     'author': 'Katty Alexandra Moyano Ramos',
     'website': 'https://www.espoch.edu.ec',
     'depends': ['base', 'web', 'website', 'mail'],
+    'external_dependencies': {
+        'python': ['numpy'],
+    },
     'data': [
         # Seguridad
         'security/herbario_security.xml',
@@ -34,12 +37,17 @@
         # Datos base
         'data/sequence_data.xml',
         'data/optimization.sql',
+        'data/ir_cron_data.xml',
 
         # Vistas Backend
         'views/specimen_views.xml',
         'views/collection_site_views.xml',
         'views/image_views.xml',
+        'views/image_bulk_ingest_views.xml',
         'views/qr_code_views.xml',
+        'views/qr_label_wizard_views.xml',
+        'views/qr_scan_daily_views.xml',
+        'views/report_job_views.xml',
         'views/audit_log_views.xml',
         'views/herbario_menus.xml',
         'views/location_views.xml',
@@ -49,6 +57,8 @@
         'views/website_menus.xml',
         'views/website_snippets.xml',
 
+        # Reportes
+        'reports/specimen_report.xml',
     ],
     'assets': {
         'web.assets_backend': [
@@ -59,6 +69,8 @@
             'herbario_espoch/static/src/css/herbario_website.css',
             'herbario_espoch/static/src/js/repository_snippet.js',
             'herbario_espoch/static/src/js/statistics_pages.js',
+            'herbario_espoch/static/src/js/iiif_viewer.js',
+            'herbario_espoch/static/src/js/specimen_gallery.js',
         ],
         'web.assets_qweb': [
             'herbario_espoch/static/src/xml/*.xml',
@@ -0,0 +1,101 @@
+from odoo import http
+from odoo.http import request
+import logging
+
+from ..tools import iiif
+from .main import HerbarioController
+
+_logger = logging.getLogger(__name__)
+
+IMAGE_INFO_CONTENT_TYPE = f'application/ld+json;profile="{iiif.IMAGE_CONTEXT}"'
+MANIFEST_CONTENT_TYPE = f'application/ld+json;profile="{iiif.PRESENTATION_CONTEXT}"'
+# Los visores IIIF externos (Mirador, Universal Viewer) piden desde otros dominios
+CORS_HEADER = ('Access-Control-Allow-Origin', '*')
+IIIF_MAX_AGE = 604800
+
+
+class HerbarioIIIFController(http.Controller):
+
+    # ==================== IIIF IMAGE API 3.0 ====================
+
+    def _get_public_image(self, image_id):
+        image = request.env['herbario.image'].sudo().browse(image_id)
+        if not image.exists() or image.deleted_at or not HerbarioController._image_is_public(image):
+            raise request.not_found()
+        return image
+
+    def _image_service_id(self, image):
+        return f"{image.get_base_url()}/herbario/iiif/{image.id}"
+
+    @http.route('/herbario/iiif/<int:image_id>', type='http', auth='public', methods=['GET'])
+    def iiif_base(self, image_id, **kwargs):
+        """La URI base del servicio redirige a info.json, como exige la especificación."""
+        return request.redirect(f'/herbario/iiif/{image_id}/info.json', code=303)
+
+    @http.route('/herbario/iiif/<int:image_id>/info.json', type='http', auth='public', methods=['GET'])
+    def iiif_info(self, image_id, **kwargs):
+        """Describe la imagen: dimensiones, teselas y escalas disponibles."""
+        image = self._get_public_image(image_id)
+        info = iiif.build_info(
+            self._image_service_id(image), image.image_width, image.image_height,
+            image._get_iiif_tile_size())
+        return request.make_json_response(info, headers=[
+            ('Content-Type', IMAGE_INFO_CONTENT_TYPE),
+            ('Cache-Control', f'public, max-age={IIIF_MAX_AGE}'),
+            CORS_HEADER,
+        ])
+
+    @http.route('/herbario/iiif/<int:image_id>/<string:region>/<string:size>/<string:rotation>/<string:quality_format>',
+                type='http', auth='public', methods=['GET'])
+    def iiif_image(self, image_id, region, size, rotation, quality_format, **kwargs):
+        """
+        Petición de la Image API: {region}/{size}/{rotation}/{quality}.{format}.
+        Las teselas que pide el visor salen de la pirámide pre-generada; el resto se
+        renderiza desde el original.
+        """
+        image = self._get_public_image(image_id)
+        try:
+            content, mimetype = image._iiif_image(region, size, rotation, quality_format)
+        except iiif.IIIFError as e:
+            return request.make_response(str(e), headers=[('Content-Type', 'text/plain; charset=utf-8'), CORS_HEADER], status=400)
+        return request.make_response(content, headers=[
+            ('Content-Type', mimetype),
+            ('Cache-Control', f'public, max-age={IIIF_MAX_AGE}'),
+            CORS_HEADER,
+        ])
+
+    # ==================== IIIF PRESENTATION API 3.0 ====================
+
+    @http.route('/herbario/iiif/specimen/<int:specimen_id>/manifest.json', type='http', auth='public', methods=['GET'])
+    def iiif_specimen_manifest(self, specimen_id, **kwargs):
+        """Manifiesto con un canvas por cada imagen del espécimen."""
+        specimen = request.env['herbario.specimen'].sudo().browse(specimen_id)
+        if not specimen.exists() or not specimen.es_publico or specimen.status != 'activo':
+            raise request.not_found()
+
+        base_url = specimen.get_base_url()
+        manifest_id = f'{base_url}/herbario/iiif/specimen/{specimen.id}/manifest.json'
+        canvases = [
+            iiif.build_canvas(
+                f'{base_url}/herbario/iiif/specimen/{specimen.id}/canvas/{image.id}',
+                self._image_service_id(image),
+                image.image_width, image.image_height,
+                image.description or image.filename_original,
+            )
+            for image in specimen.image_ids
+            if not image.deleted_at and image.image_width and image.image_height
+        ]
+        manifest = iiif.build_manifest(
+            manifest_id,
+            specimen.taxon_id.name or specimen.codigo_herbario,
+            [
+                ('Código Herbario', specimen.codigo_herbario),
+                ('Número de Cartulina', specimen.numero_cartulina),
+                ('Familia', specimen.taxon_id.family_id.name),
+            ],
+            canvases,
+        )
+        return request.make_json_response(manifest, headers=[
+            ('Content-Type', MANIFEST_CONTENT_TYPE),
+            CORS_HEADER,
+        ])
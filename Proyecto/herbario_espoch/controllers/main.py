@@ -1,11 +1,24 @@
 from odoo import http
-from odoo.http import request
+from odoo.http import request, content_disposition
+from odoo.tools import str2bool
 import json
 import base64
 import logging
 
+from ..tools import image_processing
+
 _logger = logging.getLogger(__name__)
 
+# Caché del navegador para derivados (la URL no cambia si se reemplaza la imagen)
+DERIVATIVE_MAX_AGE = 86400
+# Mientras no hay derivados se sirve el original, pero solo por poco tiempo
+ORIGINAL_FALLBACK_MAX_AGE = 60
+# Miniaturas por página de la galería del detalle (la primera se renderiza en el servidor)
+GALLERY_PAGE_SIZE = 12
+GALLERY_MAX_PAGE_SIZE = 48
+# Filas máximas por consulta de analítica de escaneos
+SCAN_STATS_MAX_ROWS = 366
+
 
 class HerbarioController(http.Controller):
 
@@ -70,10 +83,10 @@ class HerbarioController(http.Controller):
 
         data = []
         for spec in specimens:
-            primary_image = spec.image_ids.filtered(lambda i: i.is_primary)
-            if not primary_image:
-                primary_image = spec.image_ids[:1]
-            image_url = f'/web/image/herbario.image/{primary_image.id}/image_data' if primary_image else False
+            primary_image = spec.taxon_id.primary_image_id
+            image_url = primary_image[:1]._get_derivative_url(480) if primary_image else False
+            # Marcador de 16 px en línea: la tarjeta se pinta sin esperar a la imagen
+            placeholder = primary_image[:1].placeholder or False
 
             data.append({
                 'id': spec.id,
@@ -87,6 +100,7 @@ class HerbarioController(http.Controller):
                 'index': spec.index_text or '',
                 'province': spec.collection_site_ids[:1].province_id.name if spec.collection_site_ids and spec.collection_site_ids[:1].province_id else '',
                 'image': image_url,
+                'placeholder': placeholder,
             })
         
         # LÓGICA DE TAMIZADO: Usar el dominio actual para filtrar las opciones disponibles
@@ -149,13 +163,21 @@ class HerbarioController(http.Controller):
         # OBTENER IMAGEN PRINCIPAL
         # =======================
         image_url = False
+        image_placeholder = False
+        iiif_info_url = False
+
+        main_image = specimen.taxon_id.primary_image_id
 
-        main_image = specimen.image_ids.filtered(lambda i: i.is_primary)[:1]
-        if not main_image and specimen.image_ids:
-            main_image = specimen.image_ids[:1]
+        # Primera página de la galería; el resto se pide a /herbario/api/gallery al hacer scroll
+        Image = request.env['herbario.image'].sudo()
+        gallery_domain = Image._get_gallery_domain(specimen.taxon_id)
+        gallery_total = Image.search_count(gallery_domain)
+        gallery_images = Image.search(gallery_domain, limit=GALLERY_PAGE_SIZE)
 
         if main_image:
-            image_url = f"/web/image/herbario.image/{main_image.id}/image_data"
+            image_url = main_image._get_derivative_url(1024)
+            image_placeholder = main_image.placeholder
+            iiif_info_url = f"/herbario/iiif/{main_image.id}/info.json"
 
         # =======================
         # RENDER A LA VISTA
@@ -163,8 +185,62 @@ class HerbarioController(http.Controller):
         return request.render('herbario_espoch.herbario_specimen_detail', {
             'specimen': specimen,
             'image_url': image_url,
+            'image_placeholder': image_placeholder,
+            'iiif_info_url': iiif_info_url,
+            'main_image': main_image,
+            'gallery_images': gallery_images,
+            'gallery_total': gallery_total,
+            'gallery_page_size': GALLERY_PAGE_SIZE,
         })
 
+    @http.route('/herbario/api/gallery', type='json', auth='public', methods=['POST'], csrf=False)
+    def api_gallery(self, specimen_id=None, taxon_id=None, offset=0, limit=GALLERY_PAGE_SIZE, **kwargs):
+        """
+        Página de la galería de un espécimen (las imágenes de su taxón) o de un taxón.
+        Devuelve URLs de derivados, dimensiones y marcadores LQIP, nunca los binarios.
+        """
+        empty = {'images': [], 'total': 0, 'next_offset': False}
+        taxon = self._get_gallery_taxon(specimen_id, taxon_id)
+        if not taxon:
+            return empty
+        try:
+            offset = max(0, int(offset or 0))
+            limit = min(max(1, int(limit or GALLERY_PAGE_SIZE)), GALLERY_MAX_PAGE_SIZE)
+        except (TypeError, ValueError):
+            return empty
+
+        Image = request.env['herbario.image'].sudo()
+        domain = Image._get_gallery_domain(taxon)
+        total = Image.search_count(domain)
+        images = Image.search(domain, offset=offset, limit=limit)
+        next_offset = offset + len(images)
+        return {
+            'images': images._get_gallery_data(),
+            'total': total,
+            'next_offset': next_offset if next_offset < total else False,
+        }
+
+    @staticmethod
+    def _get_gallery_taxon(specimen_id, taxon_id):
+        """Taxón de la galería pedida; los anónimos solo ven taxones con especímenes publicados."""
+        published = [('es_publico', '=', True), ('status', '=', 'activo')]
+        anonymous = request.env.user._is_public()
+        Specimen = request.env['herbario.specimen'].sudo()
+        try:
+            if specimen_id:
+                specimen = Specimen.browse(int(specimen_id)).exists()
+                if specimen and anonymous and not specimen.filtered_domain(published):
+                    return False
+                return specimen.taxon_id
+            if taxon_id:
+                taxon = request.env['herbario.taxon'].sudo().browse(int(taxon_id)).exists()
+                if taxon and anonymous and not Specimen.search_count(published + [('taxon_id', '=', taxon.id)], limit=1):
+                    return False
+                return taxon
+        except (TypeError, ValueError):
+            pass
+        return False
+
     # ==================== PÁGINA DE ESTADÍSTICAS Y MAPA ====================
 
     @http.route('/herbario/statistics', type='http', auth='public', website=True, csrf=False)
@@ -248,6 +324,26 @@ class HerbarioController(http.Controller):
             'map_points': map_points,
         }
 
+    @http.route('/herbario/api/scan_stats', type='json', auth='user', methods=['POST'])
+    def get_scan_stats(self, date_from=None, date_to=None, group_by='day', limit=None, exclude_bots=True, **kwargs):
+        """
+        Escaneos QR agregados para tableros, leídos del resumen diario (nunca del log).
+        group_by: day, week, month, taxon, specimen o device_class.
+        Ej.: {'group_by': 'taxon', 'limit': 20, 'date_from': '2025-06-01'} -> taxones más escaneados del mes.
+        """
+        try:
+            limit = min(max(1, int(limit or SCAN_STATS_MAX_ROWS)), SCAN_STATS_MAX_ROWS)
+            rows = request.env['herbario.qr.scan.daily']._get_scan_stats(
+                date_from=date_from,
+                date_to=date_to,
+                group_by=group_by,
+                limit=limit,
+                domain=[('device_class', '!=', 'bot')] if exclude_bots else [],
+            )
+        except (TypeError, ValueError) as error:
+            return {'error': str(error), 'rows': []}
+        return {'group_by': group_by, 'rows': rows}
+
     @http.route('/herbario/api/filter_options', type='json', auth='public', website=True)
     def get_filter_options(self, **kwargs):
         """
@@ -281,9 +377,91 @@ class HerbarioController(http.Controller):
 
         image_url = False
         if specimen.image_ids:
-            image_url = f"/web/image/herbario.image/{specimen.image_ids[0].id}/image_data"
+            image_url = specimen.image_ids[0]._get_derivative_url(480)
 
         return request.render('herbario_espoch.specimen_detail_panel', {
             'spec': specimen,
             'image_url': image_url,
         }, mimetype='text/html')
+
+    # ==================== CÓDIGOS QR ====================
+
+    @http.route('/herbario/qr/<int:qr_id>/svg', type='http', auth='user', methods=['GET'])
+    def qr_svg(self, qr_id, download=None, **kwargs):
+        """
+        SVG del símbolo QR con su tipo real. El adjunto puede estar guardado como
+        text/plain (ir.attachment lo fuerza para los SVG de usuarios sin permiso de
+        editar vistas), así que no se sirve por /web/content.
+        """
+        qr = request.env['herbario.qr.code'].browse(qr_id)
+        if not qr.exists() or not qr.qr_svg:
+            raise request.not_found()
+        filename = qr.qr_filename.rsplit('.', 1)[0] + '.svg'
+        disposition = 'attachment' if str2bool(download or '0') else 'inline'
+        return request.make_response(base64.b64decode(qr.qr_svg), headers=[
+            ('Content-Type', 'image/svg+xml'),
+            ('Content-Disposition', content_disposition(filename, disposition_type=disposition)),
+            ('X-Content-Type-Options', 'nosniff'),
+        ])
+
+    # ==================== DERIVADOS DE IMÁGENES ====================
+
+    @http.route('/herbario/img/<int:image_id>/<int:size>.<string:fmt>', type='http', auth='public', methods=['GET'])
+    def image_derivative(self, image_id, size, fmt, **kwargs):
+        """
+        Sirve la versión redimensionada de una imagen. El formato de la URL es una
+        preferencia: se negocia con la cabecera Accept (AVIF, luego WebP) y la respuesta
+        lleva 'Vary: Accept' para que las cachés intermedias no mezclen formatos.
+        Si la imagen aún se está procesando se sirve el original.
+        """
+        image = request.env['herbario.image'].sudo().browse(image_id)
+        if not image.exists() or image.deleted_at or not self._image_is_public(image):
+            raise request.not_found()
+
+        formats = image_processing.negotiate_derivative_formats(
+            fmt, request.httprequest.headers.get('Accept'))
+        derivative = image.derivative_ids._select_for_size(size, formats)
+        if derivative:
+            stream = request.env['ir.binary']._get_stream_from(
+                derivative, 'data',
+                filename=f'{image.id}-{derivative.size}.{derivative.image_format}',
+                mimetype=derivative._get_mimetype())
+            max_age = DERIVATIVE_MAX_AGE
+        else:
+            stream = request.env['ir.binary']._get_stream_from(
+                image, 'image_data', filename_field='filename_original')
+            max_age = ORIGINAL_FALLBACK_MAX_AGE
+
+        response = stream.get_response(max_age=max_age)
+        response.headers['Vary'] = 'Accept'
+        return response
+
+    @http.route([
+        '/herbario/img/<int:image_id>/original',
+        '/herbario/img/<int:image_id>/original/<string:file_hash>',
+    ], type='http', auth='public', methods=['GET', 'HEAD'])
+    def image_original(self, image_id, file_hash=None, download=None, **kwargs):
+        """
+        Descarga del original en flujo: desde el filestore se envía por bloques sin leerlo
+        en memoria. Admite Range (descargas reanudables) e If-None-Match / If-Range con el
+        SHA-256 como ETag fuerte. La URL con el hash vigente es inmutable; sin hash o con
+        uno antiguo se redirige a la actual.
+        """
+        image = request.env['herbario.image'].sudo().browse(image_id)
+        if not image.exists() or image.deleted_at or not image.file_hash or not self._image_is_public(image):
+            raise request.not_found()
+        if file_hash != image.file_hash:
+            return request.redirect(image._get_original_url(download=str2bool(download or '0')), code=302, local=True)
+
+        stream = request.env['ir.binary']._get_stream_from(
+            image, 'image_data', filename_field='filename_original', mimetype=image.mime_type)
+        stream.etag = image.file_hash
+        stream.conditional = True
+        response = stream.get_response(as_attachment=str2bool(download or '0'), immutable=True)
+        response.headers['Accept-Ranges'] = 'bytes'
+        return response
+
+    @staticmethod
+    def _image_is_public(image):
+        """Los usuarios con sesión ven todas las imágenes; los anónimos, solo las publicadas."""
+        return not request.env.user._is_public() or image._is_website_visible()
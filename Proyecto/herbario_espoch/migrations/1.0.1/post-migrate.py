@@ -0,0 +1,74 @@
+"""
+Mueve las miniaturas de herbario.image al filestore.
+
+Hasta la 1.0.0 'thumbnail' y 'thumbnail_medium' se guardaban en línea (base64) en
+columnas de herbario_image. Ahora son Binary(attachment=True): se crea el
+ir.attachment equivalente al que genera el ORM y se eliminan las columnas.
+Se procesa por lotes para no cargar toda la tabla en memoria.
+"""
+import logging
+
+from odoo import api, SUPERUSER_ID
+
+_logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+THUMBNAIL_FIELDS = ('thumbnail', 'thumbnail_medium')
+
+
+def _column_exists(cr, table, column):
+    cr.execute("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = %s AND column_name = %s
+    """, (table, column))
+    return bool(cr.fetchone())
+
+
+def _move_field_to_attachments(env, field_name):
+    cr = env.cr
+    Attachment = env['ir.attachment']
+    moved = 0
+    last_id = 0
+    while True:
+        cr.execute(f"""
+            SELECT id, "{field_name}" FROM herbario_image
+            WHERE id > %s AND "{field_name}" IS NOT NULL
+            ORDER BY id LIMIT %s
+        """, (last_id, BATCH_SIZE))
+        rows = cr.fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        image_ids = [row[0] for row in rows]
+
+        # Si ya existía un adjunto para el campo (p. ej. reintento), el de la columna manda
+        Attachment.search([
+            ('res_model', '=', 'herbario.image'),
+            ('res_field', '=', field_name),
+            ('res_id', 'in', image_ids),
+        ]).unlink()
+        Attachment.create([{
+            'name': field_name,
+            'res_model': 'herbario.image',
+            'res_field': field_name,
+            'res_id': image_id,
+            'type': 'binary',
+            'mimetype': 'image/png',
+            'datas': bytes(value),
+        } for image_id, value in rows])
+
+        moved += len(rows)
+        # Liberar la caché del ORM entre lotes
+        env.invalidate_all()
+
+    cr.execute(f'ALTER TABLE herbario_image DROP COLUMN "{field_name}"')
+    _logger.info("Migración herbario.image: %s miniaturas '%s' movidas al filestore", moved, field_name)
+
+
+def migrate(cr, version):
+    if not version:
+        return
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    for field_name in THUMBNAIL_FIELDS:
+        if _column_exists(cr, 'herbario_image', field_name):
+            _move_field_to_attachments(env, field_name)
@@ -0,0 +1,48 @@
+"""
+Calcula el marcador LQIP ('placeholder') de las imágenes ya procesadas.
+
+Las imágenes nuevas lo reciben en el pool; para las existentes basta con reducir la
+miniatura mediana (200 px) que ya está en el filestore, sin volver a abrir el original.
+Se procesa por lotes para no cargar toda la tabla en memoria.
+"""
+import base64
+import logging
+
+from odoo import api, SUPERUSER_ID
+
+from odoo.addons.herbario_espoch.tools import image_processing
+
+_logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+
+def migrate(cr, version):
+    if not version:
+        return
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    Image = env['herbario.image'].with_context(active_test=False, bin_size=False)
+    done = 0
+    last_id = 0
+    while True:
+        images = Image.search([
+            ('id', '>', last_id),
+            ('placeholder', '=', False),
+            ('processing_state', '=', 'done'),
+        ], order='id', limit=BATCH_SIZE)
+        if not images:
+            break
+        last_id = images[-1].id
+        for image in images:
+            if not image.thumbnail_medium:
+                continue
+            try:
+                thumbnail = image_processing.open_image(base64.b64decode(image.thumbnail_medium))
+                image.placeholder = image_processing.make_placeholder(thumbnail)
+                done += 1
+            except image_processing.InvalidImageError:
+                _logger.warning("Migración herbario.image: miniatura ilegible en la imagen %s", image.id)
+        images.flush_recordset()
+        # Liberar la caché del ORM entre lotes
+        env.invalidate_all()
+    _logger.info("Migración herbario.image: %s marcadores LQIP generados", done)
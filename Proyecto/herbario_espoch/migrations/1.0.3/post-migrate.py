@@ -0,0 +1,35 @@
+"""
+Genera el SVG ('qr_svg') de los códigos QR existentes.
+
+Antes de esta versión el original era un PNG dependiente de box_size. Ahora el original
+es el SVG y el PNG se rasteriza bajo demanda a la resolución elegida, así que los PNG
+antiguos se descartan al generar el SVG. Se procesa por lotes; dentro de cada lote los
+QR con la misma clave de renderizado se generan una sola vez.
+"""
+import logging
+
+from odoo import api, SUPERUSER_ID
+
+_logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+
+def migrate(cr, version):
+    if not version:
+        return
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    QRCode = env['herbario.qr.code']
+    done = 0
+    last_id = 0
+    while True:
+        qr_codes = QRCode.search([('id', '>', last_id)], order='id', limit=BATCH_SIZE)
+        if not qr_codes:
+            break
+        last_id = qr_codes[-1].id
+        qr_codes._render_qr_images()
+        done += len(qr_codes)
+        qr_codes.flush_recordset()
+        # Liberar la caché del ORM entre lotes
+        env.invalidate_all()
+    _logger.info("Migración herbario.qr.code: %s símbolos SVG generados", done)
@@ -0,0 +1,43 @@
+"""
+Guarda checksum, tamaño, versión del símbolo y módulos de los códigos QR existentes.
+
+Antes eran campos calculados que decodificaban (y el checksum además hasheaba) el
+adjunto en cada lectura. Ahora se calculan al renderizar; aquí se completan los
+registros que aún no los tienen, leyendo cada SVG una sola vez y por lotes.
+"""
+import logging
+
+from odoo import api, SUPERUSER_ID
+
+_logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+
+def migrate(cr, version):
+    if not version:
+        return
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    QRCode = env['herbario.qr.code'].with_context(bin_size=False)
+    done = 0
+    last_id = 0
+    while True:
+        qr_codes = QRCode.search([
+            ('id', '>', last_id),
+            ('checksum', '=', False),
+        ], order='id', limit=BATCH_SIZE)
+        if not qr_codes:
+            break
+        last_id = qr_codes[-1].id
+        for qr in qr_codes:
+            if not qr.qr_svg:
+                continue
+            vals = QRCode._get_symbol_vals(qr.qr_svg, qr.border)
+            if vals['checksum']:
+                # Solo los metadatos: no debe invalidar la clave de renderizado ni el PNG
+                qr.write(vals)
+                done += 1
+        qr_codes.flush_recordset()
+        # Liberar la caché del ORM entre lotes
+        env.invalidate_all()
+    _logger.info("Migración herbario.qr.code: metadatos guardados en %s símbolos", done)
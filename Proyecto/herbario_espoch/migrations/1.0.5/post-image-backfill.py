@@ -0,0 +1,17 @@
+"""
+Encola para procesar las imágenes subidas antes de la escalera de derivados o del hash
+perceptual.
+
+Quedaron en 'done' sin ningún derivado, así que /herbario/img/<id>/<tamaño> seguía
+sirviendo el original completo, o sin hash perceptual, así que la auditoría de casi
+duplicados no las veía. El cron de procesamiento las atiende por lotes después
+de la actualización; la misma tarea queda como cron inactivo para lanzarla a mano.
+"""
+from odoo import api, SUPERUSER_ID
+
+
+def migrate(cr, version):
+    if not version:
+        return
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    env['herbario.image']._backfill_processing()
@@ -0,0 +1,44 @@
+"""
+Genera la vista previa PNG de los códigos QR existentes.
+
+Las vistas mostraban el SVG, pero ir.attachment guarda los SVG como text/plain cuando
+los sube un usuario sin permiso de editar vistas, y /web/image no los muestra. Ahora se
+muestra un PNG pequeño que se genera al renderizar; aquí se completa para los QR que
+ya tenían SVG, reutilizando la vista previa de los que comparten el mismo símbolo.
+"""
+import logging
+
+from odoo import api, SUPERUSER_ID
+
+_logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+
+def migrate(cr, version):
+    if not version:
+        return
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    QRCode = env['herbario.qr.code'].with_context(bin_size=False)
+    previews = {}
+    done = 0
+    last_id = 0
+    while True:
+        qr_codes = QRCode.search([
+            ('id', '>', last_id),
+            ('qr_svg', '!=', False),
+            ('qr_preview', '=', False),
+        ], order='id', limit=BATCH_SIZE)
+        if not qr_codes:
+            break
+        last_id = qr_codes[-1].id
+        for qr in qr_codes:
+            key = qr.checksum or qr.id
+            if key not in previews:
+                previews[key] = QRCode._get_preview(qr.qr_svg)
+            if previews[key]:
+                qr.write({'qr_preview': previews[key]})
+                done += 1
+        qr_codes.flush_recordset()
+        env.invalidate_all()
+    _logger.info("Migración QR: %s vistas previas generadas", done)
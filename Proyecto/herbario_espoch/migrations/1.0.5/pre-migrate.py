@@ -0,0 +1,47 @@
+"""
+Deja una sola ubicación principal por espécimen y una sola imagen principal por taxón.
+
+La regla pasa de una validación en Python (que no evitaba dos principales con
+ediciones concurrentes) a una restricción en la base de datos, que no se puede crear
+si ya hay duplicados. Antes de actualizar el módulo se conserva:
+
+- en los sitios de colección, el último modificado de cada espécimen;
+- en las imágenes no borradas, la que ya mostraba el taxón (primera por orden de
+  visualización).
+"""
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    if not version:
+        return
+    cr.execute("""
+        UPDATE herbario_collection_site site
+        SET is_primary = FALSE
+        FROM (
+            SELECT id, ROW_NUMBER() OVER (
+                PARTITION BY specimen_id ORDER BY write_date DESC NULLS LAST, id DESC
+            ) AS position
+            FROM herbario_collection_site
+            WHERE is_primary
+        ) ranked
+        WHERE site.id = ranked.id AND ranked.position > 1
+    """)
+    sites = cr.rowcount
+    cr.execute("""
+        UPDATE herbario_image image
+        SET is_primary = FALSE
+        FROM (
+            SELECT id, ROW_NUMBER() OVER (
+                PARTITION BY taxon_id ORDER BY display_order, id
+            ) AS position
+            FROM herbario_image
+            WHERE is_primary AND deleted_at IS NULL AND taxon_id IS NOT NULL
+        ) ranked
+        WHERE image.id = ranked.id AND ranked.position > 1
+    """)
+    _logger.info(
+        "Migración principales: %s sitios de colección y %s imágenes desmarcados", sites, cr.rowcount
+    )
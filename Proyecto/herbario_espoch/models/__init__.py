@@ -2,8 +2,13 @@ from . import specimen_registry
 from . import collection_site
 from . import contributors
 from . import image
+from . import image_derivative
+from . import image_bulk_ingest
 from . import qr_code
+from . import qr_label_wizard
 from . import qr_scan_log
+from . import qr_scan_daily
+from . import report_job
 from . import audit_log
 from . import res_users
 from . import taxon
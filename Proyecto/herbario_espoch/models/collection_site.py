@@ -1,6 +1,17 @@
-from odoo import models, fields, api
+from odoo import models, fields, api, tools
 from odoo.exceptions import ValidationError
-import re
+import logging
+import math
+
+import numpy as np
+
+from ..tools import coordinates, gazetteer, utm
+
+_logger = logging.getLogger(__name__)
+
+# Campos related del sitio que definen la posición de su punto compartido en
+# herbario.coordinates (la elevación es de cada sitio, no del punto)
+COORDINATE_FIELDS = ('coordenadas_zona', 'latitude', 'longitude')
 
 class HerbarioHerbarium(models.Model):
     _name = 'herbario.herbarium'
@@ -144,6 +155,76 @@ class Vicinity(models.Model):
         return [(record.id, f"{record.name} ({record.locality_id.name})")
                 for record in self]
 
+    # ========== GEOCODIFICACIÓN INVERSA ==========
+    @api.model
+    def _get_gazetteer_signature(self):
+        """Resumen barato de los puntos de referencia: cambia si se edita cualquiera."""
+        self.env['herbario.coordinates'].flush_model(['vicinity_id', 'latitude', 'longitude'])
+        self.flush_model(['locality_id'])
+        self.env.cr.execute("""
+            SELECT COUNT(*), MAX(c.write_date), SUM(c.latitude + c.longitude),
+                   MAX(v.write_date), SUM(COALESCE(v.locality_id, 0))
+            FROM herbario_coordinates c
+            JOIN herbario_vicinity v ON v.id = c.vicinity_id
+            WHERE COALESCE(c.latitude, 0) != 0 OR COALESCE(c.longitude, 0) != 0
+        """)
+        return tuple(str(value) for value in self.env.cr.fetchone())
+
+    @tools.ormcache('signature')
+    def _get_gazetteer(self, signature):
+        """
+        Índices de centroides de vecindades y de localidades, construidos una vez por
+        proceso mientras no cambie ``signature``. Devuelve
+        ``((ids de vecindades, árbol), (ids de localidades, árbol))``.
+        """
+        self.env.cr.execute("""
+            SELECT c.vicinity_id, COALESCE(v.locality_id, 0), c.latitude, c.longitude
+            FROM herbario_coordinates c
+            JOIN herbario_vicinity v ON v.id = c.vicinity_id
+            WHERE COALESCE(c.latitude, 0) != 0 OR COALESCE(c.longitude, 0) != 0
+        """)
+        rows = self.env.cr.fetchall()
+        if not rows:
+            empty = ((), gazetteer.KDTree(np.empty((0, 3))))
+            return empty, empty
+        vicinity_ids, locality_ids, latitudes, longitudes = (np.array(column) for column in zip(*rows))
+        vicinity_keys, vicinity_points = gazetteer.centroids(vicinity_ids, latitudes, longitudes)
+        with_locality = locality_ids != 0
+        locality_keys, locality_points = gazetteer.centroids(
+            locality_ids[with_locality], latitudes[with_locality], longitudes[with_locality]
+        )
+        _logger.info("Geocodificador: %s vecindades y %s localidades indexadas", len(vicinity_keys), len(locality_keys))
+        return (
+            (tuple(vicinity_keys.tolist()), gazetteer.KDTree(vicinity_points)),
+            (tuple(locality_keys.tolist()), gazetteer.KDTree(locality_points)),
+        )
+
+    @api.model
+    def _reverse_geocode(self, latitudes, longitudes):
+        """
+        Vecindad y localidad más cercanas a cada punto, dentro de los radios
+        herbario.geocode_vicinity_km y herbario.geocode_locality_km.
+        Devuelve dos listas de ids (False donde no hay ninguna a esa distancia).
+        """
+        ICP = self.env['ir.config_parameter'].sudo()
+        radius = {
+            'vicinity': float(ICP.get_param('herbario.geocode_vicinity_km', 5)),
+            'locality': float(ICP.get_param('herbario.geocode_locality_km', 20)),
+        }
+        latitudes = np.asarray(latitudes, dtype=float)
+        longitudes = np.asarray(longitudes, dtype=float)
+        # 0, 0 es el valor por defecto de un punto sin coordenadas, no el golfo de Guinea
+        missing = (latitudes == 0) & (longitudes == 0)
+        points = gazetteer.to_unit_vectors(np.where(missing, np.nan, latitudes), longitudes)
+
+        vicinities, localities = self._get_gazetteer(self._get_gazetteer_signature())
+        result = []
+        for (keys, tree), level in ((vicinities, 'vicinity'), (localities, 'locality')):
+            indices, chords = tree.query(points)
+            close = (indices >= 0) & (gazetteer.chord_to_km(np.where(indices >= 0, chords, 0.0)) <= radius[level])
+            result.append([keys[index] if ok else False for index, ok in zip(indices.tolist(), close.tolist())])
+        return result[0], result[1]
+
 
 # ============================================================================
 # MODELO: COORDINATES - Coordenadas Geográficas de Referencia
@@ -152,12 +233,22 @@ class Coordinates(models.Model):
     """
     Coordenadas geográficas de referencia para vecindades.
     Pueden ser puntos de referencia, límites, centros, etc.
+    También son los puntos GPS de los sitios de colección, compartidos entre los sitios
+    que están en la misma posición (ver _get_or_create_points).
     """
     _name = 'herbario.coordinates'
     _description = 'Coordenadas Geográficas'
     _inherit = ['mail.thread', 'mail.activity.mixin'] 
     _order = 'id desc'
 
+    # Los puntos de los sitios de colección se comparten: un solo registro por posición
+    # redondeada. Las claves quedan NULL en los puntos de referencia de vecindades y en
+    # los que no tienen posición, y NULL no choca en un índice único
+    _sql_constraints = [
+        ('point_key_unique', 'UNIQUE (lat_key, lon_key)',
+         'Ya existe un punto registrado en esas coordenadas.'),
+    ]
+
     # ========== RELACIÓN PRINCIPAL ==========
     vicinity_id = fields.Many2one(
         'herbario.vicinity',
@@ -199,7 +290,8 @@ class Coordinates(models.Model):
     utm = fields.Char(
         string='Coordenadas UTM',
         tracking=True,
-        help='Coordenadas en formato UTM (Universal Transverse Mercator)'
+        help="Coordenadas UTM (WGS84) como '17S 758000 9850000': zona, hemisferio (S = sur), "
+             "este y norte en metros. Al guardar se calculan la latitud y la longitud."
     )
 
     # ========== CAMPOS COMPUTADOS ==========
@@ -223,39 +315,56 @@ class Coordinates(models.Model):
         ('otro', 'Otro')
     ], string='Tipo de Punto', default='referencia')
 
+    # ========== REGISTRO DE PUNTOS COMPARTIDOS ==========
+    # Solo se asignan con SQL (registro y unión de duplicados): el ORM guardaría 0 en vez de NULL
+    lat_key = fields.Integer(
+        string='Clave de Latitud',
+        readonly=True,
+        copy=False,
+        help='Latitud redondeada, en diezmillonésimas de grado, con la que se comparte el punto'
+    )
+    lon_key = fields.Integer(
+        string='Clave de Longitud',
+        readonly=True,
+        copy=False,
+        help='Longitud redondeada, en diezmillonésimas de grado, con la que se comparte el punto'
+    )
+
     # ---------- Helper para parsear coordenadas en texto ----------
+    @api.model
+    def _parse_coordenadas_zona(self, texts):
+        """
+        Parsea un lote de textos de coordenadas (decimal, DMS, DDM o con coma decimal).
+        Devuelve una lista de (lat, lon), con (None, None) donde el texto no es válido.
+        """
+        latitudes, longitudes = coordinates.parse_pairs(texts)
+        return [
+            (None, None) if math.isnan(lat) or math.isnan(lon) else (lat, lon)
+            for lat, lon in zip(latitudes.tolist(), longitudes.tolist())
+        ]
+
+    @api.model
+    def _parse_utm(self, texts):
+        """Convierte un lote de textos UTM ('17S 758000 9850000') a una lista de (lat, lon)."""
+        latitudes, longitudes = utm.parse_to_latlon(texts)
+        return [
+            (None, None) if math.isnan(lat) or math.isnan(lon) else (lat, lon)
+            for lat, lon in zip(latitudes.tolist(), longitudes.tolist())
+        ]
+
     def _parse_coordenadas_zona_str(self, text):
         """
-        Recibe una cadena tipo '01.34S 78.40W' y devuelve (lat, lon) como floats,
-        o (None, None) si no puede parsear.
+        Recibe una cadena tipo '01.34S 78.40W' o '1°20\'30"S 78°24\'15"W' y devuelve
+        (lat, lon) como floats, o (None, None) si no puede parsear.
         """
-        if not text or not isinstance(text, str):
-            return (None, None)
-        pattern = re.compile(
-            r"^\s*(\d{1,2}(?:\.\d{1,6})?)\s*([NSns])\s+(\d{1,3}(?:\.\d{1,6})?)\s*([WEwe])\s*$",
-            re.IGNORECASE
-        )
-        m = pattern.match(text.strip())
-        if not m:
-            return (None, None)
-        try:
-            lat_val, lat_dir, lon_val, lon_dir = m.groups()
-            lat = float(lat_val)
-            if lat_dir.upper() == 'S':
-                lat = -lat
-            lon = float(lon_val)
-            if lon_dir.upper() == 'W':
-                lon = -lon
-            return (lat, lon)
-        except Exception:
-            return (None, None)
+        return self._parse_coordenadas_zona([text])[0]
 
     # ========== MÉTODOS ONCHANGE PARA AUTOMATIZACIÓN ==========
     @api.onchange('coordenadas_zona')
     def _onchange_coordenadas_zona(self):
         """
         Parsea el campo 'coordenadas_zona' y actualiza latitud y longitud.
-        Admite formatos como: '01.34S 78.40W'
+        Admite formatos como: '01.34S 78.40W', '1°20\'30"S 78°24\'15"W' o '-1,34 -78,40'
         """
         if not self.coordenadas_zona:
             self.latitude = 0.0
@@ -271,33 +380,20 @@ class Coordinates(models.Model):
             self.latitude = 0.0
             self.longitude = 0.0
 
-        # Original parsing logic (now replaced by _parse_coordenadas_zona_str)
-        # # Expresión regular para capturar los valores y direcciones
-        # pattern = re.compile(
-        #     r"^\s*(\d{1,2}(?:\.\d{1,6})?)\s*([NSns])"  # Latitud: 1-2 dígitos, decimal opcional, N o S
-        #     r"\s+"                                # Espacio separador
-        #     r"(\d{1,3}(?:\.\d{1,6})?)\s*([WEwe])\s*$", # Longitud: 1-3 dígitos, decimal opcional, W o E
-        #     re.IGNORECASE
-        # )
-        # match = pattern.match(self.coordenadas_zona)
-        # if match:
-        #     try:
-        #         lat_val, lat_dir, lon_val, lon_dir = match.groups()
-        #         lat = float(lat_val)
-        #         if lat_dir.upper() == 'S':
-        #             lat = -lat
-        #         lon = float(lon_val)
-        #         if lon_dir.upper() == 'W':
-        #             lon = -lon
-        #         self.latitude = lat
-        #         self.longitude = lon
-        #     except (ValueError, TypeError):
-        #         pass
+    @api.onchange('utm')
+    def _onchange_utm(self):
+        """Convierte el UTM escrito (p. ej. '17S 758000 9850000') a latitud y longitud."""
+        if not self.utm:
+            return
+        lat, lon = self._parse_utm([self.utm])[0]
+        if lat is not None:
+            self.latitude = lat
+            self.longitude = lon
 
     @api.onchange('latitude', 'longitude')
     def _onchange_lat_lon(self):
         """
-        Actualiza el campo 'coordenadas_zona' cuando cambian latitud o longitud.
+        Actualiza los campos 'coordenadas_zona' y 'utm' cuando cambian latitud o longitud.
         """
         if self.latitude is not None and self.longitude is not None:
             lat_abs = abs(self.latitude)
@@ -307,6 +403,8 @@ class Coordinates(models.Model):
             
             # Actualiza el campo de texto con el formato deseado
             self.coordenadas_zona = f"{lat_abs:.4f}{lat_dir} {lon_abs:.4f}{lon_dir}"
+            if self.latitude or self.longitude:
+                self.utm = utm.format_many([self.latitude], [self.longitude])[0]
 
     # ========== MÉTODOS COMPUTADOS ==========
     @api.depends('latitude', 'longitude')
@@ -350,15 +448,317 @@ class Coordinates(models.Model):
 
     # ========== CONVERSIÓN AUTOMÁTICA DE FORMATO ==========
     @api.model
-    def create(self, vals):
-        """Convierte comas a puntos automáticamente al crear"""
-        return super(Coordinates, self).create(vals)
+    def _prepare_position_vals(self, vals_list):
+        """
+        Completa latitud y longitud en los vals que no las traen, desde 'coordenadas_zona'
+        o, si no hay texto legible, desde 'utm'. Cada formato se parsea una vez por lote.
+        """
+        pending = [vals for vals in vals_list if 'latitude' not in vals and 'longitude' not in vals]
+        with_text = [vals for vals in pending if vals.get('coordenadas_zona')]
+        parsed = self._parse_coordenadas_zona([vals['coordenadas_zona'] for vals in with_text])
+        for vals, (lat, lon) in zip(with_text, parsed):
+            if lat is not None:
+                vals.update(latitude=lat, longitude=lon)
+        with_utm = [vals for vals in pending if vals.get('utm') and 'latitude' not in vals]
+        parsed = self._parse_utm([vals['utm'] for vals in with_utm])
+        for vals, (lat, lon) in zip(with_utm, parsed):
+            if lat is not None:
+                vals.update(latitude=lat, longitude=lon)
+        return vals_list
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        """Calcula latitud y longitud desde el texto o el UTM (todo el lote de una vez)"""
+        return super(Coordinates, self).create(self._prepare_position_vals(vals_list))
 
     def write(self, vals):
-        """Convierte comas a puntos automáticamente al actualizar"""
-        return super(Coordinates, self).write(vals)
+        """Calcula latitud y longitud cuando solo se escribe el texto o el UTM"""
+        if vals.get('coordenadas_zona') or vals.get('utm'):
+            vals = self._prepare_position_vals([dict(vals)])[0]
+        res = super(Coordinates, self).write(vals)
+        if 'latitude' in vals or 'longitude' in vals:
+            # El punto se movió: deja de estar en el registro hasta la próxima unión de duplicados
+            self.env.cr.execute("""
+                UPDATE herbario_coordinates SET lat_key = NULL, lon_key = NULL
+                WHERE id = ANY(%s) AND lat_key IS NOT NULL
+            """, (self.ids,))
+            self.invalidate_recordset(['lat_key', 'lon_key'])
+        return res
+
+    @api.model
+    def _write_positions(self, ids, latitudes, longitudes):
+        """
+        Escribe latitud y longitud con un único UPDATE (solo las filas que cambian) y
+        recalcula lo que depende de ellas. Devuelve el número de filas cambiadas.
+        """
+        self.env.cr.execute("""
+            UPDATE herbario_coordinates c
+            SET latitude = v.lat, longitude = v.lon, lat_key = NULL, lon_key = NULL
+            FROM unnest(%s::int[], %s::float8[], %s::float8[]) AS v(id, lat, lon)
+            WHERE c.id = v.id
+              AND (c.latitude IS DISTINCT FROM v.lat OR c.longitude IS DISTINCT FROM v.lon)
+            RETURNING c.id
+        """, (list(ids), list(latitudes), list(longitudes)))
+        changed = self.browse([row[0] for row in self.env.cr.fetchall()])
+        if changed:
+            # El UPDATE no pasa por el ORM: invalidar la caché y recalcular lo que depende
+            changed.invalidate_recordset(['latitude', 'longitude', 'lat_key', 'lon_key'])
+            changed.modified(['latitude', 'longitude'])
+            self.env.flush_all()
+        return len(changed)
+
+    @api.model
+    def _backfill_positions(self, source_field, parser, batch_size=5000, only_missing=False):
+        """
+        Recalcula latitud y longitud desde ``source_field`` con ``parser`` (textos ->
+        arrays de latitud y longitud). Lee los textos por lotes con SQL y los parsea de
+        una vez; los que no se pueden leer se dejan como están. Con ``only_missing`` solo
+        toca las filas sin latitud ni longitud. Devuelve (actualizadas, no válidas).
+        """
+        self.flush_model([source_field, 'latitude', 'longitude'])
+        missing = "AND COALESCE(latitude, 0) = 0 AND COALESCE(longitude, 0) = 0" if only_missing else ""
+        updated = invalid = 0
+        last_id = 0
+        while True:
+            self.env.cr.execute(f"""
+                SELECT id, {source_field} FROM herbario_coordinates
+                WHERE id > %s AND {source_field} IS NOT NULL AND {source_field} != '' {missing}
+                ORDER BY id
+                LIMIT %s
+            """, (last_id, batch_size))
+            rows = self.env.cr.fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            ids = np.array([row[0] for row in rows])
+            latitudes, longitudes = parser(row[1] for row in rows)
+            valid = ~(np.isnan(latitudes) | np.isnan(longitudes))
+            invalid += int((~valid).sum())
+            if valid.any():
+                updated += self._write_positions(
+                    ids[valid].tolist(), latitudes[valid].tolist(), longitudes[valid].tolist()
+                )
+            self.env.invalidate_all()
+        _logger.info("Coordenadas desde %s: %s actualizadas, %s textos no válidos", source_field, updated, invalid)
+        return updated, invalid
+
+    @api.model
+    def _normalize_coordinates(self, batch_size=5000):
+        """Recalcula latitud y longitud de todas las coordenadas desde 'coordenadas_zona'."""
+        return self._backfill_positions('coordenadas_zona', coordinates.parse_pairs, batch_size)
+
+    @api.model
+    def _backfill_utm(self, batch_size=5000):
+        """Convierte a latitud y longitud el UTM de las coordenadas que aún no las tienen."""
+        return self._backfill_positions('utm', utm.parse_to_latlon, batch_size, only_missing=True)
+
+    # ========== REGISTRO DE PUNTOS COMPARTIDOS ==========
+    @api.model
+    def _get_point_precision(self):
+        """Decimales a los que se redondean los puntos compartidos (5 decimales son ~1 m)."""
+        return int(self.env['ir.config_parameter'].sudo().get_param('herbario.coordinate_precision', 5))
+
+    @api.model
+    def _find_points(self, keys):
+        """Ids de los puntos ya registrados con esas claves: ``{(lat_key, lon_key): id}``."""
+        if not keys:
+            return {}
+        lat_keys, lon_keys = zip(*keys)
+        self.env.cr.execute("""
+            SELECT c.lat_key, c.lon_key, c.id
+            FROM herbario_coordinates c
+            JOIN unnest(%s::int[], %s::int[]) AS k(lat_key, lon_key)
+              ON c.lat_key = k.lat_key AND c.lon_key = k.lon_key
+        """, (list(lat_keys), list(lon_keys)))
+        return {(lat_key, lon_key): point_id for lat_key, lon_key, point_id in self.env.cr.fetchall()}
+
+    @api.model
+    def _get_or_create_points(self, vals_list):
+        """
+        Un punto por cada vals de coordenadas (texto, latitud, longitud). Los que tienen
+        posición se redondean a herbario.coordinate_precision decimales y reutilizan el
+        punto registrado con la misma clave; los que faltan se registran en un solo lote
+        (ver _insert_points).
+        Los vals sin posición crean un registro propio, o ninguno si están vacíos.
+        Devuelve una lista de ids (False donde no hay punto) en el orden de ``vals_list``.
+        """
+        vals_list = self._prepare_position_vals([dict(vals) for vals in vals_list])
+        result = [False] * len(vals_list)
+        positioned = [
+            index for index, vals in enumerate(vals_list)
+            if vals.get('latitude') or vals.get('longitude')
+        ]
+        if positioned:
+            latitudes, longitudes, lat_keys, lon_keys = coordinates.snap(
+                [vals_list[index].get('latitude') or 0.0 for index in positioned],
+                [vals_list[index].get('longitude') or 0.0 for index in positioned],
+                self._get_point_precision(),
+            )
+            keys = list(zip(lat_keys.tolist(), lon_keys.tolist()))
+            point_ids = self._find_points(set(keys))
+
+            new_points = {}
+            for index, key, lat, lon in zip(positioned, keys, latitudes.tolist(), longitudes.tolist()):
+                if key not in point_ids and key not in new_points:
+                    vals = dict(vals_list[index], latitude=lat, longitude=lon)
+                    if not vals.get('coordenadas_zona'):
+                        vals['coordenadas_zona'] = coordinates.format_pair(lat, lon, digits=6)
+                    new_points[key] = vals
+            if new_points:
+                point_ids.update(self._insert_points(new_points))
+
+            for index, key in zip(positioned, keys):
+                result[index] = point_ids[key]
+
+        unshared = [
+            index for index, vals in enumerate(vals_list)
+            if not result[index] and any(vals.values())
+        ]
+        if unshared:
+            created = self.create([vals_list[index] for index in unshared])
+            for index, point_id in zip(unshared, created.ids):
+                result[index] = point_id
+        return result
+
+    @api.model
+    def _insert_points(self, new_points):
+        """
+        Registra los puntos ``{(lat_key, lon_key): vals}`` con un único INSERT ... ON
+        CONFLICT: si otra transacción ya guardó alguna de esas claves, esa fila se omite
+        y se toma el punto existente, en vez de fallar contra el índice único. Devuelve
+        ``{(lat_key, lon_key): id}``.
+        """
+        keys = list(new_points)
+        lat_keys, lon_keys = zip(*keys)
+        self.env.cr.execute("""
+            INSERT INTO herbario_coordinates
+                (lat_key, lon_key, latitude, longitude, coordenadas_zona, tipo_punto,
+                 create_uid, create_date, write_uid, write_date)
+            SELECT v.lat_key, v.lon_key, v.lat, v.lon, v.zona, %s,
+                   %s, now() at time zone 'UTC', %s, now() at time zone 'UTC'
+            FROM unnest(%s::int[], %s::int[], %s::float8[], %s::float8[], %s::varchar[])
+                AS v(lat_key, lon_key, lat, lon, zona)
+            ON CONFLICT (lat_key, lon_key) DO NOTHING
+            RETURNING lat_key, lon_key, id
+        """, (
+            self.default_get(['tipo_punto']).get('tipo_punto'), self.env.uid, self.env.uid,
+            list(lat_keys), list(lon_keys),
+            [vals['latitude'] for vals in new_points.values()],
+            [vals['longitude'] for vals in new_points.values()],
+            [vals['coordenadas_zona'] for vals in new_points.values()],
+        ))
+        point_ids = {(lat_key, lon_key): point_id for lat_key, lon_key, point_id in self.env.cr.fetchall()}
+        created = self.browse(list(point_ids.values()))
+        if created:
+            # El INSERT no pasa por el ORM: validar y recalcular lo que depende de la posición
+            created._check_coordinates()
+            created.modified(['latitude', 'longitude'])
+            self.env.flush_all()
+        missing = [key for key in keys if key not in point_ids]
+        if missing:
+            point_ids.update(self._find_points(missing))
+        return point_ids
+
+    @api.model
+    def _merge_duplicate_points(self, batch_size=5000):
+        """
+        Une los puntos repetidos de los sitios de colección (no toca los de referencia
+        de vecindades). Redondea todos los puntos con la precisión actual y deja uno por
+        posición, el de menor id. Los sitios y especímenes pasan a ese punto y los
+        repetidos se eliminan.
+        Devuelve el número de puntos eliminados.
+        """
+        self.flush_model()
+        self.env['herbario.collection.site'].flush_model(['coordinate_id'])
+        self.env['herbario.specimen'].flush_model(['coordinate_id'])
+        self.env.cr.execute("""
+            SELECT id, latitude, longitude FROM herbario_coordinates
+            WHERE vicinity_id IS NULL
+              AND (COALESCE(latitude, 0) != 0 OR COALESCE(longitude, 0) != 0)
+            ORDER BY id
+        """)
+        rows = self.env.cr.fetchall()
+        if not rows:
+            return 0
+        ids, latitudes, longitudes = (np.array(column) for column in zip(*rows))
+        latitudes, longitudes, lat_keys, lon_keys = coordinates.snap(
+            latitudes, longitudes, self._get_point_precision()
+        )
+        # Las filas vienen por id: el primer índice de cada clave es el punto que se queda
+        _keys, first, inverse = np.unique(
+            np.column_stack((lat_keys, lon_keys)), axis=0, return_index=True, return_inverse=True
+        )
+        inverse = inverse.reshape(-1)
+        survivor_of = ids[first][inverse]
+        duplicated = survivor_of != ids
+
+        duplicate_ids = ids[duplicated].tolist()
+        if duplicate_ids:
+            targets = survivor_of[duplicated].tolist()
+            for model in ('herbario.collection.site', 'herbario.specimen'):
+                Model = self.env[model]
+                self.env.cr.execute(f"""
+                    UPDATE {Model._table} r
+                    SET coordinate_id = v.target
+                    FROM unnest(%s::int[], %s::int[]) AS v(id, target)
+                    WHERE r.coordinate_id = v.id
+                    RETURNING r.id
+                """, (duplicate_ids, targets))
+                moved = Model.browse([row[0] for row in self.env.cr.fetchall()])
+                # El UPDATE no pasa por el ORM: invalidar la caché y recalcular lo que depende
+                moved.invalidate_recordset(['coordinate_id'])
+                moved.modified(['coordinate_id'])
+            self.browse(duplicate_ids).unlink()
+
+        # Las claves se rehacen desde cero: con otra precisión, un punto puede tomar la
+        # clave que otro tenía antes
+        self.env.cr.execute("""
+            UPDATE herbario_coordinates SET lat_key = NULL, lon_key = NULL
+            WHERE vicinity_id IS NULL AND lat_key IS NOT NULL
+        """)
+        survivors = ids[first]
+        columns = (survivors, latitudes[first], longitudes[first], lat_keys[first], lon_keys[first])
+        for start in range(0, len(survivors), batch_size):
+            self.env.cr.execute("""
+                UPDATE herbario_coordinates c
+                SET latitude = v.lat, longitude = v.lon, lat_key = v.lat_key, lon_key = v.lon_key
+                FROM unnest(%s::int[], %s::float8[], %s::float8[], %s::int[], %s::int[])
+                    AS v(id, lat, lon, lat_key, lon_key)
+                WHERE c.id = v.id
+            """, tuple(column[start:start + batch_size].tolist() for column in columns))
+        points = self.browse(survivors.tolist())
+        points.invalidate_recordset(['latitude', 'longitude', 'lat_key', 'lon_key'])
+        points.modified(['latitude', 'longitude'])
+        self.env.flush_all()
+        _logger.info(
+            "Registro de puntos: %s puntos repetidos unidos en %s puntos", len(duplicate_ids), len(survivors)
+        )
+        return len(duplicate_ids)
 
     # ========== ACCIONES ==========
+    def action_convert_utm(self):
+        """Convierte a latitud y longitud el UTM de los registros seleccionados, en un solo lote."""
+        records = self.filtered('utm')
+        latitudes, longitudes = utm.parse_to_latlon(records.mapped('utm'))
+        valid = ~(np.isnan(latitudes) | np.isnan(longitudes))
+        converted = int(valid.sum())
+        if converted:
+            records.flush_recordset(['latitude', 'longitude'])
+            self._write_positions(
+                np.array(records.ids)[valid].tolist(), latitudes[valid].tolist(), longitudes[valid].tolist()
+            )
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': 'Conversión UTM',
+                'message': f'{converted} coordenadas convertidas, {len(records) - converted} UTM no válidos',
+                'type': 'success' if converted == len(records) else 'warning',
+                'sticky': False,
+            }
+        }
+
     def action_open_in_maps(self):
         """Abre la ubicación en Google Maps en nueva pestaña"""
         self.ensure_one()
@@ -403,6 +803,15 @@ class CollectionSite(models.Model):
     _inherit = ['mail.thread', 'mail.activity.mixin']
     _order = 'fecha_recoleccion desc, id desc'
 
+    # Índice parcial (solo filas principales): a lo sumo una ubicación principal por
+    # espécimen, también con ediciones concurrentes. DEFERRABLE hace que se compruebe
+    # al final de cada sentencia, así el cambio de principal es un único UPDATE
+    _sql_constraints = [
+        ('one_primary_per_specimen',
+         'EXCLUDE (specimen_id WITH =) WHERE (is_primary) DEFERRABLE INITIALLY IMMEDIATE',
+         'Solo puede haber una ubicación principal por espécimen.'),
+    ]
+
     # ========== RELACIONES PRINCIPALES ==========
     specimen_id = fields.Many2one(
         'herbario.specimen', 
@@ -530,12 +939,12 @@ class CollectionSite(models.Model):
         readonly=False, # Permitir que el onchange lo actualice
         force_save="1" # Asegura que los cambios se guarden en el registro relacionado
     )
+    # La elevación es propia de cada sitio: varios sitios comparten el punto de su
+    # posición (ver herbario.coordinates) aunque se hayan medido a distinta altura
     elevation = fields.Float(
-        related='coordinate_id.elevation',
-        string='Elevación (Relacionada)',
-        store=True,
-        readonly=False, # Permitir edición manual o por onchange
-        force_save="1" # Asegura que los cambios se guarden en el registro relacionado
+        string='Elevación (m.s.n.m.)',
+        digits=(7, 2),
+        help='Elevación sobre el nivel del mar en metros'
     )
 
     # Campos 'sombra' de tipo Char para la entrada de datos en la vista de árbol.
@@ -594,6 +1003,16 @@ class CollectionSite(models.Model):
             
             self.coordenadas_zona = f"{lat_abs:.6f}{lat_dir} {lon_abs:.6f}{lon_dir}"
 
+    @api.onchange('latitude', 'longitude')
+    def _onchange_reverse_geocode(self):
+        """
+        Sin localidad elegida, la deduce del punto GPS junto con el resto de la
+        jerarquía (vecindad, cantón, provincia, país).
+        """
+        if self.locality_id or not (self.latitude or self.longitude):
+            return
+        self.update(self._geocode_points([self.latitude], [self.longitude])[0])
+
     # ========== ONCHANGE PARA JERARQUÍA DE UBICACIÓN ==========
     @api.onchange('country_id')
     def _onchange_country_id(self):
@@ -653,27 +1072,21 @@ class CollectionSite(models.Model):
     def _inverse_latitude_char(self):
         """
         Se activa al escribir en el campo de texto de latitud.
-        Limpia la entrada y actualiza el campo float real.
-        El onchange de 'latitude' se encargará del resto.
+        Acepta coma decimal y DMS/DDM ("1°20'30\"S") y actualiza el campo float real
+        de todos los registros con un solo parseo. El onchange de 'latitude' se
+        encargará del resto.
         """
-        for record in self:
-            if record.latitude_char:
-                try:
-                    # Reemplazar coma y convertir a float
-                    clean_value = record.latitude_char.strip().replace(',', '.')
-                    record.latitude = float(clean_value)
-                except (ValueError, TypeError):
-                    record.latitude = 0.0
+        self._inverse_coordinate_char('latitude_char', 'latitude', 'lat')
 
     def _inverse_longitude_char(self):
         """Actualiza el campo float cuando el campo de texto de longitud cambia."""
-        for record in self:
-            if record.longitude_char:
-                try:
-                    clean_value = record.longitude_char.strip().replace(',', '.')
-                    record.longitude = float(clean_value)
-                except (ValueError, TypeError):
-                    record.longitude = 0.0
+        self._inverse_coordinate_char('longitude_char', 'longitude', 'lon')
+
+    def _inverse_coordinate_char(self, char_field, float_field, axis):
+        records = self.filtered(char_field)
+        values = coordinates.parse_values(records.mapped(char_field), axis)
+        for record, value in zip(records, values.tolist()):
+            record[float_field] = 0.0 if math.isnan(value) else value
 
     maps_url = fields.Char(
         related='coordinate_id.maps_url',
@@ -710,19 +1123,98 @@ class CollectionSite(models.Model):
 
             record.ubicacion_completa = ', '.join(partes) if partes else 'Sin ubicación registrada'
 
+    # ========== GEOCODIFICACIÓN INVERSA ==========
+    @api.model
+    def _geocode_points(self, latitudes, longitudes):
+        """
+        Jerarquía de ubicación de cada punto según el nomenclátor local (vecindades y
+        localidades con coordenadas de referencia). Devuelve una lista de vals con solo
+        los niveles encontrados.
+        """
+        Vicinity = self.env['herbario.vicinity']
+        Locality = self.env['herbario.locality']
+        vicinity_ids, locality_ids = Vicinity._reverse_geocode(latitudes, longitudes)
+        # Cargar la jerarquía de todo el lote de una vez; luego cada lectura sale de la caché
+        Vicinity.browse(set(filter(None, vicinity_ids))).mapped('locality_id.lower_id.province_id.country_id')
+        Locality.browse(set(filter(None, locality_ids))).mapped('lower_id.province_id.country_id')
+        result = []
+        for vicinity_id, locality_id in zip(vicinity_ids, locality_ids):
+            vicinity = Vicinity.browse(vicinity_id)
+            locality = vicinity.locality_id or Locality.browse(locality_id)
+            lower = locality.lower_id
+            vals = {
+                'vicinity_id': vicinity.id,
+                'locality_id': locality.id,
+                'lower_id': lower.id,
+                'province_id': lower.province_id.id,
+                'country_id': lower.province_id.country_id.id,
+            }
+            result.append({name: value for name, value in vals.items() if value})
+        return result
+
+    def _apply_geocoding(self):
+        """Asigna la jerarquía geocodificada; agrupa los sitios que reciben los mismos valores."""
+        sites = self.filtered(lambda site: site.latitude or site.longitude)
+        groups = {}
+        for site, vals in zip(sites, self._geocode_points(sites.mapped('latitude'), sites.mapped('longitude'))):
+            if vals:
+                groups.setdefault(tuple(sorted(vals.items())), []).append(site.id)
+        for vals, site_ids in groups.items():
+            self.browse(site_ids).write(dict(vals))
+        return sum(len(site_ids) for site_ids in groups.values())
+
+    @api.model
+    def _reverse_geocode_sites(self, batch_size=2000):
+        """
+        Geocodifica, por lotes, los sitios con GPS que aún no tienen localidad (p. ej.
+        tras una importación). Devuelve el número de sitios actualizados.
+        """
+        self.flush_model(['latitude', 'longitude', 'locality_id'])
+        updated = 0
+        last_id = 0
+        while True:
+            self.env.cr.execute("""
+                SELECT id FROM herbario_collection_site
+                WHERE id > %s AND locality_id IS NULL
+                  AND (COALESCE(latitude, 0) != 0 OR COALESCE(longitude, 0) != 0)
+                ORDER BY id
+                LIMIT %s
+            """, (last_id, batch_size))
+            site_ids = [row[0] for row in self.env.cr.fetchall()]
+            if not site_ids:
+                break
+            last_id = site_ids[-1]
+            updated += self.browse(site_ids).with_context(tracking_disable=True)._apply_geocoding()
+            self.env.invalidate_all()
+        _logger.info("Geocodificación inversa: %s sitios de colección actualizados", updated)
+        return updated
+
     # ========== VALIDACIONES ==========
+    @api.constrains('elevation')
+    def _check_elevation(self):
+        """Valida la elevación del sitio con el mismo rango que las coordenadas"""
+        for record in self:
+            if record.elevation and (record.elevation < -500 or record.elevation > 9000):
+                raise ValidationError(
+                    f'La elevación parece fuera de rango (-500 a 9000 m).\n'
+                    f'Valor ingresado: {record.elevation}\n'
+                    f'Verifique el dato.'
+                )
+
     # CORRECCIÓN: Sobrescribir create y write para manejar la creación/actualización de coordenadas
     @api.model
     def create(self, vals):
         # Si no se proporciona un coordinate_id, pero hay datos de coordenadas,
-        # crear un registro de coordenadas vacío para que los campos related puedan escribir en él.
-        # Los campos related con force_save=True se encargarán de escribir los valores.
-
-        if not vals.get('coordinate_id') and any(vals.get(f) for f in ['coordenadas_zona', 'latitude', 'longitude', 'elevation']):
-            new_coord = self.env['herbario.coordinates'].create({})
-            vals['coordinate_id'] = new_coord.id
+        # el punto se toma del registro compartido (o se crea) con esos valores.
+        if not vals.get('coordinate_id') and any(vals.get(f) for f in COORDINATE_FIELDS):
+            point_vals = {field: vals.pop(field) for field in COORDINATE_FIELDS if field in vals}
+            vals['coordinate_id'] = self.env['herbario.coordinates']._get_or_create_points([point_vals])[0]
 
+        # Se crea sin marcar; si debe ser principal, el cambio se hace en una sola sentencia
+        primary = vals.pop('is_primary', False)
         site = super(CollectionSite, self).create(vals)
+        if primary:
+            site._set_primary()
 
         if site.specimen_id:
             description = f"Se agregó el sitio de colección #{site.id} ({site.numero_coleccion or 'Sin Nro.'}) al espécimen."
@@ -735,35 +1227,70 @@ class CollectionSite(models.Model):
         return site
 
     def write(self, vals):
-        # Procesar cada registro individualmente para manejar la creación de coordinate_id si es necesario
-        for site in self:
-            current_vals = dict(vals) # Copia de vals para cada registro
-
-            # Si no hay coordinate_id pero se están proporcionando datos de coordenadas, crear uno.
-            if not site.coordinate_id and any(current_vals.get(f) for f in ['coordenadas_zona', 'latitude', 'longitude', 'elevation']):
-                new_coord = self.env['herbario.coordinates'].create({})
-                current_vals['coordinate_id'] = new_coord.id
-
-            # Llamar al super.write para el registro actual con los valores potencialmente modificados
-            super(CollectionSite, site).write(current_vals)
+        # Marcar como principal desmarca las demás del espécimen: se hace al final con _set_primary
+        primary = vals.get('is_primary')
+        if primary:
+            vals = {key: value for key, value in vals.items() if key != 'is_primary'}
+
+        if 'coordinate_id' not in vals and any(field in vals for field in COORDINATE_FIELDS):
+            # Los puntos son compartidos: mover un sitio lo apunta a otro punto del registro
+            # en vez de modificar el que comparte con otros sitios. Una escritura por punto
+            point_vals = {field: vals[field] for field in COORDINATE_FIELDS if field in vals}
+            vals = {key: value for key, value in vals.items() if key not in COORDINATE_FIELDS}
+            point_ids = self.env['herbario.coordinates']._get_or_create_points(
+                [site._point_vals(point_vals) for site in self]
+            )
+            groups = {}
+            for site, point_id in zip(self, point_ids):
+                groups.setdefault(point_id, []).append(site.id)
+            for point_id, site_ids in groups.items():
+                super(CollectionSite, self.browse(site_ids)).write(dict(vals, coordinate_id=point_id))
+        else:
+            super(CollectionSite, self).write(vals)
 
+        if primary:
+            self._set_primary()
         return True # write method should return True
 
-    @api.constrains('is_primary', 'specimen_id')
-    def _check_only_one_primary(self):
-        """Asegura que solo haya UNA ubicación principal por espécimen"""
-        for record in self:
-            if record.is_primary and record.specimen_id:
-                other_primary = self.search([
-                    ('specimen_id', '=', record.specimen_id.id),
-                    ('is_primary', '=', True),
-                    ('id', '!=', record.id)
-                ])
-                if other_primary:
-                    raise ValidationError(
-                        f'Ya existe una ubicación principal para el espécimen "{record.specimen_id.codigo_herbario}".\n\n'
-                        f'Por favor, desmarque la otra ubicación antes de marcar esta como principal.'
-                    )
+    def _point_vals(self, changes):
+        """
+        Valores del punto de este sitio con ``changes`` aplicados: si solo cambia la
+        latitud o la longitud, la otra se conserva.
+        """
+        self.ensure_one()
+        vals = dict(changes)
+        if 'latitude' in vals or 'longitude' in vals:
+            vals.setdefault('latitude', self.latitude)
+            vals.setdefault('longitude', self.longitude)
+        return vals
+
+    def _set_primary(self):
+        """
+        Marca estos sitios como principales (uno por espécimen: el último del conjunto) y
+        desmarca los demás principales de esos especímenes en un único UPDATE, que el
+        índice parcial valida al terminar la sentencia.
+        """
+        if not self:
+            return
+        winners = {site.specimen_id.id: site.id for site in self}
+        self.flush_model(['is_primary', 'specimen_id'])
+        self.env.cr.execute("""
+            UPDATE herbario_collection_site
+            SET is_primary = (id = ANY(%(ids)s)),
+                write_uid = %(uid)s,
+                write_date = NOW() AT TIME ZONE 'UTC'
+            WHERE id = ANY(%(ids)s)
+               OR (specimen_id = ANY(%(specimens)s) AND is_primary)
+            RETURNING id
+        """, {
+            'ids': list(winners.values()),
+            'specimens': [specimen_id for specimen_id in winners if specimen_id],
+            'uid': self.env.uid,
+        })
+        changed = self.browse([row[0] for row in self.env.cr.fetchall()])
+        # El UPDATE no pasa por el ORM: invalidar la caché y recalcular lo que depende
+        changed.invalidate_recordset(['is_primary', 'write_uid', 'write_date'])
+        changed.modified(['is_primary'])
 
     # ========== ACCIONES ==========
     def action_open_in_maps(self):
@@ -789,20 +1316,10 @@ class CollectionSite(models.Model):
     def action_set_as_primary(self):
         """Marca este sitio como ubicación principal del espécimen"""
         self.ensure_one()
-        
-        # Desmarcar otras ubicaciones primarias del mismo espécimen
-        other_primaries = self.search([
-            ('specimen_id', '=', self.specimen_id.id),
-            ('is_primary', '=', True),
-            ('id', '!=', self.id)
-        ])
-        
-        if other_primaries:
-            other_primaries.write({'is_primary': False})
-        
-        # Marcar esta como primaria
-        self.is_primary = True
-        
+
+        # Desmarca las otras ubicaciones principales del espécimen y marca esta, en una sola sentencia
+        self._set_primary()
+
         return {
             'type': 'ir.actions.client',
             'tag': 'display_notification',
@@ -843,3 +1360,17 @@ class CollectionSite(models.Model):
                 'sticky': False,
             }
         }
+
+    def action_reverse_geocode(self):
+        """Asigna la ubicación desde las coordenadas GPS a los sitios seleccionados"""
+        updated = self._apply_geocoding()
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': 'Ubicación desde GPS',
+                'message': f'{updated} de {len(self)} sitios ubicados en el nomenclátor',
+                'type': 'success' if updated == len(self) else 'warning',
+                'sticky': False,
+            }
+        }
@@ -1,14 +1,20 @@
 from odoo import models, fields, api
 from odoo.exceptions import ValidationError
+from odoo.tools import split_every, str2bool
+from odoo.tools import config
 from datetime import datetime
-import base64
-import hashlib
+import logging
 import os
-from PIL import Image, UnidentifiedImageError
+import shutil
 
-import logging
-from io import BytesIO
-import json
+from ..tools import derivative_cache, iiif, image_processing, phash, worker_pool
+
+_logger = logging.getLogger(__name__)
+
+INVALID_IMAGE_MESSAGE = "El archivo subido no es un formato de imagen válido o está corrupto. Solo se aceptan JPG, PNG y TIFF."
+TOO_LARGE_IMAGE_MESSAGE = "La imagen tiene demasiados píxeles para procesarla (máximo %s megapíxeles)."
+MAX_IMAGE_SIZE_KB = 10000
+ALLOWED_MIME_TYPES = ['image/jpeg', 'image/png', 'image/tiff']
 
 class HerbarioImage(models.Model):
     _name = 'herbario.image'
@@ -16,6 +22,15 @@ class HerbarioImage(models.Model):
     _order = 'display_order asc, id asc'
     _inherit = ['mail.thread', 'mail.activity.mixin']
 
+    # Índice parcial (solo filas principales y no borradas): a lo sumo una principal por
+    # taxón. DEFERRABLE hace que se compruebe al final de cada sentencia, así el cambio
+    # de principal en _set_primary puede ser un único UPDATE
+    _sql_constraints = [
+        ('one_primary_per_taxon',
+         'EXCLUDE (taxon_id WITH =) WHERE (is_primary AND deleted_at IS NULL) DEFERRABLE INITIALLY IMMEDIATE',
+         'Solo puede haber una imagen principal por taxón.'),
+    ]
+
     # Relaciones
     specimen_id = fields.Many2one(
         'herbario.specimen',
@@ -50,18 +65,27 @@ class HerbarioImage(models.Model):
         attachment=True,
         required=True
     )
+    # Las miniaturas van al filestore (attachment=True) para no cargar la tabla con base64
     thumbnail = fields.Binary(
         string='Miniatura Pequeña',
-        #compute='_compute_thumbnails',
-        #store=True,
+        attachment=True,
         readonly=True
     )
     thumbnail_medium = fields.Binary(
         string='Miniatura Mediana',
-        #compute='_compute_thumbnails',
-        #store=True,
+        attachment=True,
         readonly=True
     )
+    placeholder = fields.Char(
+        string='Marcador LQIP',
+        readonly=True,
+        help='Versión de 16 px en data URI que el sitio web pinta mientras carga la imagen'
+    )
+    thumbnail_url = fields.Char(
+        string='URL de Miniatura',
+        compute='_compute_thumbnail_url',
+        help='Las vistas de lista y kanban cargan la miniatura por URL en lugar de incrustarla'
+    )
     
     # Metadatos del archivo
     file_size = fields.Integer(
@@ -115,6 +139,49 @@ class HerbarioImage(models.Model):
         #store=True
     )
     
+    # Procesamiento en segundo plano
+    processing_state = fields.Selection([
+        ('processing', 'En Proceso'),
+        ('done', 'Procesada'),
+        ('error', 'Error')
+    ], string='Estado de Procesamiento', default='done', readonly=True, index=True,
+       help='Las miniaturas y el EXIF se generan en segundo plano tras la subida')
+    processing_error = fields.Char(
+        string='Error de Procesamiento',
+        readonly=True
+    )
+    # Hash perceptual para casi duplicados (re-escaneos, recortes, re-exportaciones)
+    phash = fields.Char(
+        string='Hash Perceptual',
+        readonly=True,
+        help='dHash de 64 bits en hexadecimal; imágenes parecidas tienen hashes a poca distancia de Hamming'
+    )
+    # Índice multi-tramo: cada tramo del hash en su propia columna indexada
+    phash_chunk_0 = fields.Integer(compute='_compute_phash_chunks', store=True, index=True)
+    phash_chunk_1 = fields.Integer(compute='_compute_phash_chunks', store=True, index=True)
+    phash_chunk_2 = fields.Integer(compute='_compute_phash_chunks', store=True, index=True)
+    phash_chunk_3 = fields.Integer(compute='_compute_phash_chunks', store=True, index=True)
+    phash_chunk_4 = fields.Integer(compute='_compute_phash_chunks', store=True, index=True)
+    near_duplicate_of_id = fields.Many2one(
+        'herbario.image',
+        string='Posible Duplicado de',
+        readonly=True,
+        index='btree_not_null',
+        ondelete='set null',
+        help='Imagen anterior visualmente casi idéntica (hash perceptual cercano)'
+    )
+    near_duplicate_distance = fields.Integer(
+        string='Distancia Perceptual',
+        readonly=True
+    )
+    derivative_ids = fields.One2many(
+        'herbario.image.derivative',
+        'image_id',
+        string='Derivados',
+        readonly=True,
+        help='Versiones WebP/AVIF redimensionadas que sirve el sitio web'
+    )
+
     # Descripción y orden
     description = fields.Char(
         string='Descripción',
@@ -199,7 +266,7 @@ class HerbarioImage(models.Model):
     @api.constrains('file_size')
     def _check_file_size(self):
         """Valida que el tamaño del archivo no exceda el límite."""
-        max_size_kb = 10000
+        max_size_kb = MAX_IMAGE_SIZE_KB
         for record in self:
             if record.file_size and record.file_size > (max_size_kb * 1024):
                 raise ValidationError(f"El tamaño de la imagen no puede exceder los {max_size_kb} KB. El archivo actual pesa {record.file_size_human}.")
@@ -207,124 +274,521 @@ class HerbarioImage(models.Model):
     @api.constrains('mime_type')
     def _check_mime_type(self):
         """Valida que el tipo de archivo sea uno de los permitidos."""
-        allowed_mimes = ['image/jpeg', 'image/png', 'image/tiff']
+        allowed_mimes = ALLOWED_MIME_TYPES
         for record in self:
             if record.mime_type and record.mime_type not in allowed_mimes:
                 raise ValidationError(f"Tipo de archivo no permitido. Solo se aceptan imágenes en formato JPG, PNG y TIFF. El archivo subido es de tipo: {record.mime_type}")
 
 
 
-    def _process_image(self, image_data_b64):
-        """Procesa la imagen y genera todos los metadatos y miniaturas"""
+    def _read_image_metadata(self, image_data_b64):
+        """Metadatos baratos (tamaño, hash, dimensiones, MIME) leyendo solo la cabecera."""
         if not image_data_b64:
             return {}
-        
-        image_bytes = base64.b64decode(image_data_b64)
-        image_stream = BytesIO(image_bytes)
-        
         try:
-            # Intentar abrir la imagen. Si esto falla, Pillow no reconoce el formato.
-            image = Image.open(image_stream)
-        except UnidentifiedImageError:
+            # Se decodifica por bloques a un archivo temporal y el hash se calcula leyéndolo
+            with image_processing.spool_base64(image_data_b64) as original:
+                return image_processing.read_image_header(original)
+        except image_processing.ImageTooLargeError:
+            raise ValidationError(TOO_LARGE_IMAGE_MESSAGE % (image_processing.MAX_IMAGE_PIXELS // 1000000))
+        except image_processing.InvalidImageError:
             # Esta excepción se lanza específicamente cuando el archivo no es un formato de imagen reconocido.
-            raise ValidationError("El archivo subido no es un formato de imagen válido o está corrupto. Solo se aceptan JPG, PNG y TIFF.")
-        # Mapear formato de Pillow a tipo MIME
-        format_to_mime = {
-            'JPEG': 'image/jpeg',
-            'PNG': 'image/png',
-            'TIFF': 'image/tiff',
-        }
-        mime_type = format_to_mime.get(image.format, 'application/octet-stream')
-
-        result = {
-            'file_size': len(image_bytes),
-            'image_width': image.width,
-            'image_height': image.height,
-            'file_hash': hashlib.sha256(image_bytes).hexdigest(),
-            'mime_type': mime_type,            }
-        
-        # Generar miniaturas
-        # Miniatura pequeña (80x80)
-        image_small = image.copy()
-        image_small.thumbnail((80, 80), Image.Resampling.LANCZOS if hasattr(Image, 'Resampling') else Image.ANTIALIAS)
-        output_small = BytesIO()
-        image_small.save(output_small, format='PNG')
-        result['thumbnail'] = base64.b64encode(output_small.getvalue())
-        
-        # Miniatura mediana (200x200)
-        image_medium = image.copy()
-        image_medium.thumbnail((200, 200), Image.Resampling.LANCZOS if hasattr(Image, 'Resampling') else Image.ANTIALIAS)
-        output_medium = BytesIO()
-        image_medium.save(output_medium, format='PNG')
-        result['thumbnail_medium'] = base64.b64encode(output_medium.getvalue())
-        
-        # Extraer EXIF
-        exif_dict = self._extract_exif_dict(image)
-        if exif_dict:
-            result['exif_data'] = json.dumps(exif_dict)
-            result['exif_camera'] = exif_dict.get('camera', '')
-            result['exif_date'] = exif_dict.get('date_taken', False)
-        
-        return result
+            raise ValidationError(INVALID_IMAGE_MESSAGE)
 
-    def _extract_exif_dict(self, image):
-        """Extrae EXIF como diccionario"""
-        try:
-            exif_dict = {}
-            if hasattr(image, '_getexif') and image._getexif():
-                from PIL.ExifTags import TAGS
-                exif = image._getexif()
-                for tag_id, value in exif.items():
-                    tag = TAGS.get(tag_id, tag_id)
-                    if tag in ['Make', 'Model', 'DateTime', 'DateTimeOriginal']:
-                        exif_dict[tag.lower()] = str(value)
-                
-                # Formar el nombre de la cámara
-                if 'make' in exif_dict or 'model' in exif_dict:
-                    camera_parts = []
-                    if 'make' in exif_dict:
-                        camera_parts.append(exif_dict['make'])
-                    if 'model' in exif_dict:
-                        camera_parts.append(exif_dict['model'])
-                    exif_dict['camera'] = ' '.join(camera_parts)
-                
-                # Fecha
-                if 'datetimeoriginal' in exif_dict:
-                    exif_dict['date_taken'] = exif_dict['datetimeoriginal']
-                elif 'datetime' in exif_dict:
-                    exif_dict['date_taken'] = exif_dict['datetime']
-            
-            return exif_dict if exif_dict else None
-        except Exception:
-            return None
-            return None # Return None if any error occurs during EXIF extraction
-        
     @api.onchange('image_data')
     def _onchange_image_data(self):
-        """Calcula metadatos en tiempo real cuando se sube la imagen"""
+        """
+        Calcula en tiempo real solo los metadatos baratos. Las miniaturas y el EXIF
+        se generan en segundo plano una vez guardada la imagen.
+        """
         if self.image_data:
             try:
-                metadata = self._process_image(self.image_data)
-                # Actualizar los campos en el formulario (no en BD aún)
-                self.file_size = metadata.get('file_size', 0)
-                self.image_width = metadata.get('image_width', 0)
-                self.image_height = metadata.get('image_height', 0)
-                self.file_hash = metadata.get('file_hash', False)
-                self.thumbnail = metadata.get('thumbnail', False)
-                self.mime_type = metadata.get('mime_type', 'application/octet-stream')
-                self.thumbnail_medium = metadata.get('thumbnail_medium', False)
-                self.exif_data = metadata.get('exif_data', False)
-                self.exif_camera = metadata.get('exif_camera', '')
-                self.exif_date = metadata.get('exif_date', False)
-                # 🔹 Si no tiene nombre de archivo, generar automáticamente
-                if not self.filename_original:
-                    self.filename_original = "imagen_%s" % fields.Datetime.now().strftime("%Y%m%d_%H%M%S")
+                metadata = self._read_image_metadata(self.image_data)
             except ValidationError as e:
-                # Si _process_image lanza una ValidationError, la relanzamos para que la UI la muestre.
+                # Si la lectura lanza una ValidationError, la relanzamos para que la UI la muestre.
                 raise e
             except Exception:
                 # Para cualquier otro error inesperado al procesar la imagen.
-                raise ValidationError("El archivo subido no es un formato de imagen válido o está corrupto. Solo se aceptan JPG, PNG y TIFF.")
+                raise ValidationError(INVALID_IMAGE_MESSAGE)
+            # Actualizar los campos en el formulario (no en BD aún)
+            self.file_size = metadata.get('file_size', 0)
+            self.image_width = metadata.get('image_width', 0)
+            self.image_height = metadata.get('image_height', 0)
+            self.file_hash = metadata.get('file_hash', False)
+            self.mime_type = metadata.get('mime_type', 'application/octet-stream')
+            # 🔹 Si no tiene nombre de archivo, generar automáticamente
+            if not self.filename_original:
+                self.filename_original = "imagen_%s" % fields.Datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    # ========== PROCESAMIENTO EN SEGUNDO PLANO ==========
+    def _prepare_upload_vals(self, vals):
+        """
+        Completa los valores de una subida: metadatos baratos ahora y la imagen
+        queda en estado 'processing' hasta que el pool genere miniaturas y EXIF.
+        Con el contexto ``herbario_header_checked`` (carga masiva) la cabecera ya se leyó en el pool.
+        """
+        if not (self.env.context.get('herbario_header_checked') and vals.get('file_hash')):
+            vals.update(self._read_image_metadata(vals['image_data']))
+        vals.update({
+            'processing_state': 'processing',
+            'processing_error': False,
+            'thumbnail': False,
+            'thumbnail_medium': False,
+            'placeholder': False,
+            'exif_data': False,
+            'exif_camera': False,
+            'exif_date': False,
+            'phash': False,
+            'near_duplicate_of_id': False,
+            'near_duplicate_distance': 0,
+        })
+        return vals
+
+    def _trigger_image_processing(self):
+        """Despierta al cron de procesamiento para que atienda la cola cuanto antes."""
+        cron = self.env.ref('herbario_espoch.ir_cron_herbario_image_processing', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger()
+
+    def _get_derivative_options(self):
+        """Escalera de derivados configurada (herbario.image_derivative_*) para el pool."""
+        ICP = self.env['ir.config_parameter'].sudo()
+        formats = ['webp']
+        if str2bool(ICP.get_param('herbario.image_derivative_avif', 'False')):
+            if image_processing.avif_supported():
+                formats.append('avif')
+            else:
+                _logger.warning("AVIF activado pero Pillow no puede codificarlo; solo se generará WebP.")
+        return {
+            'derivative_sizes': image_processing.parse_derivative_sizes(
+                ICP.get_param('herbario.image_derivative_sizes')),
+            'derivative_formats': formats,
+            'tile_size': self._get_iiif_tile_size(),
+        }
+
+    def _store_derivatives(self, derivatives):
+        """Reemplaza los derivados de la imagen por los generados en el pool."""
+        self.ensure_one()
+        self.derivative_ids.sudo().unlink()
+        self.env['herbario.image.derivative'].sudo().create([
+            dict(derivative, image_id=self.id) for derivative in derivatives
+        ])
+
+    def _get_derivative_url(self, size, image_format='webp'):
+        """URL pública del derivado; el controlador negocia el formato con Accept."""
+        self.ensure_one()
+        return f'/herbario/img/{self.id}/{size}.{image_format}'
+
+    def _get_original_url(self, download=False):
+        """
+        URL de descarga del original. Lleva el SHA-256 en la ruta: si la imagen se reemplaza
+        la URL cambia, así que la respuesta puede cachearse como inmutable.
+        """
+        self.ensure_one()
+        url = f'/herbario/img/{self.id}/original/{self.file_hash}'
+        return url + '?download=1' if download else url
+
+    # ========== GALERÍA WEB ==========
+    @api.model
+    def _get_gallery_domain(self, taxon):
+        """Imágenes visibles en la galería de un taxón (las de sus especímenes)."""
+        return [('taxon_id', '=', taxon.id), ('deleted_at', '=', False)]
+
+    def _get_gallery_data(self):
+        """Datos ligeros para la galería: URLs de derivados, dimensiones y marcador LQIP, sin binarios."""
+        return [{
+            'id': image.id,
+            'description': image.description or '',
+            'width': image.image_width,
+            'height': image.image_height,
+            'placeholder': image.placeholder or False,
+            'thumbnail_url': image._get_derivative_url(160),
+            'full_url': image._get_derivative_url(1024),
+            'iiif_info_url': f'/herbario/iiif/{image.id}/info.json',
+            'is_primary': image.is_primary,
+        } for image in self]
+
+    # ========== IIIF ==========
+    def _get_iiif_tile_size(self):
+        ICP = self.env['ir.config_parameter'].sudo()
+        return int(ICP.get_param('herbario.iiif_tile_size', iiif.DEFAULT_TILE_SIZE))
+
+    def _get_iiif_root(self):
+        return os.path.join(config.filestore(self.env.cr.dbname), 'herbario_iiif')
+
+    def _get_iiif_pyramid_dir(self):
+        """Directorio de teselas en el filestore, compartido por imágenes con el mismo hash."""
+        self.ensure_one()
+        if not self.file_hash:
+            return False
+        return iiif.pyramid_dir(self._get_iiif_root(), self.file_hash, self._get_iiif_tile_size())
+
+    def _get_original_sources(self):
+        """
+        Ruta del original en el filestore por imagen, o sus bytes si el adjunto está en la
+        base de datos. Los procesos del pool abren la ruta sin pasar el base64 por el ORM.
+        """
+        attachments = self.env['ir.attachment'].sudo().search([
+            ('res_model', '=', self._name),
+            ('res_field', '=', 'image_data'),
+            ('res_id', 'in', self.ids),
+        ])
+        return {
+            attachment.res_id: (
+                attachment._full_path(attachment.store_fname) if attachment.store_fname else attachment.raw
+            )
+            for attachment in attachments
+        }
+
+    def _open_original(self):
+        """
+        Abre el original con Image.open sin decodificarlo. Si está en el filestore se
+        abre por ruta, así Pillow lee solo lo que necesita en lugar de cargar el archivo.
+        """
+        self.ensure_one()
+        return image_processing.open_image(self._get_original_sources().get(self.id, b''))
+
+    def _iiif_image(self, region, size, rotation, quality_format):
+        """Resuelve una petición de la IIIF Image API. Devuelve (contenido, tipo MIME)."""
+        self.ensure_one()
+        return iiif.handle_request(
+            self._open_original, self.image_width, self.image_height,
+            self._get_iiif_pyramid_dir(), self._get_iiif_tile_size(),
+            region, size, rotation, quality_format,
+            cache=self._get_derivative_cache(), file_hash=self.file_hash,
+        )
+
+    @api.model
+    def _get_derivative_cache(self):
+        """Caché local (por servidor) de transformaciones bajo demanda, con tope en MB."""
+        ICP = self.env['ir.config_parameter'].sudo()
+        max_mb = int(ICP.get_param('herbario.derivative_cache_max_mb', 1024))
+        root = os.path.join(config['data_dir'], 'herbario_derivative_cache', self.env.cr.dbname)
+        return derivative_cache.get_cache(root, max_mb * 1024 * 1024)
+
+    @api.model
+    def _cron_evict_derivative_cache(self):
+        """Cron: mantiene la caché de derivados por debajo de su tope (LRU)."""
+        self._get_derivative_cache().evict()
+
+    def _is_website_visible(self):
+        """Una imagen se publica si su taxón tiene algún espécimen público y activo."""
+        self.ensure_one()
+        return bool(self.env['herbario.specimen'].sudo().search_count([
+            ('taxon_id', '=', self.taxon_id.id),
+            ('es_publico', '=', True),
+            ('status', '=', 'activo'),
+        ], limit=1))
+
+    def _get_image_worker_count(self):
+        ICP = self.env['ir.config_parameter'].sudo()
+        return int(ICP.get_param('herbario.image_worker_count', worker_pool.default_worker_count()))
+
+    # ========== ALMACENAMIENTO POR CONTENIDO ==========
+    # El filestore de Odoo ya guarda cada blob por su checksum: los adjuntos con el mismo
+    # contenido comparten archivo y el recolector solo lo borra cuando ningún ir.attachment
+    # lo referencia. Aquí se aplica la misma idea a lo que genera el herbario: las imágenes
+    # con el mismo SHA-256 reutilizan miniaturas, derivados y pirámide IIIF.
+
+    def _find_processed_twins(self):
+        """Para cada hash del recordset, una imagen ya procesada con el mismo contenido."""
+        hashes = set(self.mapped('file_hash')) - {False}
+        if not hashes:
+            return {}
+        twins = self.search([
+            ('file_hash', 'in', list(hashes)),
+            ('processing_state', '=', 'done'),
+            ('id', 'not in', self.ids),
+        ], order='id asc')
+        result = {}
+        for twin in twins:
+            result.setdefault(twin.file_hash, twin)
+        return result
+
+    def _copy_processing_from(self, twin):
+        """
+        Copia miniaturas, EXIF y derivados de una imagen idéntica. Los binarios se vuelven
+        a escribir con el mismo contenido, así que sus adjuntos apuntan al mismo blob.
+        """
+        self.ensure_one()
+        twin = twin.with_context(bin_size=False)
+        self.write({
+            'thumbnail': twin.thumbnail,
+            'thumbnail_medium': twin.thumbnail_medium,
+            'placeholder': twin.placeholder,
+            'exif_data': twin.exif_data,
+            'exif_camera': twin.exif_camera,
+            'exif_date': twin.exif_date,
+            'phash': twin.phash,
+            'processing_state': 'done',
+            'processing_error': False,
+        })
+        self._store_derivatives([{
+            'size': derivative.size,
+            'image_format': derivative.image_format,
+            'width': derivative.width,
+            'height': derivative.height,
+            'file_size': derivative.file_size,
+            'data': derivative.data,
+        } for derivative in twin.derivative_ids])
+
+    @api.model
+    def _release_content(self, hashes):
+        """
+        Conteo de referencias de las pirámides IIIF: si ya ninguna imagen usa un hash,
+        su directorio se borra tras el commit (si la transacción se revierte, se conserva).
+        """
+        hashes = set(hashes) - {False}
+        if not hashes:
+            return
+        referenced = set(self.search([('file_hash', 'in', list(hashes))]).mapped('file_hash'))
+        orphans = hashes - referenced
+        if not orphans:
+            return
+        root = self._get_iiif_root()
+
+        def remove_orphan_content():
+            for file_hash in orphans:
+                shutil.rmtree(iiif.content_dir(root, file_hash), ignore_errors=True)
+
+        self.env.cr.postcommit.add(remove_orphan_content)
+
+    @api.model
+    def _deduplicate_storage(self):
+        """
+        Tarea puntual para recuperar espacio en un filestore existente:
+        1. Borra las pirámides IIIF de hashes que ya no usa ninguna imagen.
+        2. Ejecuta el recolector del filestore, que elimina los blobs que ya no referencia
+           ningún adjunto. Este paso hace commit, por eso no se lanza dentro de una petición.
+        Devuelve un resumen con los duplicados encontrados y el espacio liberado.
+        """
+        self.env.cr.execute("""
+            SELECT file_hash, COUNT(*) FROM herbario_image
+            WHERE file_hash IS NOT NULL
+            GROUP BY file_hash
+        """)
+        counts = dict(self.env.cr.fetchall())
+        duplicate_groups = {file_hash: count for file_hash, count in counts.items() if count > 1}
+
+        removed_pyramids = 0
+        freed_bytes = 0
+        root = self._get_iiif_root()
+        if os.path.isdir(root):
+            for bucket in os.scandir(root):
+                if not bucket.is_dir():
+                    continue
+                for entry in os.scandir(bucket.path):
+                    if entry.is_dir() and entry.name not in counts:
+                        for dirpath, _dirnames, filenames in os.walk(entry.path):
+                            freed_bytes += sum(os.path.getsize(os.path.join(dirpath, name)) for name in filenames)
+                        shutil.rmtree(entry.path, ignore_errors=True)
+                        removed_pyramids += 1
+
+        self.env['ir.attachment'].sudo()._gc_file_store()
+
+        summary = {
+            'duplicate_groups': len(duplicate_groups),
+            'shared_images': sum(duplicate_groups.values()) - len(duplicate_groups),
+            'removed_pyramids': removed_pyramids,
+            'freed_bytes': freed_bytes,
+        }
+        _logger.info("Deduplicación del almacenamiento de imágenes: %s", summary)
+        return summary
+
+    # ========== CASI DUPLICADOS ==========
+    def _get_phash_threshold(self):
+        ICP = self.env['ir.config_parameter'].sudo()
+        return int(ICP.get_param('herbario.phash_threshold', phash.MAX_INDEXED_DISTANCE))
+
+    def _find_near_duplicates(self, threshold=None):
+        """
+        Imágenes con hash perceptual a distancia <= threshold, sin contar copias exactas
+        (mismo SHA-256). Hasta MAX_INDEXED_DISTANCE la búsqueda usa los índices de los
+        tramos; con umbrales mayores se recorre la columna completa en SQL.
+        Devuelve [(imagen, distancia)] de la más parecida a la menos.
+        """
+        self.ensure_one()
+        if not self.phash:
+            return []
+        threshold = self._get_phash_threshold() if threshold is None else threshold
+        where = ["phash IS NOT NULL", "id != %s", "deleted_at IS NULL", "file_hash IS DISTINCT FROM %s"]
+        params = [self.phash, self.id, self.file_hash]
+        if threshold <= phash.MAX_INDEXED_DISTANCE:
+            chunk_values = phash.chunks(phash.from_hex(self.phash))
+            where.append('(%s)' % ' OR '.join(f'phash_chunk_{i} = %s' for i in range(len(chunk_values))))
+            params.extend(chunk_values)
+        self.env.cr.execute(f"""
+            SELECT id, distance FROM (
+                SELECT id, length(replace(
+                    (('x' || phash)::bit(64) # ('x' || %s)::bit(64))::text, '0', '')) AS distance
+                FROM herbario_image
+                WHERE {' AND '.join(where)}
+            ) candidates
+            WHERE distance <= %s
+            ORDER BY distance, id
+        """, params + [threshold])
+        return [(self.browse(image_id), distance) for image_id, distance in self.env.cr.fetchall()]
+
+    def _flag_near_duplicates(self):
+        """Marca cada imagen con la imagen anterior más parecida, si la hay."""
+        for image in self:
+            earlier = [(other, distance) for other, distance in image._find_near_duplicates() if other.id < image.id]
+            if earlier:
+                other, distance = earlier[0]
+                image.write({'near_duplicate_of_id': other.id, 'near_duplicate_distance': distance})
+                image.message_post(body=(
+                    f"Posible duplicado de la imagen '{other.filename_original}' "
+                    f"(taxón {other.taxon_id.name}, distancia perceptual {distance})."
+                ))
+
+    @api.model
+    def _cron_audit_near_duplicates(self):
+        """
+        Auditoría masiva: carga todos los hashes en un árbol BK y, para cada imagen,
+        busca la imagen anterior más parecida. Evita comparar todas las parejas.
+        Las imágenes anteriores al hash perceptual lo reciben con _backfill_processing.
+        """
+        threshold = self._get_phash_threshold()
+        self.env.cr.execute("""
+            SELECT id, phash, file_hash FROM herbario_image
+            WHERE phash IS NOT NULL AND deleted_at IS NULL
+            ORDER BY id
+        """)
+        rows = self.env.cr.fetchall()
+        tree = phash.BKTree()
+        matches = {}
+        for image_id, image_phash, file_hash in rows:
+            value = phash.from_hex(image_phash)
+            # Solo se han insertado imágenes anteriores: el primer resultado es el "original"
+            for distance, (other_id, other_hash) in tree.search(value, threshold):
+                if other_hash != file_hash:
+                    matches[image_id] = (other_id, distance)
+                    break
+            tree.add(value, (image_id, file_hash))
+
+        self.env.cr.execute("""
+            UPDATE herbario_image SET near_duplicate_of_id = NULL, near_duplicate_distance = 0
+            WHERE near_duplicate_of_id IS NOT NULL
+        """)
+        for batch in split_every(1000, matches.items()):
+            params = [value for image_id, (other_id, distance) in batch for value in (image_id, other_id, distance)]
+            self.env.cr.execute(f"""
+                UPDATE herbario_image AS image
+                SET near_duplicate_of_id = match.other_id, near_duplicate_distance = match.distance
+                FROM (VALUES {', '.join(['(%s, %s, %s)'] * len(batch))}) AS match(id, other_id, distance)
+                WHERE image.id = match.id
+            """, params)
+        self.invalidate_model(['near_duplicate_of_id', 'near_duplicate_distance'])
+        _logger.info("Auditoría de casi duplicados: %s imágenes marcadas de %s", len(matches), len(rows))
+        return len(matches)
+
+    def _process_pending_images(self):
+        """
+        Procesa las imágenes del recordset en el pool de procesos y guarda los
+        resultados. Los trabajadores no tocan la base de datos: reciben los bytes
+        y devuelven los valores a escribir.
+        """
+        # Contenido ya procesado en otra imagen: se reutiliza en lugar de recalcularlo
+        twins = self._find_processed_twins()
+        reused = self.browse()
+        for image in self:
+            twin = twins.get(image.file_hash)
+            if twin:
+                image._copy_processing_from(twin)
+                reused |= image
+        pending = self - reused
+
+        options = self._get_derivative_options()
+        sources = pending._get_original_sources()
+        jobs = [
+            (image.id, sources[image.id], dict(options, pyramid_dir=image._get_iiif_pyramid_dir()))
+            for image in pending if sources.get(image.id)
+        ]
+        results = worker_pool.map_in_pool(
+            image_processing.process_image_job, jobs, max_workers=self._get_image_worker_count()
+        )
+        for image_id, values, error in results:
+            image = self.browse(image_id)
+            if error:
+                _logger.warning("No se pudo procesar la imagen %s: %s", image_id, error)
+                image.write({'processing_state': 'error', 'processing_error': error})
+            else:
+                derivatives = values.pop('derivatives', [])
+                values.update({'processing_state': 'done', 'processing_error': False})
+                image.write(values)
+                image._store_derivatives(derivatives)
+                image._flag_near_duplicates()
+        # Imágenes sin datos: no hay nada que procesar
+        (pending - self.browse([job[0] for job in jobs])).write({'processing_state': 'done'})
+
+    @api.model
+    def _cron_process_pending_images(self, batch_size=None):
+        """Cron: toma un lote de la cola de imágenes pendientes y lo procesa."""
+        ICP = self.env['ir.config_parameter'].sudo()
+        batch_size = batch_size or int(ICP.get_param('herbario.image_batch_size', 20))
+        domain = [('processing_state', '=', 'processing')]
+        images = self.search(domain, order='id asc', limit=batch_size)
+        if not images:
+            return
+        images._process_pending_images()
+        # Si quedan imágenes en cola, volver a ejecutar el cron sin esperar al intervalo
+        if self.search_count(domain):
+            self._trigger_image_processing()
+
+    @api.model
+    def _backfill_processing(self, batch_size=5000):
+        """
+        Tarea puntual: vuelve a encolar las imágenes procesadas antes de que existieran
+        los derivados (no tienen ninguno), para que el sitio web deje de servir el
+        original completo, y las que no tienen hash perceptual, para que la auditoría de
+        casi duplicados cubra toda la colección. La cola se marca por lotes con SQL y el
+        cron de procesamiento la atiende a su ritmo. Devuelve el número de imágenes encoladas.
+        """
+        self.flush_model(['processing_state', 'deleted_at', 'phash'])
+        queued = 0
+        while True:
+            self.env.cr.execute("""
+                UPDATE herbario_image
+                SET processing_state = 'processing', processing_error = NULL
+                WHERE id IN (
+                    SELECT image.id FROM herbario_image image
+                    WHERE image.processing_state = 'done' AND image.deleted_at IS NULL
+                      AND (image.phash IS NULL OR NOT EXISTS (
+                          SELECT 1 FROM herbario_image_derivative derivative
+                          WHERE derivative.image_id = image.id
+                      ))
+                    ORDER BY image.id
+                    LIMIT %s
+                )
+            """, (batch_size,))
+            if not self.env.cr.rowcount:
+                break
+            queued += self.env.cr.rowcount
+        self.invalidate_model(['processing_state', 'processing_error'])
+        if queued:
+            self._trigger_image_processing()
+        _logger.info("Imágenes sin derivados o sin hash perceptual: %s encoladas para procesar", queued)
+        return queued
+
+    def action_retry_processing(self):
+        """Vuelve a encolar imágenes cuyo procesamiento falló"""
+        self.write({'processing_state': 'processing', 'processing_error': False})
+        self._trigger_image_processing()
+
+    @api.depends('phash')
+    def _compute_phash_chunks(self):
+        for record in self:
+            values = phash.chunks(phash.from_hex(record.phash)) if record.phash else [False] * len(phash.PHASH_CHUNK_BITS)
+            for index, value in enumerate(values):
+                record[f'phash_chunk_{index}'] = value
+
+    def _compute_thumbnail_url(self):
+        for record in self:
+            if record.id and record.processing_state == 'done':
+                unique = int(record.write_date.timestamp()) if record.write_date else 0
+                record.thumbnail_url = f'/web/image/herbario.image/{record.id}/thumbnail?unique={unique}'
+            else:
+                record.thumbnail_url = False
 
     @api.depends('file_size')
     def _compute_file_size_human(self):
@@ -362,10 +826,12 @@ class HerbarioImage(models.Model):
 
     @api.constrains('file_hash')
     def _check_duplicate_image(self):
+        # El mismo archivo en otro taxón está permitido: comparte blob y derivados
         for record in self:
             if record.file_hash:
                 duplicate = self.search([
                     ('id', '!=', record.id),
+                    ('taxon_id', '=', record.taxon_id.id),
                     ('specimen_id', '=', record.specimen_id.id),
                     ('file_hash', '=', record.file_hash),
                     ('deleted_at', '=', False)
@@ -375,46 +841,57 @@ class HerbarioImage(models.Model):
                         f'Esta imagen ya existe para este espécimen (subida el {duplicate.uploaded_at}).'
                     )
 
-    @api.model
-    def create(self, vals):
-        # 🔹 Generar automáticamente el nombre del archivo si no se proporciona
-        if not vals.get('filename_original'):
-            vals['filename_original'] = "imagen_%s" % datetime.now().strftime("%Y%m%d_%H%M%S")
-
-        # --- SOLUCIÓN: Asignar automáticamente el Taxón desde el Espécimen ---
-        # Si se proporciona un specimen_id pero no un taxon_id, se hereda el taxón del espécimen.
-        # Esto soluciona el error de validación al crear imágenes desde la vista de espécimen.
-        if vals.get('specimen_id') and not vals.get('taxon_id'):
-            specimen = self.env['herbario.specimen'].browse(vals['specimen_id'])
-            if specimen.taxon_id:
-                vals['taxon_id'] = specimen.taxon_id.id
-
-        # 🔹 Procesar metadatos de imagen
-        if vals.get('image_data'):
-            metadata = self._process_image(vals['image_data'])
-            vals.update(metadata)
-
-        # 🔹 Gestionar imagen principal (si no hay otra, esta será la principal)
-        if vals.get('taxon_id'):
-            existing_images = self.search([
-                ('taxon_id', '=', vals['taxon_id']),
-                ('deleted_at', '=', False)
-            ])
-            if not existing_images:
+    @api.model_create_multi
+    def create(self, vals_list):
+        for vals in vals_list:
+            # 🔹 Generar automáticamente el nombre del archivo si no se proporciona
+            if not vals.get('filename_original'):
+                vals['filename_original'] = "imagen_%s" % datetime.now().strftime("%Y%m%d_%H%M%S")
+
+            # --- SOLUCIÓN: Asignar automáticamente el Taxón desde el Espécimen ---
+            # Si se proporciona un specimen_id pero no un taxon_id, se hereda el taxón del espécimen.
+            # Esto soluciona el error de validación al crear imágenes desde la vista de espécimen.
+            if vals.get('specimen_id') and not vals.get('taxon_id'):
+                specimen = self.env['herbario.specimen'].browse(vals['specimen_id'])
+                if specimen.taxon_id:
+                    vals['taxon_id'] = specimen.taxon_id.id
+
+            # 🔹 Metadatos baratos ahora; miniaturas y EXIF en segundo plano
+            if vals.get('image_data'):
+                self._prepare_upload_vals(vals)
+
+        # 🔹 Gestionar imagen principal: una sola consulta para todos los taxones del lote
+        taxon_ids = list({vals['taxon_id'] for vals in vals_list if vals.get('taxon_id')})
+        taxa_with_images = {
+            taxon.id for (taxon,) in self._read_group(
+                [('taxon_id', 'in', taxon_ids), ('deleted_at', '=', False)], ['taxon_id'])
+        } if taxon_ids else set()
+        for vals in vals_list:
+            taxon_id = vals.get('taxon_id')
+            # Si el taxón no tiene otra imagen, esta será la principal
+            if taxon_id and taxon_id not in taxa_with_images:
                 vals['is_primary'] = True
+                taxa_with_images.add(taxon_id)
 
-        # 🔹 Si se marca como principal, desmarcar las demás
-        if vals.get('is_primary') and vals.get('taxon_id'):
-            self.search([
-                ('taxon_id', '=', vals['taxon_id']),
-                ('is_primary', '=', True),
-                ('deleted_at', '=', False)
-            ]).write({'is_primary': False})
+        # 🔹 Se crean sin marcar; las principales se aplican después en una sola sentencia
+        # (dentro del lote gana la última marcada, como al crearlas una a una)
+        primary_flags = [bool(vals.pop('is_primary', False)) for vals in vals_list]
 
-        # 🔹 Crear el registro
-        image = super(HerbarioImage, self).create(vals)
+        # 🔹 Crear los registros
+        images = super(HerbarioImage, self).create(vals_list)
+        self.browse([image.id for image, primary in zip(images, primary_flags) if primary])._set_primary()
+        for image in images:
+            image._log_upload()
 
-        # 🔹 Registrar en el historial del taxón o espécimen padre
+        if any(image.processing_state == 'processing' for image in images):
+            images._trigger_image_processing()
+
+        return images
+
+    def _log_upload(self):
+        """Registra la nueva imagen en el historial del taxón o espécimen padre."""
+        self.ensure_one()
+        image = self
         if image.taxon_id:
             description = f"Se añadió una nueva imagen ('{image.filename_original or 'imagen sin nombre'}') al taxón '{image.taxon_id.name}'."
             self.env['herbario.audit.log']._log_change(
@@ -432,14 +909,11 @@ class HerbarioImage(models.Model):
                 description=description
             )
 
-        return image
-
     def write(self, vals):
-        # Si se actualiza la imagen, recalcular metadatos
+        # Si se actualiza la imagen, recalcular metadatos y volver a encolarla
         if vals.get('image_data'):
-            metadata = self._process_image(vals['image_data'])
-            vals.update(metadata)
-        
+            self._prepare_upload_vals(vals)
+
         # --- Auditoría ---
         for record in self:
             if record.taxon_id:
@@ -454,51 +928,77 @@ class HerbarioImage(models.Model):
                     self.env['herbario.audit.log']._log_change('herbario.taxon', record.taxon_id.id, 'updated', description, changes=changes)
         # --- Fin Auditoría ---
 
-        if vals.get('is_primary'):
-            for record in self:
-                self.search([
-                    ('taxon_id', '=', record.taxon_id.id),
-                    ('id', '!=', record.id),
-                    ('is_primary', '=', True),
-                    ('deleted_at', '=', False)
-                ]).write({'is_primary': False})
-        
-        return super(HerbarioImage, self).write(vals)
+        primary = vals.get('is_primary')
+        if primary:
+            vals = {key: value for key, value in vals.items() if key != 'is_primary'}
+
+        previous_hashes = set()
+        if vals.get('image_data'):
+            # Los derivados de la imagen anterior ya no sirven; se regeneran en el pool
+            self.derivative_ids.sudo().unlink()
+            previous_hashes = set(self.mapped('file_hash'))
+
+        res = super(HerbarioImage, self).write(vals)
+        if primary:
+            self._set_primary()
+        if vals.get('image_data'):
+            self._release_content(previous_hashes)
+            self._trigger_image_processing()
+        return res
+
+    def _set_primary(self):
+        """
+        Marca estas imágenes como principales (una por taxón: la última del conjunto) y
+        desmarca las demás principales de esos taxones en un único UPDATE, que el índice
+        parcial valida al terminar la sentencia.
+        """
+        if not self:
+            return
+        winners = {image.taxon_id.id: image.id for image in self}
+        self.flush_model(['is_primary', 'taxon_id', 'deleted_at'])
+        self.env.cr.execute("""
+            UPDATE herbario_image
+            SET is_primary = (id = ANY(%(ids)s)),
+                write_uid = %(uid)s,
+                write_date = NOW() AT TIME ZONE 'UTC'
+            WHERE (id = ANY(%(ids)s) AND deleted_at IS NULL)
+               OR (taxon_id = ANY(%(taxa)s) AND is_primary AND deleted_at IS NULL)
+            RETURNING id
+        """, {
+            'ids': list(winners.values()),
+            'taxa': [taxon_id for taxon_id in winners if taxon_id],
+            'uid': self.env.uid,
+        })
+        changed = self.browse([row[0] for row in self.env.cr.fetchall()])
+        # El UPDATE no pasa por el ORM: invalidar la caché y recalcular lo que depende
+        changed.invalidate_recordset(['is_primary', 'write_uid', 'write_date'])
+        changed.modified(['is_primary'])
 
     def unlink(self):
         """
-        Sobrescribe el borrado para invalidar la caché de los especímenes afectados
-        y asegurar que la imagen principal se recalcule.
+        Borrado por lotes: un registro de auditoría por taxón afectado. El puntero
+        taxon.primary_image_id (almacenado) lo recalcula el ORM una sola vez por taxón
+        tras el borrado; los especímenes ya no se reescriben.
         """
-        for image in self:
-            # Encontrar los especímenes que usan el mismo taxón que la imagen a borrar
-            specimens_to_update = self.env['herbario.specimen'].search([
-                ('taxon_id', '=', image.taxon_id.id)
-            ])
-            
-            # Invalidar la caché del campo 'primary_image' para esos especímenes.
-            # Esto forzará a Odoo a recalcularlo la próxima vez que se acceda.
-            specimens_to_update.invalidate_recordset(['primary_image'])
+        for taxon, images in self.grouped('taxon_id').items():
+            if not taxon:
+                continue
+            names = images.mapped(lambda img: img.filename_original or 'imagen sin nombre')
+            if len(images) == 1:
+                description = f"Se eliminó una imagen ('{names[0]}') del taxón '{taxon.name}'."
+            else:
+                shown = ', '.join(names[:10]) + (', ...' if len(names) > 10 else '')
+                description = f"Se eliminaron {len(images)} imágenes ({shown}) del taxón '{taxon.name}'."
+            self.env['herbario.audit.log']._log_change('herbario.taxon', taxon.id, 'updated', description)
 
-            # Notificar a la UI que los especímenes han cambiado para forzar el refresco.
-            # Una escritura vacía es suficiente para disparar la notificación.
-            specimens_to_update.write({})
-            
-            if image.taxon_id:
-                description = f"Se eliminó una imagen ('{image.filename_original or 'imagen sin nombre'}') del taxón '{image.taxon_id.name}'."
-                self.env['herbario.audit.log']._log_change('herbario.taxon', image.taxon_id.id, 'updated', description)
-        
-        return super(HerbarioImage, self).unlink()
+        hashes = set(self.mapped('file_hash'))
+        res = super(HerbarioImage, self).unlink()
+        self.env['herbario.image']._release_content(hashes)
+        return res
 
     def action_set_as_primary(self):
         """Establece esta imagen como principal"""
         self.ensure_one()
-        self.search([
-            ('taxon_id', '=', self.taxon_id.id),
-            ('id', '!=', self.id),
-            ('is_primary', '=', True),
-            ('deleted_at', '=', False)
-        ]).write({'is_primary': False})
         self.write({'is_primary': True})
         return {'type': 'ir.actions.client', 'tag': 'reload'}
 
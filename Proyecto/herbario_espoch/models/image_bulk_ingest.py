@@ -0,0 +1,218 @@
+from odoo import models, fields, api
+from odoo.exceptions import UserError
+from odoo.tools import split_every
+from io import BytesIO
+import base64
+import logging
+import os
+import zipfile
+
+from ..tools import bulk_ingest, worker_pool
+from .image import MAX_IMAGE_SIZE_KB, ALLOWED_MIME_TYPES
+
+_logger = logging.getLogger(__name__)
+
+
+class HerbarioImageBulkIngest(models.TransientModel):
+    _name = 'herbario.image.bulk.ingest'
+    _description = 'Carga Masiva de Imágenes'
+
+    source_type = fields.Selection([
+        ('zip', 'Archivo ZIP'),
+        ('directory', 'Carpeta del Servidor')
+    ], string='Origen', default='zip', required=True)
+    zip_file = fields.Binary(string='Archivo ZIP', attachment=True)
+    zip_filename = fields.Char(string='Nombre del ZIP')
+    directory_path = fields.Char(
+        string='Ruta de la Carpeta',
+        help='Carpeta local del servidor con las fotografías (solo Administrador TI)'
+    )
+    match_by = fields.Selection([
+        ('auto', 'Automático (código, cartulina o nombre científico)'),
+        ('codigo', 'Código de Herbario'),
+        ('cartulina', 'Número de Cartulina'),
+        ('taxon', 'Nombre Científico')
+    ], string='Relacionar por', default='auto', required=True,
+       help='Cómo se interpreta el nombre de cada archivo. Se aceptan sufijos de varias tomas: _2, (2), -b')
+    process_now = fields.Boolean(
+        string='Procesar Ahora',
+        help='Genera miniaturas y derivados durante la carga. Si no se marca, el cron los procesa en segundo plano.'
+    )
+
+    # Resultado
+    state = fields.Selection([
+        ('draft', 'Borrador'),
+        ('done', 'Completado')
+    ], default='draft')
+    created_count = fields.Integer(string='Imágenes Creadas', readonly=True)
+    unmatched_count = fields.Integer(string='Sin Coincidencia', readonly=True)
+    skipped_count = fields.Integer(string='Omitidas', readonly=True)
+    report = fields.Text(string='Detalle', readonly=True)
+    image_ids = fields.Many2many('herbario.image', string='Imágenes', readonly=True)
+
+    def action_ingest(self):
+        self.ensure_one()
+        if self.source_type == 'zip':
+            # Se lee el ZIP desde el adjunto sin pasar por self.zip_file, que
+            # cargaría el archivo completo en memoria codificado en base64.
+            attachment = self.env['ir.attachment'].sudo().search([
+                ('res_model', '=', self._name),
+                ('res_field', '=', 'zip_file'),
+                ('res_id', '=', self.id),
+            ], limit=1)
+            if not attachment:
+                raise UserError('Seleccione un archivo ZIP.')
+            try:
+                if attachment.store_fname:
+                    with open(attachment._full_path(attachment.store_fname), 'rb') as archive:
+                        summary = self._ingest_entries(
+                            bulk_ingest.iter_zip(archive), self.match_by, self.process_now)
+                else:
+                    summary = self._ingest_entries(
+                        bulk_ingest.iter_zip(BytesIO(attachment.raw)), self.match_by, self.process_now)
+            except zipfile.BadZipFile:
+                raise UserError('El archivo subido no es un ZIP válido.')
+        else:
+            if not self.env.user.has_group('herbario_espoch.group_herbario_admin_ti'):
+                raise UserError('Solo el Administrador TI puede cargar imágenes desde una carpeta del servidor.')
+            summary = self._ingest_path(self.directory_path, self.match_by, self.process_now)
+
+        self.write({
+            'state': 'done',
+            'zip_file': False,
+            'created_count': len(summary['image_ids']),
+            'unmatched_count': len(summary['unmatched']),
+            'skipped_count': len(summary['skipped']),
+            'report': self._format_report(summary),
+            'image_ids': [(6, 0, summary['image_ids'])],
+        })
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
+
+    def action_view_images(self):
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'name': 'Imágenes Cargadas',
+            'res_model': 'herbario.image',
+            'view_mode': 'kanban,tree,form',
+            'domain': [('id', 'in', self.image_ids.ids)],
+        }
+
+    @api.model
+    def _format_report(self, summary):
+        lines = [f"{len(summary['image_ids'])} imágenes creadas."]
+        if summary['unmatched']:
+            lines.append('\nArchivos sin coincidencia:')
+            lines.extend(f'  • {name}: {reason}' for name, reason in summary['unmatched'])
+        if summary['skipped']:
+            lines.append('\nArchivos omitidos:')
+            lines.extend(f'  • {name}: {reason}' for name, reason in summary['skipped'])
+        return '\n'.join(lines)
+
+    # ========== INGESTA ==========
+    @api.model
+    def _ingest_path(self, path, match_by='auto', process_now=True):
+        """
+        Punto de entrada para scripts (odoo-bin shell): carga un ZIP o una carpeta local.
+        Devuelve {'image_ids': [...], 'unmatched': [(archivo, motivo)], 'skipped': [(archivo, motivo)]}.
+        """
+        if not path or not os.path.exists(path):
+            raise UserError(f'La ruta {path} no existe en el servidor.')
+        if os.path.isdir(path):
+            return self._ingest_entries(bulk_ingest.iter_directory(path), match_by, process_now)
+        with open(path, 'rb') as archive:
+            return self._ingest_entries(bulk_ingest.iter_zip(archive), match_by, process_now)
+
+    @api.model
+    def _build_match_index(self):
+        """Carga códigos, cartulinas y nombres científicos con una consulta por modelo."""
+        specimens = self.env['herbario.specimen'].search_read(
+            [], ['codigo_herbario', 'numero_cartulina', 'taxon_id'], load=None
+        )
+        taxa = self.env['herbario.taxon'].search_read([], ['name'])
+        return bulk_ingest.FilenameIndex(specimens, taxa)
+
+    @api.model
+    def _ingest_entries(self, entries, match_by='auto', process_now=False):
+        """
+        Recorre las entradas (nombre, tamaño, lector) por lotes: relaciona cada nombre con el
+        índice, inspecciona los bytes en el pool, descarta duplicados y crea las imágenes del lote
+        con un solo create.
+        """
+        Image = self.env['herbario.image']
+        index = self._build_match_index()
+        batch_size = int(self.env['ir.config_parameter'].sudo().get_param('herbario.image_batch_size', 20))
+        max_workers = Image._get_image_worker_count()
+        summary = {'image_ids': [], 'unmatched': [], 'skipped': []}
+        seen = set()
+
+        for batch in split_every(batch_size, entries):
+            matched = {}
+            jobs = []
+            for name, size, reader in batch:
+                target, reason = index.match(name, match_by)
+                if not target:
+                    summary['unmatched'].append((name, reason))
+                    continue
+                if size > MAX_IMAGE_SIZE_KB * 1024:
+                    summary['skipped'].append((name, f'supera el límite de {MAX_IMAGE_SIZE_KB / 1024:.0f} MB'))
+                    continue
+                # Solo se leen los bytes de los archivos que ya coincidieron
+                image_bytes = reader()
+                matched[name] = (target, image_bytes)
+                jobs.append((name, image_bytes))
+
+            results = worker_pool.map_in_pool(bulk_ingest.inspect_job, jobs, max_workers=max_workers)
+            headers = {}
+            for name, header, error in results:
+                if error:
+                    summary['skipped'].append((name, error))
+                elif header['mime_type'] not in ALLOWED_MIME_TYPES:
+                    summary['skipped'].append((name, f"formato no admitido ({header['mime_type']})"))
+                else:
+                    headers[name] = header
+
+            existing = {
+                (row['taxon_id'], row['specimen_id'], row['file_hash'])
+                for row in Image.search_read([
+                    ('file_hash', 'in', [header['file_hash'] for header in headers.values()]),
+                    ('deleted_at', '=', False),
+                ], ['taxon_id', 'specimen_id', 'file_hash'], load=None)
+            } if headers else set()
+
+            vals_list = []
+            for name, header in headers.items():
+                (specimen_id, taxon_id), image_bytes = matched[name]
+                key = (taxon_id, specimen_id or False, header['file_hash'])
+                if key in existing or key in seen:
+                    summary['skipped'].append((name, 'la imagen ya existe para este registro'))
+                    continue
+                seen.add(key)
+                vals_list.append(dict(
+                    header,
+                    taxon_id=taxon_id,
+                    specimen_id=specimen_id or False,
+                    filename_original=os.path.basename(name),
+                    image_data=base64.b64encode(image_bytes),
+                ))
+            if not vals_list:
+                continue
+
+            images = Image.with_context(herbario_header_checked=True).create(vals_list)
+            if process_now:
+                images._process_pending_images()
+            # Liberar los binarios del lote antes de leer el siguiente
+            images.invalidate_recordset(['image_data'])
+            summary['image_ids'].extend(images.ids)
+
+        _logger.info(
+            "Carga masiva: %s imágenes creadas, %s sin coincidencia, %s omitidas",
+            len(summary['image_ids']), len(summary['unmatched']), len(summary['skipped'])
+        )
+        return summary
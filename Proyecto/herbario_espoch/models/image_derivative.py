@@ -0,0 +1,55 @@
+from odoo import models, fields
+
+from ..tools import image_processing
+
+
+class HerbarioImageDerivative(models.Model):
+    _name = 'herbario.image.derivative'
+    _description = 'Derivados Redimensionados de Imágenes'
+    _order = 'image_id, size asc, image_format'
+
+    image_id = fields.Many2one(
+        'herbario.image',
+        string='Imagen',
+        required=True,
+        ondelete='cascade',
+        index=True
+    )
+    size = fields.Integer(
+        string='Peldaño (px)',
+        required=True,
+        help='Lado máximo configurado en la escalera de derivados'
+    )
+    image_format = fields.Selection([
+        ('webp', 'WebP'),
+        ('avif', 'AVIF')
+    ], string='Formato', required=True)
+    width = fields.Integer(string='Ancho (px)', readonly=True)
+    height = fields.Integer(string='Alto (px)', readonly=True)
+    file_size = fields.Integer(string='Tamaño (bytes)', readonly=True)
+    data = fields.Binary(
+        string='Archivo',
+        attachment=True,
+        required=True
+    )
+
+    _sql_constraints = [
+        ('image_size_format_unique', 'UNIQUE(image_id, size, image_format)',
+         'Ya existe un derivado con ese tamaño y formato para la imagen.'),
+    ]
+
+    def _get_mimetype(self):
+        self.ensure_one()
+        return image_processing.DERIVATIVE_FORMATS[self.image_format]['mime']
+
+    def _select_for_size(self, size, formats):
+        """
+        Elige entre los derivados del recordset el que mejor sirve a ``size``: el menor
+        peldaño que lo cubre o, si ninguno llega, el mayor disponible. Los formatos se
+        prueban en el orden dado y se usa el primero que tenga derivados.
+        """
+        for fmt in formats:
+            candidates = self.filtered(lambda d: d.image_format == fmt).sorted('size')
+            if candidates:
+                return next((d for d in candidates if d.size >= size), candidates[-1])
+        return self.browse()
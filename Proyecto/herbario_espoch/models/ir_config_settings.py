@@ -37,4 +37,89 @@ class ResConfigSettings(models.TransientModel):
         default=True,
         config_parameter='herbario.require_institutional_email',
         help='Solo permitir correos @espoch.edu.ec'
+    )
+
+    image_worker_count = fields.Integer(
+        string='Procesos para Imágenes',
+        default=4,
+        config_parameter='herbario.image_worker_count',
+        help='Procesos trabajadores que generan miniaturas y EXIF en segundo plano (1 = sin pool)'
+    )
+
+    image_batch_size = fields.Integer(
+        string='Lote de Procesamiento de Imágenes',
+        default=20,
+        config_parameter='herbario.image_batch_size',
+        help='Imágenes pendientes que procesa cada ejecución del cron'
+    )
+
+    image_derivative_sizes = fields.Char(
+        string='Escalera de Derivados (px)',
+        default='160,480,1024,2048',
+        config_parameter='herbario.image_derivative_sizes',
+        help='Lados máximos, separados por comas, de las versiones WebP que se generan para el sitio web'
+    )
+
+    report_worker_count = fields.Integer(
+        string='Hilos para Reportes PDF',
+        default=2,
+        config_parameter='herbario.report_worker_count',
+        help='Bloques de un reporte PDF que se renderizan a la vez en segundo plano'
+    )
+
+    report_chunk_size = fields.Integer(
+        string='Especímenes por Bloque de Reporte',
+        default=50,
+        config_parameter='herbario.report_chunk_size',
+        help='Especímenes que se renderizan juntos en cada bloque de un reporte PDF'
+    )
+
+    geocode_vicinity_km = fields.Float(
+        string='Radio de Vecindad (km)',
+        default=5.0,
+        config_parameter='herbario.geocode_vicinity_km',
+        help='Distancia máxima al centroide de una vecindad para asignarla desde el GPS'
+    )
+
+    geocode_locality_km = fields.Float(
+        string='Radio de Localidad (km)',
+        default=20.0,
+        config_parameter='herbario.geocode_locality_km',
+        help='Distancia máxima al centroide de una localidad cuando no hay vecindad cercana'
+    )
+
+    coordinate_precision = fields.Integer(
+        string='Decimales de los Puntos GPS',
+        default=5,
+        config_parameter='herbario.coordinate_precision',
+        help='Decimales (0 a 7) a los que se redondean los puntos de los sitios de colección; '
+             'los sitios en el mismo punto redondeado comparten un solo registro (5 decimales ~ 1 m)'
+    )
+
+    image_derivative_avif = fields.Boolean(
+        string='Generar Derivados AVIF',
+        default=False,
+        config_parameter='herbario.image_derivative_avif',
+        help='Además de WebP, generar AVIF (requiere soporte AVIF en Pillow)'
+    )
+
+    iiif_tile_size = fields.Integer(
+        string='Tamaño de Tesela IIIF (px)',
+        default=512,
+        config_parameter='herbario.iiif_tile_size',
+        help='Lado de las teselas del visor de zoom; cambiarlo requiere reprocesar las imágenes'
+    )
+
+    derivative_cache_max_mb = fields.Integer(
+        string='Tope de Caché de Derivados (MB)',
+        default=1024,
+        config_parameter='herbario.derivative_cache_max_mb',
+        help='Espacio en disco para recortes y tamaños pedidos bajo demanda; se expulsan los menos usados'
+    )
+
+    phash_threshold = fields.Integer(
+        string='Umbral de Casi Duplicados',
+        default=4,
+        config_parameter='herbario.phash_threshold',
+        help='Distancia de Hamming máxima entre hashes perceptuales (0-64). Hasta 4 la búsqueda usa índices'
     )
\ No newline at end of file
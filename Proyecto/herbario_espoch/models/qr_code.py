@@ -1,16 +1,11 @@
 from odoo import models, fields, api
 from odoo.exceptions import ValidationError
-import qrcode
-from io import BytesIO
 import base64
-import hashlib
 
-ERROR_CORRECTION_MAP = {
-    'L': qrcode.constants.ERROR_CORRECT_L,  # 7%
-    'M': qrcode.constants.ERROR_CORRECT_M,  # 15%
-    'Q': qrcode.constants.ERROR_CORRECT_Q,  # 25%
-    'H': qrcode.constants.ERROR_CORRECT_H,  # 30%
-}
+from ..tools import qr_render, worker_pool
+
+# Metadatos que se guardan junto a cada SVG (ver qr_render.symbol_info)
+SYMBOL_FIELDS = ('checksum', 'file_size_bytes', 'symbol_version', 'module_count')
 
 
 class HerbarioQRCode(models.Model):
@@ -52,10 +47,24 @@ class HerbarioQRCode(models.Model):
     )
 
     # ========== DATOS DEL QR ==========
+    qr_svg = fields.Binary(
+        string='QR Vectorial',
+        attachment=True,
+        help='Símbolo QR en SVG; es el original a partir del cual se imprime y se rasteriza'
+    )
+
+    # Las vistas muestran este PNG y no el SVG: ir.attachment guarda los SVG como
+    # text/plain para quien no puede editar vistas, y /web/image no los mostraría
+    qr_preview = fields.Binary(
+        string='Vista Previa del QR',
+        attachment=True,
+        help='PNG pequeño del símbolo para las listas, el formulario y el kanban'
+    )
+
     qr_image = fields.Binary(
         string='Imagen QR',
         attachment=True,
-        help='Imagen del código QR generada'
+        help='PNG a la resolución elegida, rasterizado desde el SVG la primera vez que se pide'
     )
 
     qr_url = fields.Char(
@@ -87,6 +96,19 @@ class HerbarioQRCode(models.Model):
     box_size = fields.Integer(string='Tamaño de Caja', default=10)
     border = fields.Integer(string='Borde', default=4)
 
+    render_key = fields.Char(
+        string='Clave de Renderizado',
+        index=True,
+        readonly=True,
+        help='SHA-256 de (contenido, corrección, caja, borde, formato) con el que se generó qr_svg'
+    )
+    raster_key = fields.Char(
+        string='Clave del PNG',
+        index=True,
+        readonly=True,
+        help='Clave del SVG más la resolución con la que se rasterizó qr_image'
+    )
+
     # ========== ESTADÍSTICAS DE USO ==========
     download_count = fields.Integer(
         string='Descargas',
@@ -153,14 +175,26 @@ class HerbarioQRCode(models.Model):
         compute='_compute_qr_filename'
     )
 
+    # Metadatos del símbolo: se calculan al renderizar el SVG y se guardan con él
     file_size_bytes = fields.Integer(
         string='Tamaño (Bytes)',
-        compute='_compute_file_size'
+        readonly=True
     )
 
     checksum = fields.Char(
         string='Checksum SHA256',
-        compute='_compute_checksum'
+        readonly=True
+    )
+
+    symbol_version = fields.Integer(
+        string='Versión del Símbolo',
+        readonly=True,
+        help='Versión QR (1-40) elegida para el contenido; determina el número de módulos'
+    )
+
+    module_count = fields.Integer(
+        string='Módulos por Lado',
+        readonly=True
     )
 
     # ========== RELACIONES ONE2MANY ==========
@@ -202,101 +236,177 @@ class HerbarioQRCode(models.Model):
             else:
                 record.qr_filename = f"QR_specimen_v{record.version}.png"
 
-    @api.depends('qr_image')
-    def _compute_file_size(self):
-        """Calcula tamaño de la imagen QR"""
-        for record in self:
-            try:
-                if record.qr_image:
-                    if isinstance(record.qr_image, str):
-                        data = record.qr_image + '=' * (-len(record.qr_image) % 4)
-                        decoded = base64.b64decode(data, validate=True)
-                        record.file_size_bytes = len(decoded)
-                    elif isinstance(record.qr_image, bytes):
-                        record.file_size_bytes = len(base64.b64decode(record.qr_image))
-                    else:
-                        record.file_size_bytes = 0
-                else:
-                    record.file_size_bytes = 0
-            except Exception:
-                record.file_size_bytes = 0
-
-    @api.depends('qr_image')
-    def _compute_checksum(self):
-        """Calcula checksum SHA256 de la imagen"""
-        for record in self:
-            if record.qr_image:
-                try:
-                    image_bytes = base64.b64decode(record.qr_image)
-                    record.checksum = hashlib.sha256(image_bytes).hexdigest()
-                except Exception:
-                    record.checksum = False
-            else:
-                record.checksum = False
+    @api.model
+    def _get_symbol_vals(self, qr_svg, border=None):
+        """Metadatos a guardar para un SVG en base64 (todo vacío si no hay SVG o no es legible)."""
+        empty = dict.fromkeys(SYMBOL_FIELDS, False)
+        if not qr_svg:
+            return empty
+        try:
+            return qr_render.symbol_info(base64.b64decode(qr_svg), border)
+        except ValueError:
+            return empty
+
+    @api.model
+    def _get_preview(self, qr_svg):
+        """PNG de vista previa (base64) de un SVG en base64; False si no hay SVG o no es legible."""
+        if not qr_svg:
+            return False
+        try:
+            return base64.b64encode(qr_render.rasterize_svg(base64.b64decode(qr_svg), qr_render.PREVIEW_SIZE))
+        except ValueError:
+            return False
 
     # ========== MÉTODOS PRINCIPALES ==========
     def _generate_qr_image(self, qr_content=None):
         """Genera la imagen QR basada en los datos"""
         self.ensure_one()
-
-        qr_data = qr_content or self.qr_url
-
-        error_correction_value = ERROR_CORRECTION_MAP.get(
-            self.error_correction,
-            qrcode.constants.ERROR_CORRECT_H
-        )
-
-        qr = qrcode.QRCode(
-            version=None,
-            error_correction=error_correction_value,
-            box_size=self.box_size or 10,
-            border=self.border or 4
+        svg = qr_render.render_svg(
+            qr_content or self.qr_url, self.error_correction, self.box_size, self.border
         )
+        self.write(dict(
+            qr_render.symbol_info(svg, self.border), qr_svg=base64.b64encode(svg), qr_image=False
+        ))
 
-        qr.add_data(qr_data)
-        qr.make(fit=True)
-
-        img = qr.make_image(fill_color="black", back_color="white")
-        buffer = BytesIO()
-        img.save(buffer, format='PNG')
-        self.qr_image = base64.b64encode(buffer.getvalue())
+    def _get_render_key(self):
+        self.ensure_one()
+        return qr_render.render_key(self.qr_url, self.error_correction, self.box_size, self.border)
 
-    @api.model
-    def create(self, vals):
-        """Al crear, genera automáticamente la imagen QR"""
-        record = super(HerbarioQRCode, self).create(vals)
-        if not record.qr_image:
-            record._generate_qr_image()
-        return record
+    def _render_qr_images(self):
+        """
+        Genera los SVG del lote con caché por contenido. La clave de renderizado identifica
+        los bytes del símbolo:
+        - si la clave del registro no cambió, su SVG ya es válido y no se hace nada;
+        - si otro QR ya tiene esa clave, se copia su SVG (el filestore guarda cada
+          contenido una sola vez, así que el archivo se comparte);
+        - el resto se renderiza en el pool de procesos, una sola vez por clave.
+        El PNG anterior se descarta; se rasteriza de nuevo cuando alguien lo pida.
+        """
+        by_key = {}
+        for record in self:
+            key = record._get_render_key()
+            if key != record.render_key:
+                by_key.setdefault(key, []).append(record.id)
+        if not by_key:
+            return
+
+        pending_ids = [record_id for ids in by_key.values() for record_id in ids]
+        sources = {}
+        for source in self.search([('render_key', 'in', list(by_key)), ('id', 'not in', pending_ids)]):
+            sources.setdefault(source.render_key, source)
+
+        to_render = {}
+        for key, ids in by_key.items():
+            source = sources.get(key)
+            svg = source.qr_svg if source else False
+            if svg:
+                self.browse(ids).write(dict(
+                    {field: source[field] for field in SYMBOL_FIELDS},
+                    qr_svg=svg, qr_preview=source.qr_preview or self._get_preview(svg),
+                    render_key=key, qr_image=False,
+                ))
+            else:
+                to_render[key] = self.browse(ids[0])
+        if not to_render:
+            return
+
+        jobs = [
+            (key, record.qr_url, record.error_correction, record.box_size, record.border)
+            for key, record in to_render.items()
+        ]
+        max_workers = self.env['herbario.image']._get_image_worker_count()
+        for key, svg, info, preview in worker_pool.map_in_pool(qr_render.render_job, jobs, max_workers=max_workers):
+            self.browse(by_key[key]).write(dict(
+                info, qr_svg=base64.b64encode(svg), qr_preview=base64.b64encode(preview),
+                render_key=key, qr_image=False
+            ))
+
+    def _ensure_qr_png(self):
+        """
+        Garantiza el PNG de cada QR a su resolución. Igual que con el SVG: se reutiliza el
+        PNG de otro QR con la misma clave y solo se rasteriza (en el pool) lo que falte.
+        """
+        self.filtered(lambda record: not record.render_key)._render_qr_images()
+        by_key = {}
+        for record in self:
+            key = qr_render.raster_key(record.render_key, int(record.resolution))
+            if key != record.raster_key:
+                by_key.setdefault(key, []).append(record.id)
+        if not by_key:
+            return
+
+        pending_ids = [record_id for ids in by_key.values() for record_id in ids]
+        sources = {}
+        for source in self.search([('raster_key', 'in', list(by_key)), ('id', 'not in', pending_ids)]):
+            sources.setdefault(source.raster_key, source)
+
+        jobs = []
+        for key, ids in by_key.items():
+            image = sources[key].qr_image if key in sources else False
+            if image:
+                self.browse(ids).write({'qr_image': image, 'raster_key': key})
+            else:
+                record = self.browse(ids[0])
+                jobs.append((key, base64.b64decode(record.qr_svg), int(record.resolution)))
+
+        max_workers = self.env['herbario.image']._get_image_worker_count()
+        for key, png in worker_pool.map_in_pool(qr_render.raster_job, jobs, max_workers=max_workers):
+            self.browse(by_key[key]).write({'qr_image': base64.b64encode(png), 'raster_key': key})
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        """Al crear, genera en un solo lote los símbolos QR que no vengan dados"""
+        for vals in vals_list:
+            if vals.get('qr_svg') and 'checksum' not in vals:
+                vals.update(self._get_symbol_vals(vals['qr_svg'], vals.get('border')))
+            if vals.get('qr_svg') and 'qr_preview' not in vals:
+                vals['qr_preview'] = self._get_preview(vals['qr_svg'])
+        records = super(HerbarioQRCode, self).create(vals_list)
+        records.browse([
+            record.id for record, vals in zip(records, vals_list) if not vals.get('qr_svg')
+        ])._render_qr_images()
+        return records
 
     def write(self, vals):
-        """Si cambian parámetros de QR, regenera la imagen"""
+        """Si cambian parámetros de QR, regenera el símbolo; si cambia la resolución, descarta el PNG"""
+        # Imágenes asignadas a mano: ya no corresponden a ninguna clave de renderizado
+        if 'qr_svg' in vals and 'render_key' not in vals:
+            vals = dict(vals, render_key=False)
+        if 'qr_svg' in vals and 'checksum' not in vals:
+            border = vals.get('border') or (self[:1].border if len(self) == 1 else None)
+            vals = dict(vals, **self._get_symbol_vals(vals['qr_svg'], border))
+        if 'qr_svg' in vals and 'qr_preview' not in vals:
+            vals = dict(vals, qr_preview=self._get_preview(vals['qr_svg']))
+        if 'qr_image' in vals and 'raster_key' not in vals:
+            vals = dict(vals, raster_key=False)
+        if 'resolution' in vals:
+            vals = dict(vals, qr_image=False, raster_key=False)
         res = super(HerbarioQRCode, self).write(vals)
-        if any(field in vals for field in ['resolution', 'error_correction', 'box_size', 'border', 'qr_url']):
-            for record in self:
-                record._generate_qr_image()
+        if any(field in vals for field in ['error_correction', 'box_size', 'border', 'qr_url']):
+            self._render_qr_images()
         return res
 
     @api.constrains('status')
     def _check_active_qr(self):
-        """Valida que solo haya un QR activo por espécimen"""
-        for record in self:
-            if record.status == 'active':
-                active_qrs = self.search([
-                    ('specimen_id', '=', record.specimen_id.id),
-                    ('status', '=', 'active'),
-                    ('id', '!=', record.id)
-                ])
-                if active_qrs:
-                    raise ValidationError(
-                        'Ya existe un código QR activo para este espécimen. '
-                        'Desactive el existente antes de activar uno nuevo.'
-                    )
+        """Valida que solo haya un QR activo por espécimen (una consulta para todo el lote)"""
+        active = self.filtered(lambda record: record.status == 'active')
+        if not active:
+            return
+        groups = self._read_group(
+            [('specimen_id', 'in', active.specimen_id.ids), ('status', '=', 'active')],
+            ['specimen_id'], ['__count'],
+        )
+        if any(count > 1 for _specimen, count in groups):
+            raise ValidationError(
+                'Ya existe un código QR activo para este espécimen. '
+                'Desactive el existente antes de activar uno nuevo.'
+            )
 
     # ========== ACCIONES ==========
     def action_download(self):
-        """Descarga la imagen QR e incrementa contador"""
+        """Descarga la imagen QR (PNG a la resolución elegida) e incrementa contador"""
         self.ensure_one()
+        self._ensure_qr_png()
         self.write({
             'download_count': self.download_count + 1,
             'last_downloaded_at': fields.Datetime.now()
@@ -307,6 +417,21 @@ class HerbarioQRCode(models.Model):
             'target': 'self',
         }
 
+    def action_download_svg(self):
+        """Descarga el símbolo QR vectorial e incrementa contador"""
+        self.ensure_one()
+        self.write({
+            'download_count': self.download_count + 1,
+            'last_downloaded_at': fields.Datetime.now()
+        })
+        # /web/content serviría el tipo guardado en el adjunto (text/plain para la mayoría
+        # de usuarios); el controlador lo envía siempre como image/svg+xml
+        return {
+            'type': 'ir.actions.act_url',
+            'url': f'/herbario/qr/{self.id}/svg?download=1',
+            'target': 'self',
+        }
+
     def action_regenerate(self):
         """Regenera el QR y marca el anterior como obsoleto"""
         self.ensure_one()
@@ -320,6 +445,8 @@ class HerbarioQRCode(models.Model):
             'status': 'draft',
             'resolution': self.resolution,
             'error_correction': self.error_correction,
+            'box_size': self.box_size,
+            'border': self.border,
         })
         return {
             'type': 'ir.actions.act_window',
@@ -377,38 +504,41 @@ class HerbarioQRCode(models.Model):
         if not specimen:
             raise ValidationError("No se puede generar un QR sin un espécimen asociado.")
 
-        # Buscar un QR activo existente para este espécimen
-        existing_qr = self.search([
-            ('specimen_id', '=', specimen.id),
-            ('status', '=', 'active')
-        ], limit=1)
-
-        if existing_qr:
-            qr_id = existing_qr.id
-        else:
-            # Si no hay QR activo, crear uno nuevo apuntando al detalle del espécimen
-            base_url = self.env['ir.config_parameter'].sudo().get_param('web.base.url')
-            # Ruta al detalle del espécimen
-            qr_url = f"{base_url}/herbario/specimen/{specimen.id}"
-
-            new_qr = self.create({
-                'specimen_id': specimen.id,
-                'qr_url': qr_url,
-                'status': 'active',  # Lo creamos como activo directamente
-                'resolution': '600',
-                'error_correction': 'H',
-            })
-            qr_id = new_qr.id
+        qr = self._get_or_create_active_qr(specimen)
 
         return {
             'name': 'Código QR del Espécimen',
             'type': 'ir.actions.act_window',
             'res_model': 'herbario.qr.code',
             'view_mode': 'form',
-            'res_id': qr_id,
+            'res_id': qr.id,
             'target': 'current',
         }
 
+    @api.model
+    def _get_or_create_active_qr(self, specimens):
+        """
+        Devuelve el QR activo de cada espécimen, en el mismo orden, creando de una vez
+        los que falten. Los nuevos apuntan al detalle público del espécimen y sus
+        símbolos se renderizan juntos en el pool.
+        """
+        active = self.search([('specimen_id', 'in', specimens.ids), ('status', '=', 'active')])
+        qr_by_specimen = {qr.specimen_id.id: qr.id for qr in active}
+
+        missing = specimens.filtered(lambda specimen: specimen.id not in qr_by_specimen)
+        if missing:
+            base_url = self.env['ir.config_parameter'].sudo().get_param('web.base.url')
+            created = self.with_context(mail_create_nolog=True, mail_create_nosubscribe=True).create([{
+                'specimen_id': specimen.id,
+                'qr_url': f"{base_url}/herbario/specimen/{specimen.id}",
+                'status': 'active',
+                'resolution': '600',
+                'error_correction': 'H',
+            } for specimen in missing])
+            qr_by_specimen.update({qr.specimen_id.id: qr.id for qr in created})
+
+        return self.browse([qr_by_specimen[specimen.id] for specimen in specimens])
+
     # ========== DISPLAY NAME ==========
     def name_get(self):
         """Personaliza el nombre mostrado"""
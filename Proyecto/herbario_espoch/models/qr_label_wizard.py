@@ -0,0 +1,105 @@
+from odoo import models, fields, api
+from odoo.exceptions import UserError, ValidationError
+import base64
+import logging
+
+from ..tools import label_sheet
+
+_logger = logging.getLogger(__name__)
+
+
+class HerbarioQRLabelWizard(models.TransientModel):
+    _name = 'herbario.qr.label.wizard'
+    _description = 'Hojas de Etiquetas QR'
+
+    specimen_ids = fields.Many2many(
+        'herbario.specimen',
+        string='Especímenes',
+        default=lambda self: self._default_specimen_ids()
+    )
+
+    # Rejilla A4
+    columns = fields.Integer(string='Columnas', default=3, required=True)
+    rows = fields.Integer(string='Filas', default=8, required=True)
+    margin_mm = fields.Float(string='Margen (mm)', default=10.0)
+    gap_mm = fields.Float(string='Separación (mm)', default=2.0)
+    show_code = fields.Boolean(string='Mostrar Código', default=True)
+    show_name = fields.Boolean(string='Mostrar Nombre Científico', default=True)
+    cut_marks = fields.Boolean(string='Líneas de Corte', help='Dibuja el contorno de cada etiqueta')
+
+    # Resultado
+    state = fields.Selection([
+        ('draft', 'Borrador'),
+        ('done', 'Completado')
+    ], default='draft')
+    label_count = fields.Integer(string='Etiquetas', readonly=True)
+    page_count = fields.Integer(string='Páginas', readonly=True)
+    created_count = fields.Integer(string='QR Nuevos', readonly=True)
+    label_file = fields.Binary(string='PDF de Etiquetas', attachment=False, readonly=True)
+    label_filename = fields.Char(string='Nombre del PDF')
+
+    @api.model
+    def _default_specimen_ids(self):
+        if self.env.context.get('active_model') == 'herbario.specimen':
+            return [(6, 0, self.env.context.get('active_ids', []))]
+        return []
+
+    @api.constrains('columns', 'rows')
+    def _check_grid(self):
+        for wizard in self:
+            if wizard.columns < 1 or wizard.rows < 1:
+                raise ValidationError('La rejilla necesita al menos una columna y una fila.')
+
+    def action_generate(self):
+        """Crea o reutiliza los QR activos de la selección y compone las hojas A4."""
+        self.ensure_one()
+        if not self.specimen_ids:
+            raise UserError('Seleccione al menos un espécimen.')
+        try:
+            label_sheet.get_cell_size(self.columns, self.rows, self.margin_mm, self.gap_mm)
+        except ValueError as error:
+            raise UserError(str(error))
+
+        QRCode = self.env['herbario.qr.code']
+        # Orden de archivo: por código de herbario, como se guardan los pliegos
+        specimens = self.specimen_ids.sorted(lambda specimen: specimen.codigo_herbario or '')
+        before = QRCode.search_count([('specimen_id', 'in', specimens.ids), ('status', '=', 'active')])
+        qr_codes = QRCode._get_or_create_active_qr(specimens)
+
+        labels = (
+            {
+                'svg': base64.b64decode(qr.qr_svg),
+                'code': qr.specimen_code or '',
+                'name': qr.taxon_name or '',
+            }
+            for qr in qr_codes
+        )
+        pdf = label_sheet.build_label_sheet(
+            labels,
+            columns=self.columns,
+            rows=self.rows,
+            margin_mm=self.margin_mm,
+            gap_mm=self.gap_mm,
+            show_code=self.show_code,
+            show_name=self.show_name,
+            cut_marks=self.cut_marks,
+            title='Etiquetas QR - Herbario ESPOCH',
+        )
+
+        per_page = self.columns * self.rows
+        self.write({
+            'state': 'done',
+            'label_count': len(qr_codes),
+            'page_count': -(-len(qr_codes) // per_page),
+            'created_count': len(qr_codes) - before,
+            'label_file': base64.b64encode(pdf),
+            'label_filename': f'etiquetas_qr_{fields.Date.context_today(self)}.pdf',
+        })
+        _logger.info("Etiquetas QR: %s etiquetas, %s QR nuevos", len(qr_codes), self.created_count)
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
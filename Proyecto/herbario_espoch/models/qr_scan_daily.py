@@ -0,0 +1,193 @@
+from odoo import models, fields, api
+import logging
+
+_logger = logging.getLogger(__name__)
+
+SCAN_ROLLUP_HWM_PARAM = 'herbario.scan_rollup_hwm'
+# Escaneos más recientes que este margen se dejan para la siguiente pasada: un id menor
+# de una transacción aún abierta podría aparecer después de avanzar la marca
+SCAN_ROLLUP_LAG_SECONDS = 60
+
+# Clase de dispositivo deducida del User-Agent; el orden importa (un iPad dice "Mobile")
+DEVICE_CLASS_SQL = """
+    CASE
+        WHEN log.user_agent IS NULL OR log.user_agent = '' THEN 'unknown'
+        WHEN log.user_agent ~* '(bot|crawl|spider|slurp|preview|curl|wget|python-requests)' THEN 'bot'
+        WHEN log.user_agent ~* '(ipad|tablet|kindle|silk|playbook)'
+             OR (log.user_agent ~* 'android' AND log.user_agent !~* 'mobile') THEN 'tablet'
+        WHEN log.user_agent ~* '(mobi|iphone|ipod|android|blackberry|opera mini|iemobile)' THEN 'mobile'
+        ELSE 'desktop'
+    END
+"""
+
+
+class HerbarioQRScanDaily(models.Model):
+    """
+    Resumen diario de escaneos por QR y clase de dispositivo.
+
+    Lo mantiene el cron a partir de herbario.qr.scan.log: cada pasada suma los escaneos
+    con id posterior a la marca de agua (herbario.scan_rollup_hwm) mediante un
+    INSERT ... ON CONFLICT, así los tableros leen filas ya agregadas en lugar del log.
+    """
+    _name = 'herbario.qr.scan.daily'
+    _description = 'Resumen Diario de Escaneos QR'
+    _order = 'day desc, scan_count desc'
+
+    day = fields.Date(string='Día', required=True, readonly=True, index=True)
+    qr_code_id = fields.Many2one(
+        'herbario.qr.code',
+        string='Código QR',
+        required=True,
+        readonly=True,
+        ondelete='cascade',
+        index=True
+    )
+    specimen_id = fields.Many2one('herbario.specimen', string='Espécimen', readonly=True, index=True)
+    taxon_id = fields.Many2one('herbario.taxon', string='Taxón', readonly=True, index=True)
+    device_class = fields.Selection([
+        ('mobile', 'Móvil'),
+        ('tablet', 'Tableta'),
+        ('desktop', 'Escritorio'),
+        ('bot', 'Robot'),
+        ('unknown', 'Desconocido')
+    ], string='Dispositivo', required=True, readonly=True)
+    scan_count = fields.Integer(string='Escaneos', readonly=True, group_operator='sum')
+
+    _sql_constraints = [
+        ('unique_day_qr_device',
+         'UNIQUE(day, qr_code_id, device_class)',
+         'Ya existe un resumen para este día, código QR y dispositivo.')
+    ]
+
+    @api.model
+    def _get_rollup_timezone(self):
+        """Zona horaria con la que se corta el día (por defecto la de Ecuador continental)."""
+        ICP = self.env['ir.config_parameter'].sudo()
+        return ICP.get_param('herbario.scan_rollup_tz', 'America/Guayaquil')
+
+    @api.model
+    def _rollup_scans(self, batch_size=None):
+        """
+        Suma al resumen los escaneos con id en (marca de agua, límite] y avanza la marca en
+        la misma transacción. Procesa como mucho ``batch_size`` ids por llamada.
+        Devuelve el número de escaneos agregados.
+        """
+        ICP = self.env['ir.config_parameter'].sudo()
+        batch_size = batch_size or int(ICP.get_param('herbario.scan_rollup_batch_size', 50000))
+        low = int(ICP.get_param(SCAN_ROLLUP_HWM_PARAM, 0))
+
+        self.env['herbario.qr.scan.log'].flush_model()
+        # El lote termina antes del primer escaneo dentro del margen: la marca nunca salta
+        # por encima de un id que aún no se ha agregado
+        self.env.cr.execute("""
+            WITH settled AS (
+                SELECT COALESCE(MIN(id), 2147483647) AS first_recent FROM herbario_qr_scan_log
+                WHERE id > %(low)s
+                  AND create_date >= (NOW() AT TIME ZONE 'UTC') - make_interval(secs => %(lag)s)
+            )
+            SELECT MAX(id), COUNT(*) FROM (
+                SELECT id FROM herbario_qr_scan_log, settled
+                WHERE id > %(low)s AND id < settled.first_recent
+                ORDER BY id
+                LIMIT %(limit)s
+            ) pending
+        """, {'low': low, 'lag': SCAN_ROLLUP_LAG_SECONDS, 'limit': batch_size})
+        high, count = self.env.cr.fetchone()
+        if not high:
+            return 0
+
+        self.env.cr.execute(f"""
+            INSERT INTO herbario_qr_scan_daily AS daily
+                (day, qr_code_id, specimen_id, taxon_id, device_class, scan_count,
+                 create_uid, create_date, write_uid, write_date)
+            SELECT (log.scanned_at AT TIME ZONE 'UTC' AT TIME ZONE %(tz)s)::date,
+                   log.qr_code_id, qr.specimen_id, qr.taxon_id,
+                   {DEVICE_CLASS_SQL},
+                   COUNT(*),
+                   %(uid)s, NOW() AT TIME ZONE 'UTC', %(uid)s, NOW() AT TIME ZONE 'UTC'
+            FROM herbario_qr_scan_log log
+            JOIN herbario_qr_code qr ON qr.id = log.qr_code_id
+            WHERE log.id > %(low)s AND log.id <= %(high)s
+            GROUP BY 1, 2, 3, 4, 5
+            ON CONFLICT (day, qr_code_id, device_class) DO UPDATE
+                SET scan_count = daily.scan_count + EXCLUDED.scan_count,
+                    specimen_id = EXCLUDED.specimen_id,
+                    taxon_id = EXCLUDED.taxon_id,
+                    write_uid = EXCLUDED.write_uid,
+                    write_date = EXCLUDED.write_date
+        """, {
+            'tz': self._get_rollup_timezone(),
+            'uid': self.env.uid,
+            'low': low,
+            'high': high,
+        })
+        ICP.set_param(SCAN_ROLLUP_HWM_PARAM, high)
+        self.invalidate_model()
+        _logger.info("Resumen de escaneos QR: %s escaneos agregados (ids %s-%s)", count, low + 1, high)
+        return count
+
+    @api.model
+    def _cron_rollup_scans(self):
+        """Cron: agrega un lote de escaneos y se vuelve a disparar si quedan pendientes."""
+        ICP = self.env['ir.config_parameter'].sudo()
+        batch_size = int(ICP.get_param('herbario.scan_rollup_batch_size', 50000))
+        if self._rollup_scans(batch_size) >= batch_size:
+            cron = self.env.ref('herbario_espoch.ir_cron_herbario_scan_rollup', raise_if_not_found=False)
+            if cron:
+                cron.sudo()._trigger()
+
+    @api.model
+    def _rebuild_rollup(self):
+        """Vacía el resumen y lo recalcula desde el primer escaneo (p. ej. al cambiar la zona horaria)."""
+        self.env.cr.execute("TRUNCATE herbario_qr_scan_daily")
+        self.env['ir.config_parameter'].sudo().set_param(SCAN_ROLLUP_HWM_PARAM, 0)
+        self.invalidate_model()
+        total = 0
+        while True:
+            count = self._rollup_scans()
+            if not count:
+                return total
+            total += count
+
+    # ========== CONSULTAS PARA TABLEROS ==========
+    @api.model
+    def _get_scan_stats(self, date_from=None, date_to=None, group_by='day', limit=None, domain=None):
+        """
+        Escaneos agregados leídos del resumen. ``group_by``: day, week, month, taxon,
+        specimen o device_class. Las agrupaciones por taxón o espécimen se ordenan de
+        mayor a menor (para "los más escaneados"); las temporales, por fecha.
+        Devuelve [{'key', 'label', 'scans'}].
+        """
+        domain = list(domain or [])
+        # to_date lanza ValueError con fechas mal formadas antes de llegar a la consulta
+        if date_from:
+            domain.append(('day', '>=', fields.Date.to_date(date_from)))
+        if date_to:
+            domain.append(('day', '<=', fields.Date.to_date(date_to)))
+
+        groupby = {
+            'day': 'day:day',
+            'week': 'day:week',
+            'month': 'day:month',
+            'taxon': 'taxon_id',
+            'specimen': 'specimen_id',
+            'device_class': 'device_class',
+        }.get(group_by)
+        if not groupby:
+            raise ValueError(f'Agrupación no soportada: {group_by}')
+
+        temporal = groupby.startswith('day:')
+        order = f'{groupby} asc' if temporal else 'scan_count:sum desc'
+        groups = self._read_group(domain, [groupby], ['scan_count:sum'], order=order, limit=limit)
+
+        labels = dict(self._fields['device_class'].selection)
+        result = []
+        for value, scans in groups:
+            if temporal:
+                key = label = fields.Date.to_string(value)
+            elif group_by == 'device_class':
+                key, label = value, labels.get(value, value)
+            else:
+                key, label = value.id, value.display_name
+            result.append({'key': key, 'label': label, 'scans': scans})
+        return result
@@ -0,0 +1,247 @@
+from odoo import models, fields, api
+from odoo.exceptions import UserError
+from odoo.tools import split_every
+from odoo.tools.pdf import merge_pdf
+from functools import partial
+import logging
+
+from ..tools import worker_pool
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_REPORT_XMLID = 'herbario_espoch.action_report_herbario_specimen'
+PART_PREFIX = 'parte-'
+
+
+def _render_part(registry, uid, context, job_id, item):
+    """
+    Hilo trabajador: renderiza un bloque y confirma su parte en un cursor propio, así el
+    progreso es visible y la parte sobrevive a un fallo posterior del trabajo.
+    Solo recibe datos planos: el entorno del hilo principal no se comparte.
+    """
+    index, specimen_ids = item
+    with registry.cursor() as cr:
+        job = api.Environment(cr, uid, context)['herbario.report.job'].browse(job_id)
+        pdf = job._render_chunk(specimen_ids)
+        job._store_part(index, pdf)
+    return index, pdf
+
+
+class HerbarioReportJob(models.Model):
+    """
+    Trabajo de reporte PDF en segundo plano.
+
+    Los especímenes se reparten en bloques de ``chunk_size``; cada bloque se renderiza por
+    separado (varios a la vez, en hilos con su propio cursor) y se guarda como adjunto
+    "parte-NNNNN.pdf" en cuanto termina, lo que da el progreso y permite reanudar un
+    trabajo fallido sin repetir los bloques hechos. Al final las partes se unen en un
+    solo PDF descargable.
+    """
+    _name = 'herbario.report.job'
+    _description = 'Trabajo de Reporte PDF'
+    _order = 'create_date desc, id desc'
+
+    name = fields.Char(string='Nombre', required=True, default='Fichas de Especímenes')
+    report_id = fields.Many2one(
+        'ir.actions.report',
+        string='Reporte',
+        required=True,
+        domain=[('model', '=', 'herbario.specimen'), ('report_type', '=', 'qweb-pdf')],
+        default=lambda self: self.env.ref(DEFAULT_REPORT_XMLID, raise_if_not_found=False)
+    )
+    specimen_ids = fields.Many2many(
+        'herbario.specimen',
+        'herbario_report_job_specimen_rel',
+        'job_id',
+        'specimen_id',
+        string='Especímenes'
+    )
+    specimen_count = fields.Integer(string='Especímenes', compute='_compute_specimen_count')
+    chunk_size = fields.Integer(
+        string='Especímenes por Bloque',
+        default=lambda self: int(self.env['ir.config_parameter'].sudo().get_param('herbario.report_chunk_size', 50))
+    )
+    state = fields.Selection([
+        ('queued', 'En Cola'),
+        ('running', 'Generando'),
+        ('done', 'Listo'),
+        ('failed', 'Fallido')
+    ], string='Estado', default='queued', required=True, readonly=True, index=True)
+    chunk_count = fields.Integer(string='Bloques', readonly=True)
+    done_chunks = fields.Integer(string='Bloques Listos', compute='_compute_progress')
+    progress = fields.Float(string='Progreso', compute='_compute_progress')
+    attachment_id = fields.Many2one('ir.attachment', string='PDF', readonly=True, ondelete='set null')
+    error = fields.Text(string='Error', readonly=True)
+    user_id = fields.Many2one('res.users', string='Solicitado Por', default=lambda self: self.env.user, readonly=True)
+    started_at = fields.Datetime(string='Inicio', readonly=True)
+    finished_at = fields.Datetime(string='Fin', readonly=True)
+
+    @api.depends('specimen_ids')
+    def _compute_specimen_count(self):
+        for job in self:
+            job.specimen_count = len(job.specimen_ids)
+
+    def _compute_progress(self):
+        # Las partes se confirman desde los hilos: contarlas da el progreso real
+        groups = self.env['ir.attachment'].sudo()._read_group(
+            [('res_model', '=', self._name), ('res_id', 'in', self.ids), ('name', '=like', f'{PART_PREFIX}%')],
+            ['res_id'], ['__count'],
+        ) if self.ids else []
+        parts = dict(groups)
+        for job in self:
+            if job.state == 'done':
+                job.done_chunks = job.chunk_count
+                job.progress = 100.0
+                continue
+            job.done_chunks = parts.get(job.id, 0)
+            job.progress = 100.0 * job.done_chunks / job.chunk_count if job.chunk_count else 0.0
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        jobs = super().create(vals_list)
+        jobs._trigger_report_jobs()
+        return jobs
+
+    @api.model
+    def _create_for_specimens(self, specimens):
+        """Encola un trabajo con la selección y devuelve la acción para seguir su progreso."""
+        if not specimens:
+            raise UserError('Seleccione al menos un espécimen.')
+        job = self.create({'specimen_ids': [(6, 0, specimens.ids)]})
+        if not job.report_id:
+            raise UserError('No hay un reporte PDF de especímenes instalado; elija uno en el trabajo.')
+        return {
+            'name': 'Reporte en Segundo Plano',
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': job.id,
+            'view_mode': 'form',
+            'target': 'current',
+        }
+
+    def _trigger_report_jobs(self):
+        cron = self.env.ref('herbario_espoch.ir_cron_herbario_report_jobs', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger()
+
+    # ========== RENDERIZADO ==========
+    def _get_chunks(self):
+        """Bloques de ids en el orden de los especímenes (el del PDF final)."""
+        self.ensure_one()
+        return [list(ids) for ids in split_every(max(1, self.chunk_size), self.specimen_ids.sorted().ids)]
+
+    def _get_parts(self):
+        """Partes ya confirmadas: {índice: adjunto}."""
+        self.ensure_one()
+        attachments = self.env['ir.attachment'].sudo().search([
+            ('res_model', '=', self._name), ('res_id', '=', self.id), ('name', '=like', f'{PART_PREFIX}%'),
+        ])
+        return {int(attachment.name[len(PART_PREFIX):-4]): attachment for attachment in attachments}
+
+    def _render_chunk(self, specimen_ids):
+        """Renderiza un bloque con el reporte del trabajo. Punto a sustituir en las pruebas."""
+        self.ensure_one()
+        pdf, _format = self.env['ir.actions.report']._render_qweb_pdf(self.report_id.report_name, specimen_ids)
+        return pdf
+
+    def _store_part(self, index, pdf):
+        self.env['ir.attachment'].sudo().create({
+            'name': f'{PART_PREFIX}{index:05d}.pdf',
+            'res_model': self._name,
+            'res_id': self.id,
+            'type': 'binary',
+            'raw': pdf,
+            'mimetype': 'application/pdf',
+        })
+
+    def _get_report_worker_count(self):
+        ICP = self.env['ir.config_parameter'].sudo()
+        return int(ICP.get_param('herbario.report_worker_count', 2))
+
+    def _write_committed(self, vals):
+        """
+        Escribe ``vals`` en un cursor propio y lo confirma en el acto. La transacción del
+        cron dura todo el trabajo: sin esto, las demás sesiones verían el trabajo en cola
+        y sin bloques (progreso 0 %) aunque los hilos ya hayan confirmado sus partes.
+        Todas las escrituras del trabajo durante el cron pasan por aquí: si la transacción
+        del cron escribiera después la misma fila, chocaría con este cambio confirmado.
+        """
+        self.flush_recordset()
+        with self.pool.cursor() as cr:
+            self.with_env(self.env(cr=cr)).write(vals)
+        self.invalidate_recordset(list(vals))
+
+    def _run(self):
+        """Renderiza los bloques que falten, une las partes y publica el PDF."""
+        self.ensure_one()
+        chunks = self._get_chunks()
+        self._write_committed({
+            'state': 'running',
+            'chunk_count': len(chunks),
+            'started_at': fields.Datetime.now(),
+            'error': False,
+        })
+        stored = self._get_parts()
+        pdfs = {index: attachment.raw for index, attachment in stored.items() if index < len(chunks)}
+        missing = [(index, ids) for index, ids in enumerate(chunks) if index not in pdfs]
+
+        job = self.with_user(self.user_id or self.env.user)
+        render = partial(_render_part, self.pool, job.env.uid, dict(job.env.context), self.id)
+        pdfs.update(worker_pool.map_in_threads(render, missing, max_workers=self._get_report_worker_count()))
+
+        merged = merge_pdf([pdfs[index] for index in range(len(chunks))]) if len(chunks) > 1 else pdfs[0]
+        # El PDF, el borrado de las partes y el estado se confirman juntos en un cursor propio,
+        # como el encabezado: la transacción del cron nunca escribe la fila del trabajo
+        with self.pool.cursor() as cr:
+            self.with_env(self.env(cr=cr))._publish(merged)
+        self.invalidate_recordset()
+        _logger.info("Reporte %s: %s especímenes en %s bloques", self.id, len(self.specimen_ids), len(chunks))
+
+    def _publish(self, merged):
+        """Guarda el PDF unido, elimina las partes y marca el trabajo como listo."""
+        self.ensure_one()
+        attachment = self.env['ir.attachment'].sudo().create({
+            'name': f'{self.name}.pdf',
+            'res_model': self._name,
+            'res_id': self.id,
+            'type': 'binary',
+            'raw': merged,
+            'mimetype': 'application/pdf',
+        })
+        self.env['ir.attachment'].sudo().browse([a.id for a in self._get_parts().values()]).unlink()
+        self.write({'state': 'done', 'attachment_id': attachment.id, 'finished_at': fields.Datetime.now()})
+
+    @api.model
+    def _cron_process_report_jobs(self):
+        """Cron: atiende el trabajo en cola más antiguo; se vuelve a disparar si quedan más."""
+        job = self.search([('state', '=', 'queued')], order='id asc', limit=1)
+        if not job:
+            return
+        if not job.specimen_ids or not job.report_id:
+            job._write_committed({'state': 'failed', 'error': 'El trabajo no tiene especímenes o reporte.'})
+        else:
+            try:
+                with self.env.cr.savepoint():
+                    job._run()
+            except Exception as error:
+                _logger.exception("Reporte %s: error al generar el PDF", job.id)
+                # Las partes confirmadas se conservan: reintentar solo renderiza las que falten
+                job._write_committed({'state': 'failed', 'error': str(error), 'finished_at': fields.Datetime.now()})
+        if self.search_count([('state', '=', 'queued')]):
+            self._trigger_report_jobs()
+
+    # ========== ACCIONES ==========
+    def action_download(self):
+        self.ensure_one()
+        if not self.attachment_id:
+            raise UserError('El PDF todavía no está listo.')
+        return {
+            'type': 'ir.actions.act_url',
+            'url': f'/web/content/{self.attachment_id.id}?download=true',
+            'target': 'self',
+        }
+
+    def action_retry(self):
+        """Vuelve a encolar trabajos fallidos; los bloques ya generados no se repiten."""
+        self.filtered(lambda job: job.state == 'failed').write({'state': 'queued', 'error': False})
+        self._trigger_report_jobs()
@@ -238,6 +238,11 @@ class SpecimenRegistry(models.Model):
         string='Imagen Principal',
         compute='_compute_primary_image'
     )
+    primary_image_url = fields.Char(
+        string='Miniatura Principal',
+        compute='_compute_primary_image_url',
+        help='URL de la miniatura de la imagen principal para listas (carga perezosa)'
+    )
     primary_location = fields.Char(
         string='Ubicación Principal',
         compute='_compute_primary_location'
@@ -301,21 +306,25 @@ class SpecimenRegistry(models.Model):
         for record in self:
             record.total_ubicaciones = len(record.collection_site_ids)
     
-    @api.depends('taxon_id', 'taxon_id.image_ids', 'taxon_id.image_ids.is_primary')
+    def _get_primary_image_record(self):
+        """Imagen principal del taxón o, si no hay ninguna marcada, la primera de la lista."""
+        self.ensure_one()
+        # El taxón guarda el puntero: no hace falta recorrer todas sus imágenes
+        return self.taxon_id.primary_image_id
+
+    @api.depends('taxon_id.primary_image_id')
     def _compute_primary_image(self):
         """Obtiene la imagen principal directamente desde el taxón."""
         for record in self:
-            primary_img_record = self.env['herbario.image'] # Iniciar un recordset vacío
-            if record.taxon_id and record.taxon_id.image_ids:
-                # 1. Buscar la imagen marcada como principal
-                primary_img_record = record.taxon_id.image_ids.filtered(lambda img: img.is_primary)[:1] # CORRECCIÓN: Tomar solo el primer resultado
-                # 2. Si no hay principal, tomar la primera de la lista
-                if not primary_img_record:
-                    primary_img_record = record.taxon_id.image_ids[:1]
-            
+            primary_img_record = record._get_primary_image_record()
             # Asignar el campo binario de forma segura
             record.primary_image = primary_img_record.image_data if primary_img_record else False
 
+    @api.depends('taxon_id.primary_image_id', 'taxon_id.primary_image_id.thumbnail_url')
+    def _compute_primary_image_url(self):
+        for record in self:
+            record.primary_image_url = record._get_primary_image_record().thumbnail_url or False
+
     @api.onchange('taxon_name_new')
     def _onchange_taxon_name_new(self):
         """
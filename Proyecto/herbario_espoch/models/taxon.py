@@ -105,6 +105,15 @@ class HerbarioTaxon(models.Model):
         auto_join=True,
         ondelete='cascade'
     )
+    # Puntero almacenado: el ORM lo recalcula una vez por taxón al crear, marcar o borrar imágenes
+    primary_image_id = fields.Many2one(
+        'herbario.image',
+        string='Imagen Principal',
+        compute='_compute_primary_image_id',
+        store=True,
+        index='btree_not_null',
+        help='Imagen marcada como principal o, si no hay ninguna, la primera de la galería'
+    )
     qr_code_ids = fields.One2many(
         'herbario.qr.code',
         'taxon_id',
@@ -146,6 +155,12 @@ class HerbarioTaxon(models.Model):
         for record in self:
             record.total_specimens = len(record.specimen_ids)
 
+    @api.depends('image_ids.is_primary', 'image_ids.deleted_at', 'image_ids.display_order')
+    def _compute_primary_image_id(self):
+        for record in self:
+            images = record.image_ids.filtered(lambda img: not img.deleted_at)
+            record.primary_image_id = images.filtered('is_primary')[:1] or images[:1]
+
     @api.depends('image_ids')
     def _compute_total_images(self):
         for record in self:
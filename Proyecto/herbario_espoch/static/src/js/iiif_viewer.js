@@ -0,0 +1,84 @@
+/** @odoo-module **/
+
+import publicWidget from "@web/legacy/js/public/public_widget";
+import { loadJS } from "@web/core/assets";
+
+const OPENSEADRAGON_URL = 'https://cdn.jsdelivr.net/npm/openseadragon@4.1.1/build/openseadragon/';
+
+/**
+ * Visor de zoom profundo para la página de detalle del espécimen.
+ * OpenSeadragon lee el info.json IIIF de la imagen y solo pide las teselas visibles
+ * al nivel de zoom actual, en lugar de descargar el original completo.
+ */
+publicWidget.registry.HerbarioIIIFViewer = publicWidget.Widget.extend({
+    selector: '.herbario-specimen-media',
+    events: {
+        'click .herbario-iiif-toggle': '_onToggleViewer',
+        'click .specimen-thumbnail': '_onThumbnailClick',
+    },
+
+    start: function () {
+        this.viewer = null;
+        this.$viewer = this.$('#herbario_iiif_viewer');
+        this.$image = this.$('#main_specimen_image');
+        this.infoUrl = this.$viewer.data('info-url');
+        return this._super.apply(this, arguments);
+    },
+
+    destroy: function () {
+        if (this.viewer) {
+            this.viewer.destroy();
+            this.viewer = null;
+        }
+        this._super.apply(this, arguments);
+    },
+
+    _ensureLibrary: function () {
+        if (typeof OpenSeadragon !== 'undefined') {
+            return Promise.resolve();
+        }
+        return loadJS(OPENSEADRAGON_URL + 'openseadragon.min.js');
+    },
+
+    _openViewer: function () {
+        return this._ensureLibrary().then(() => {
+            this.$image.addClass('d-none');
+            this.$viewer.removeClass('d-none');
+            if (!this.viewer) {
+                this.viewer = OpenSeadragon({
+                    element: this.$viewer[0],
+                    prefixUrl: OPENSEADRAGON_URL + 'images/',
+                    tileSources: this.infoUrl,
+                    showNavigator: true,
+                    maxZoomPixelRatio: 2,
+                });
+            } else {
+                this.viewer.open(this.infoUrl);
+            }
+        }).catch((error) => {
+            console.error('✗ Error cargando OpenSeadragon:', error);
+        });
+    },
+
+    _closeViewer: function () {
+        this.$viewer.addClass('d-none');
+        this.$image.removeClass('d-none');
+    },
+
+    _onToggleViewer: function (ev) {
+        ev.preventDefault();
+        if (this.$viewer.hasClass('d-none')) {
+            this._openViewer();
+        } else {
+            this._closeViewer();
+        }
+    },
+
+    _onThumbnailClick: function (ev) {
+        // La miniatura también cambia la imagen que muestra el visor
+        this.infoUrl = $(ev.currentTarget).data('iiif-info');
+        if (this.viewer && !this.$viewer.hasClass('d-none')) {
+            this.viewer.open(this.infoUrl);
+        }
+    },
+});
@@ -272,6 +272,15 @@ publicWidget.registry.HerbarioRepository = publicWidget.Widget.extend({
             this._renderCards(this.currentSpecimens);
         }
     },
+    /**
+     * Estilo en línea con el marcador LQIP (data URI de 16 px) que devuelve la API:
+     * la tarjeta se pinta al instante y la imagen real carga de forma diferida.
+     * @param {Object} specimen - Objeto de espécimen de la API.
+     * @private
+     */
+    _placeholderStyle: function (specimen) {
+        return specimen.placeholder ? `background-image: url('${specimen.placeholder}');` : '';
+    },
     /**
      * Renderiza los especímenes en formato de tarjetas.
      * @param {Array} specimens - Array de objetos de especímenes.
@@ -284,7 +293,7 @@ publicWidget.registry.HerbarioRepository = publicWidget.Widget.extend({
             html += `
             <div class="col-lg-3 col-md-4 col-sm-6 mb-4">
                 <div class="card h-100 shadow-sm herbario-card">
-                    <img src="${s.image || '/herbario_espoch/static/description/default_specimen2.jpg'}" class="card-img-top" style="height: 200px; object-fit: cover;"/>
+                    <img src="${s.image || '/herbario_espoch/static/description/default_specimen2.jpg'}" class="card-img-top herbario-lqip" loading="lazy" style="height: 200px; object-fit: cover; ${this._placeholderStyle(s)}"/>
                     <div class="card-body">
                         <h6 class="card-title font-italic" style="min-height: 40px;">${s.taxon || 'N/A'}</h6>
                         <p class="small text-muted mb-2">
@@ -331,7 +340,7 @@ publicWidget.registry.HerbarioRepository = publicWidget.Widget.extend({
         specimens.forEach(s => {
             html += `<tr>
                 <td class="text-center p-1">
-                    <img src="${s.image || '/herbario_espoch/static/description/default_specimen2.jpg'}" style="width: 60px; height: 60px; object-fit: cover;" class="rounded"/>
+                    <img src="${s.image || '/herbario_espoch/static/description/default_specimen2.jpg'}" loading="lazy" style="width: 60px; height: 60px; object-fit: cover; ${this._placeholderStyle(s)}" class="rounded herbario-lqip"/>
                 </td>
                 <td>${s.card_number || ''}</td>
                 <td>${s.index || ''}</td>
@@ -0,0 +1,109 @@
+/** @odoo-module **/
+
+import publicWidget from "@web/legacy/js/public/public_widget";
+import { jsonrpc } from "@web/core/network/rpc_service";
+
+/**
+ * Galería de miniaturas del detalle del espécimen.
+ * La primera página llega renderizada desde el servidor; las siguientes se piden a
+ * /herbario/api/gallery cuando el marcador del final entra en pantalla (scroll infinito).
+ * Cada miniatura se pinta con su marcador LQIP hasta que carga el derivado de 160 px.
+ */
+publicWidget.registry.HerbarioSpecimenGallery = publicWidget.Widget.extend({
+    selector: '.herbario-gallery',
+    events: {
+        'click .specimen-thumbnail': '_onThumbnailClick',
+    },
+
+    start: function () {
+        this.specimenId = this.$el.data('specimen-id');
+        this.pageSize = this.$el.data('page-size') || 12;
+        this.nextOffset = this.$el.data('next-offset');
+        this.loading = false;
+        this.$items = this.$('.herbario-gallery-items');
+        this.$sentinel = this.$('.herbario-gallery-sentinel');
+
+        if (this.nextOffset !== '' && this.nextOffset !== undefined) {
+            if ('IntersectionObserver' in window) {
+                this.observer = new IntersectionObserver((entries) => {
+                    if (entries.some((entry) => entry.isIntersecting)) {
+                        this._loadNextPage();
+                    }
+                }, { rootMargin: '200px' });
+                this.observer.observe(this.$sentinel[0]);
+            } else {
+                // Navegadores sin IntersectionObserver: se carga todo al pulsar el marcador
+                this.$sentinel.on('click', () => this._loadNextPage());
+            }
+        }
+        return this._super.apply(this, arguments);
+    },
+
+    destroy: function () {
+        if (this.observer) {
+            this.observer.disconnect();
+            this.observer = null;
+        }
+        this._super.apply(this, arguments);
+    },
+
+    _loadNextPage: function () {
+        if (this.loading || this.nextOffset === false || this.nextOffset === '') {
+            return;
+        }
+        this.loading = true;
+        return jsonrpc('/herbario/api/gallery', {
+            specimen_id: this.specimenId,
+            offset: this.nextOffset,
+            limit: this.pageSize,
+        }).then((result) => {
+            result.images.forEach((image) => this.$items.append(this._renderThumbnail(image)));
+            this.nextOffset = result.next_offset;
+            if (this.nextOffset === false) {
+                this._finish();
+            }
+        }).catch((error) => {
+            console.error('✗ Error cargando la galería:', error);
+            this._finish();
+        }).finally(() => {
+            this.loading = false;
+        });
+    },
+
+    _finish: function () {
+        if (this.observer) {
+            this.observer.disconnect();
+            this.observer = null;
+        }
+        this.$sentinel.addClass('d-none');
+    },
+
+    _renderThumbnail: function (image) {
+        const col = document.createElement('div');
+        col.className = 'col-3 mb-3';
+        const img = document.createElement('img');
+        img.className = 'img-fluid img-thumbnail specimen-thumbnail herbario-lqip';
+        img.loading = 'lazy';
+        img.src = image.thumbnail_url;
+        img.alt = image.description || 'Imagen';
+        if (image.width && image.height) {
+            img.width = image.width;
+            img.height = image.height;
+        }
+        img.dataset.fullSrc = image.full_url;
+        img.dataset.iiifInfo = image.iiif_info_url;
+        img.style.cssText = 'cursor: pointer; height: 80px; width: 100%; object-fit: cover;';
+        if (image.placeholder) {
+            img.style.backgroundImage = `url('${image.placeholder}')`;
+        }
+        col.appendChild(img);
+        return col;
+    },
+
+    _onThumbnailClick: function (ev) {
+        const $thumb = $(ev.currentTarget);
+        $('#main_specimen_image')
+            .css('background-image', $thumb.css('background-image'))
+            .attr('src', $thumb.data('full-src'));
+    },
+});
@@ -3,3 +3,12 @@
 #from . import test_modulo_instalado
 from . import test_users
 from . import test_specimen
+from . import test_image
+
+from . import test_iiif
+from . import test_derivative_cache
+from . import test_image_bulk_ingest
+from . import test_qr_code
+from . import test_qr_scan_daily
+from . import test_report_job
+from . import test_coordinates
\ No newline at end of file
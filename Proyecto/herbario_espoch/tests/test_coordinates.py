@@ -0,0 +1,366 @@
+import math
+from unittest.mock import patch
+
+from odoo.tests import tagged
+
+from ..tools import coordinates, utm
+from .common import HerbarioTestCase
+
+
+@tagged('post_install', '-at_install', 'herbario')
+class TestCoordinates(HerbarioTestCase):
+    """Tests para el parseo y la normalización de coordenadas"""
+
+    def test_01_parse_formats(self):
+        """Test: Un mismo lote admite decimal, DMS, DDM y coma decimal"""
+        latitudes, longitudes = coordinates.parse_pairs([
+            '01.34S 78.40W',
+            '1,34S 78,40W',
+            '1°20\'24"S 78°24\'00"W',
+            '1°20.4\'S 78°24\'W',
+            '-1,34 -78,40',
+            '78.40W 1.34S',
+            'texto libre',
+            '95N 10E',
+        ])
+        for lat, lon in zip(latitudes[:6], longitudes[:6]):
+            self.assertAlmostEqual(lat, -1.34)
+            self.assertAlmostEqual(lon, -78.40)
+        self.assertTrue(math.isnan(latitudes[6]) and math.isnan(longitudes[6]))
+        self.assertTrue(math.isnan(latitudes[7]), "Latitud fuera de rango")
+
+        values = coordinates.parse_values(['-1,34', '1°20\'24"S', '78W'], 'lat')
+        self.assertAlmostEqual(values[0], -1.34)
+        self.assertAlmostEqual(values[1], -1.34)
+        self.assertTrue(math.isnan(values[2]), "Hemisferio de longitud en una latitud")
+
+        print("✅ Test 1 PASÓ: Formatos de coordenadas")
+
+    def test_02_create_parses_text(self):
+        """Test: Crear coordenadas con texto calcula latitud y longitud"""
+        points = self.env['herbario.coordinates'].create([
+            {'coordenadas_zona': '1°40\'30"S 78°39\'0"W'},
+            {'coordenadas_zona': '0,5N 77,25W'},
+            {'coordenadas_zona': 'sin datos'},
+        ])
+        self.assertAlmostEqual(points[0].latitude, -1.675)
+        self.assertAlmostEqual(points[0].longitude, -78.65)
+        self.assertAlmostEqual(points[1].latitude, 0.5)
+        self.assertAlmostEqual(points[1].longitude, -77.25)
+        self.assertFalse(points[2].latitude)
+
+        points[2].write({'coordenadas_zona': '2.1S 79.9W'})
+        self.assertAlmostEqual(points[2].latitude, -2.1)
+
+        print("✅ Test 2 PASÓ: Texto convertido al guardar")
+
+    def test_03_bulk_normalization(self):
+        """Test: La normalización masiva recalcula latitud, longitud y la URL del mapa"""
+        points = self.env['herbario.coordinates'].create([
+            {'latitude': 0.0, 'longitude': 0.0} for _index in range(3)
+        ])
+        points.flush_recordset()
+        # Textos heredados escritos sin pasar por el ORM, como en una importación antigua
+        self.env.cr.execute("""
+            UPDATE herbario_coordinates SET coordenadas_zona = v.text
+            FROM unnest(%s::int[], %s::varchar[]) AS v(id, text)
+            WHERE herbario_coordinates.id = v.id
+        """, (points.ids, ['1°20\'24"S 78°24\'W', '-0,25 -77,5', 'ilegible']))
+        points.invalidate_recordset()
+
+        updated, invalid = self.env['herbario.coordinates']._normalize_coordinates(batch_size=2)
+
+        self.assertGreaterEqual(updated, 2)
+        self.assertGreaterEqual(invalid, 1)
+        self.assertAlmostEqual(points[0].latitude, -1.34)
+        self.assertAlmostEqual(points[1].longitude, -77.5)
+        self.assertIn('-0.25', points[1].maps_url)
+        self.assertFalse(points[2].latitude)
+
+        print("✅ Test 3 PASÓ: Normalización masiva de coordenadas")
+
+    def test_04_utm_conversion(self):
+        """Test: UTM de las zonas 17S y 18S convertido a latitud/longitud y de vuelta"""
+        latitudes, longitudes = utm.parse_to_latlon([
+            '17S 775495 9974571',
+            'Zona 18S E: 180500 N: 9975000',
+            '17 S 775495,2E 9974570,8N',
+            '17S 775495',
+        ])
+        # Quito, en la zona 17 sur
+        self.assertAlmostEqual(latitudes[0], -0.22985, places=4)
+        self.assertAlmostEqual(longitudes[0], -78.52495, places=4)
+        self.assertTrue(-81 < longitudes[1] < -75, "La zona 18 queda al este de la 17")
+        self.assertAlmostEqual(latitudes[2], latitudes[0], places=5)
+        self.assertTrue(math.isnan(latitudes[3]), "Falta el norte")
+
+        # Ida y vuelta con error por debajo del centímetro
+        zone, south, easting, northing = utm.from_latlon(latitudes[:2], longitudes[:2])
+        back_lat, back_lon = utm.to_latlon(zone, south, easting, northing)
+        self.assertLess(abs(back_lat - latitudes[:2]).max() * 111000, 0.01)
+        self.assertLess(abs(back_lon - longitudes[:2]).max() * 111000, 0.01)
+        self.assertEqual(utm.format_many([-0.22985], [-78.52495]), ['17S 775495 9974571'])
+
+        print("✅ Test 4 PASÓ: Conversión UTM")
+
+    def test_05_utm_filled_on_save_and_backfill(self):
+        """Test: El UTM llena latitud/longitud al guardar y en la conversión masiva"""
+        point = self.env['herbario.coordinates'].create({'utm': '17S 775495 9974571'})
+        self.assertAlmostEqual(point.latitude, -0.22985, places=4)
+        self.assertAlmostEqual(point.longitude, -78.52495, places=4)
+
+        legacy = self.env['herbario.coordinates'].create([{} for _index in range(2)])
+        legacy.flush_recordset()
+        self.env.cr.execute("""
+            UPDATE herbario_coordinates SET utm = v.utm
+            FROM unnest(%s::int[], %s::varchar[]) AS v(id, utm)
+            WHERE herbario_coordinates.id = v.id
+        """, (legacy.ids, ['17S 775495 9974571', 'sin zona']))
+        legacy.invalidate_recordset()
+
+        updated, invalid = self.env['herbario.coordinates']._backfill_utm()
+        self.assertGreaterEqual(updated, 1)
+        self.assertGreaterEqual(invalid, 1)
+        self.assertAlmostEqual(legacy[0].longitude, -78.52495, places=4)
+        self.assertTrue(legacy[0].maps_url)
+        self.assertFalse(legacy[1].latitude)
+
+        result = legacy.action_convert_utm()
+        self.assertEqual(result['params']['type'], 'warning')
+
+        print("✅ Test 5 PASÓ: UTM convertido al guardar y por lotes")
+
+    def _create_gazetteer(self):
+        country = self.env['herbario.country'].create({'name': 'Ecuador (prueba)', 'code': 'EC'})
+        province = self.env['herbario.province'].create({'name': 'Chimborazo (prueba)', 'country_id': country.id})
+        canton = self.env['herbario.lower.political'].create({'name': 'Riobamba (prueba)', 'province_id': province.id})
+        locality = self.env['herbario.locality'].create({'name': 'Licán (prueba)', 'lower_id': canton.id})
+        vicinity = self.env['herbario.vicinity'].create({
+            'name': 'Macají (prueba)',
+            'locality_id': locality.id,
+            'coordinate_ids': [
+                (0, 0, {'latitude': -1.660, 'longitude': -78.690}),
+                (0, 0, {'latitude': -1.664, 'longitude': -78.694}),
+            ],
+        })
+        return country, province, canton, locality, vicinity
+
+    def test_06_reverse_geocode_onchange(self):
+        """Test: Un sitio nuevo con GPS recibe la jerarquía del nomenclátor"""
+        country, province, canton, locality, vicinity = self._create_gazetteer()
+
+        site = self.env['herbario.collection.site'].new({'latitude': -1.665, 'longitude': -78.689})
+        site._onchange_reverse_geocode()
+        self.assertEqual(site.vicinity_id, vicinity)
+        self.assertEqual(site.locality_id, locality)
+        self.assertEqual(site.lower_id, canton)
+        self.assertEqual(site.province_id, province)
+        self.assertEqual(site.country_id, country)
+
+        # Lejos de cualquier vecindad conocida (Galápagos) no se asigna nada
+        far = self.env['herbario.collection.site'].new({'latitude': -0.74, 'longitude': -90.31})
+        far._onchange_reverse_geocode()
+        self.assertFalse(far.locality_id)
+
+        print("✅ Test 6 PASÓ: Geocodificación inversa en el formulario")
+
+    def test_07_reverse_geocode_bulk(self):
+        """Test: La geocodificación masiva ubica los sitios importados sin localidad"""
+        country, province, canton, locality, vicinity = self._create_gazetteer()
+        self.env['ir.config_parameter'].sudo().set_param('herbario.geocode_vicinity_km', 1)
+        specimen = self.env['herbario.specimen'].create({
+            'taxon_id': self.taxon.id,
+            'herbarium_id': self.herbarium.id,
+        })
+        Site = self.env['herbario.collection.site']
+        near = Site.create({'specimen_id': specimen.id, 'latitude': -1.662, 'longitude': -78.692})
+        # A unos 8 km: fuera del radio de la vecindad pero dentro del de la localidad
+        wider = Site.create({'specimen_id': specimen.id, 'latitude': -1.662, 'longitude': -78.62})
+        far = Site.create({'specimen_id': specimen.id, 'latitude': -0.74, 'longitude': -90.31})
+
+        self.assertGreaterEqual(Site._reverse_geocode_sites(batch_size=2), 2)
+
+        self.assertEqual((near.vicinity_id, near.country_id), (vicinity, country))
+        self.assertFalse(wider.vicinity_id)
+        self.assertEqual(wider.locality_id, locality)
+        self.assertEqual(wider.province_id, province)
+        self.assertFalse(far.locality_id)
+
+        print("✅ Test 7 PASÓ: Geocodificación inversa por lotes")
+
+    def test_08_grouped_site_write(self):
+        """Test: Una escritura masiva va en una sola escritura y la elevación queda en cada sitio"""
+        specimen = self.env['herbario.specimen'].create({
+            'taxon_id': self.taxon.id,
+            'herbarium_id': self.herbarium.id,
+        })
+        Site = self.env['herbario.collection.site']
+        linked = Site.create({'specimen_id': specimen.id, 'latitude': -1.5, 'longitude': -78.5})
+        bare = Site.concat(*(Site.create({'specimen_id': specimen.id}) for _index in range(3)))
+        self.assertFalse(bare.coordinate_id)
+        sites = linked | bare
+        previous = linked.coordinate_id
+
+        sites.write({'elevation': 2750, 'notas_campo': 'Salida de campo'})
+
+        self.assertEqual(linked.coordinate_id, previous)
+        self.assertFalse(bare.coordinate_id, "La elevación no crea puntos")
+        self.assertFalse(previous.elevation, "La elevación no se escribe en el punto compartido")
+        for site in sites:
+            self.assertEqual(site.elevation, 2750)
+            self.assertEqual(site.notas_campo, 'Salida de campo')
+
+        # Mover los sitios los lleva a un punto compartido sin tocar el anterior
+        sites.write({'latitude': -1.67, 'longitude': -78.65})
+        self.assertEqual(len(sites.coordinate_id), 1)
+        self.assertAlmostEqual(sites[0].coordinate_id.longitude, -78.65)
+        self.assertAlmostEqual(previous.latitude, -1.5)
+        self.assertEqual(set(sites.mapped('elevation')), {2750})
+
+        print("✅ Test 8 PASÓ: Escritura agrupada de sitios de colección")
+
+    def test_09_shared_points(self):
+        """Test: Los puntos iguales al redondear se reutilizan en vez de duplicarse"""
+        self.env['ir.config_parameter'].sudo().set_param('herbario.coordinate_precision', 4)
+        specimen = self.env['herbario.specimen'].create({
+            'taxon_id': self.taxon.id,
+            'herbarium_id': self.herbarium.id,
+        })
+        Site = self.env['herbario.collection.site']
+        first = Site.create({'specimen_id': specimen.id, 'latitude': -1.67001, 'longitude': -78.65002})
+        second = Site.create({'specimen_id': specimen.id, 'coordenadas_zona': '1°40\'12"S 78°39\'W', 'elevation': 2800})
+        other = Site.create({'specimen_id': specimen.id, 'latitude': -1.68, 'longitude': -78.65})
+
+        self.assertEqual(first.coordinate_id, second.coordinate_id)
+        self.assertNotEqual(first.coordinate_id, other.coordinate_id)
+        point = first.coordinate_id
+        self.assertAlmostEqual(point.latitude, -1.67)
+        self.assertEqual(second.elevation, 2800)
+        self.assertFalse(first.elevation, "La elevación de un sitio no pasa a los demás del punto")
+
+        # Cambiar solo la latitud conserva la longitud y no mueve el punto compartido
+        second.write({'latitude': -1.68})
+        self.assertEqual(second.coordinate_id, other.coordinate_id)
+        self.assertEqual(first.coordinate_id, point)
+        self.assertAlmostEqual(point.latitude, -1.67)
+
+        print("✅ Test 9 PASÓ: Registro de puntos compartidos")
+
+    def test_10_merge_duplicate_points(self):
+        """Test: La unión de duplicados deja un punto por posición y mueve las referencias"""
+        Coordinates = self.env['herbario.coordinates']
+        specimen = self.env['herbario.specimen'].create({
+            'taxon_id': self.taxon.id,
+            'herbarium_id': self.herbarium.id,
+        })
+        # Puntos creados antes del registro: sin clave y repetidos
+        points = Coordinates.create([
+            {'latitude': -1.2500001, 'longitude': -78.5},
+            {'latitude': -1.25, 'longitude': -78.5000002, 'elevation': 2500},
+            {'latitude': -1.3, 'longitude': -78.5},
+        ])
+        Site = self.env['herbario.collection.site']
+        sites = Site.concat(*(
+            Site.create({'specimen_id': specimen.id, 'coordinate_id': point.id}) for point in points
+        ))
+        specimen.coordinate_id = points[1]
+
+        self.assertEqual(Coordinates._merge_duplicate_points(), 1)
+
+        self.assertFalse(points[1].exists())
+        self.assertEqual(sites[1].coordinate_id, points[0])
+        self.assertEqual(specimen.coordinate_id, points[0])
+        self.assertFalse(points[0].elevation, "La unión solo toca la posición")
+        self.assertTrue(points[0].lat_key and points[2].lat_key)
+
+        # Un sitio nuevo en la misma posición reutiliza el punto unido
+        again = Site.create({'specimen_id': specimen.id, 'latitude': -1.25, 'longitude': -78.5})
+        self.assertEqual(again.coordinate_id, points[0])
+
+        print("✅ Test 10 PASÓ: Unión de puntos duplicados")
+
+    def test_11_shared_point_elevations(self):
+        """Test: Dos sitios en la misma posición comparten el punto pero no la elevación"""
+        specimen = self.env['herbario.specimen'].create({
+            'taxon_id': self.taxon.id,
+            'herbarium_id': self.herbarium.id,
+        })
+        Site = self.env['herbario.collection.site']
+        low = Site.create({'specimen_id': specimen.id, 'latitude': -1.5, 'longitude': -78.5, 'elevation': 2600})
+        high = Site.create({'specimen_id': specimen.id, 'latitude': -1.5, 'longitude': -78.5, 'elevation': 3100})
+
+        self.assertEqual(low.coordinate_id, high.coordinate_id)
+        self.assertEqual(low.elevation, 2600)
+        self.assertEqual(high.elevation, 3100, "La elevación del segundo sitio no se pierde")
+
+        low.write({'elevation': 2650})
+        self.assertEqual(high.elevation, 3100, "Cambiar la elevación de un sitio no cambia los demás")
+        self.assertEqual(low.coordinate_id, high.coordinate_id)
+
+        # Mover un sitio conserva su elevación
+        high.write({'latitude': -1.6})
+        self.assertNotEqual(low.coordinate_id, high.coordinate_id)
+        self.assertEqual(high.elevation, 3100)
+
+        self.assertEqual(self.env['herbario.coordinates']._merge_duplicate_points(), 0)
+        self.assertEqual((low.elevation, high.elevation), (2650, 3100))
+
+        print("✅ Test 11 PASÓ: Elevación propia de cada sitio en un punto compartido")
+
+    def test_12_concurrent_point_insert(self):
+        """Test: Un punto que otra transacción registró después de la búsqueda se reutiliza"""
+        Coordinates = self.env['herbario.coordinates']
+        specimen = self.env['herbario.specimen'].create({
+            'taxon_id': self.taxon.id,
+            'herbarium_id': self.herbarium.id,
+        })
+        Site = self.env['herbario.collection.site']
+        existing = Site.create({'specimen_id': specimen.id, 'latitude': -1.5, 'longitude': -78.5}).coordinate_id
+
+        # La primera búsqueda no ve el punto, como si se hubiera guardado entre la búsqueda y el INSERT
+        lookups = []
+        find_points = type(Coordinates)._find_points
+
+        def late_find(model, keys):
+            lookups.append(keys)
+            return {} if len(lookups) == 1 else find_points(model, keys)
+
+        with patch.object(type(Coordinates), '_find_points', late_find):
+            point_ids = Coordinates._get_or_create_points([
+                {'latitude': -1.5, 'longitude': -78.5},
+                {'latitude': -1.6, 'longitude': -78.5},
+            ])
+
+        self.assertEqual(point_ids[0], existing.id, "El INSERT omite la clave repetida y toma el punto existente")
+        self.assertEqual(len(lookups), 2)
+        new_point = Coordinates.browse(point_ids[1])
+        self.assertTrue(new_point.lat_key)
+        self.assertAlmostEqual(new_point.latitude, -1.6)
+        self.assertTrue(new_point.maps_url)
+        self.assertEqual(Coordinates.search_count([('lat_key', '=', existing.lat_key), ('lon_key', '=', existing.lon_key)]), 1)
+
+        print("✅ Test 12 PASÓ: Registro de puntos sin choque con el índice único")
+
+    def test_13_utm_near_equator(self):
+        """Test: Junto al ecuador el norte del hemisferio norte tiene pocas cifras y se lee de vuelta"""
+        latitudes = [0.05, 0.0001, -0.05]
+        texts = utm.format_many(latitudes, [-78.45] * 3)
+        self.assertEqual(texts[0], '17N 783845 5532')
+        back_lat, back_lon = utm.parse_to_latlon(texts + ['17N 783845'])
+        for latitude, back in zip(latitudes, back_lat[:3].tolist()):
+            self.assertLess(abs(back - latitude) * 111000, 1.0)
+        self.assertLess(abs(back_lon[:3] + 78.45).max() * 111000, 1.0)
+        self.assertTrue(math.isnan(back_lat[3]), "El este solo no se parte en este y norte")
+
+        # El UTM que escribe el onchange lo convierte después la tarea masiva
+        point = self.env['herbario.coordinates'].new({'latitude': 0.05, 'longitude': -78.45})
+        point._onchange_lat_lon()
+        legacy = self.env['herbario.coordinates'].create({})
+        legacy.flush_recordset()
+        self.env.cr.execute("UPDATE herbario_coordinates SET utm = %s WHERE id = %s", (point.utm, legacy.id))
+        legacy.invalidate_recordset()
+        self.env['herbario.coordinates']._backfill_utm()
+        self.assertAlmostEqual(legacy.latitude, 0.05, places=4)
+        self.assertAlmostEqual(legacy.longitude, -78.45, places=4)
+
+        print("✅ Test 13 PASÓ: UTM junto al ecuador")
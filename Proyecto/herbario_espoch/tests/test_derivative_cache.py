@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from odoo.tests import common, tagged
+
+from ..tools.derivative_cache import DerivativeCache
+
+
+@tagged('post_install', '-at_install', 'herbario')
+class TestDerivativeCache(common.TransactionCase):
+    """Tests para la caché en disco de derivados de imagen"""
+
+    def setUp(self):
+        super().setUp()
+        self.root = tempfile.mkdtemp(prefix='herbario-cache-')
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+
+    def test_01_key_is_stable(self):
+        """Test: La clave no depende del orden de los parámetros"""
+        key_a = DerivativeCache.make_key('abc', size=(200, 100), format='jpg')
+        key_b = DerivativeCache.make_key('abc', format='jpg', size=(200, 100))
+        self.assertEqual(key_a, key_b)
+        self.assertNotEqual(key_a, DerivativeCache.make_key('abd', size=(200, 100), format='jpg'))
+
+        print("✅ Test 1 PASÓ: Clave de caché estable")
+
+    def test_02_concurrent_requests_coalesce(self):
+        """Test: Peticiones simultáneas del mismo derivado lo generan una sola vez"""
+        cache = DerivativeCache(self.root, 10 * 1024 * 1024)
+        calls = []
+
+        def producer():
+            calls.append(1)
+            time.sleep(0.05)
+            return b'derivado'
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(cache.get_or_create('k' * 64, producer)))
+            for _i in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [b'derivado'] * 5)
+
+        print("✅ Test 2 PASÓ: Peticiones concurrentes coalescidas")
+
+    def test_03_lru_eviction(self):
+        """Test: Al superar el tope se expulsan las entradas menos usadas"""
+        cache = DerivativeCache(self.root, 250)
+        for name in ('a', 'b', 'c'):
+            cache.get_or_create(name * 64, lambda: b'x' * 100)
+        # Usar 'a' la convierte en la más reciente
+        old = time.time() - 60
+        for name in ('a', 'b', 'c'):
+            os.utime(cache._path(name * 64), (old, old))
+        cache.get_or_create('a' * 64, lambda: b'nunca')
+
+        freed = cache.evict()
+
+        self.assertEqual(freed, 100)
+        self.assertTrue(os.path.exists(cache._path('a' * 64)))
+        self.assertEqual(sum(os.path.exists(cache._path(n * 64)) for n in ('b', 'c')), 1)
+
+        print("✅ Test 3 PASÓ: Expulsión LRU")
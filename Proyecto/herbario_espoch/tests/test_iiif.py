@@ -0,0 +1,117 @@
+import base64
+import os
+from io import BytesIO
+
+from PIL import Image
+
+from odoo.tests import common, tagged
+
+from ..tools import iiif
+from .test_image import make_image_b64
+
+
+def make_rotated_jpeg_b64(width=600, height=300, stripe=150):
+    """
+    JPEG guardado de lado con orientación EXIF 6 (foto vertical de móvil): una franja
+    roja a la izquierda del mapa de bits queda arriba al enderezarla.
+    """
+    image = Image.new('RGB', (width, height), (255, 255, 255))
+    image.paste((255, 0, 0), (0, 0, stripe, height))
+    exif = Image.Exif()
+    exif[iiif.EXIF_ORIENTATION_TAG] = 6
+    buffer = BytesIO()
+    image.save(buffer, format='JPEG', exif=exif.tobytes())
+    return base64.b64encode(buffer.getvalue())
+
+
+@tagged('post_install', '-at_install', 'herbario')
+class TestIIIF(common.TransactionCase):
+    """Tests para la IIIF Image API sobre herbario.image"""
+
+    def setUp(self):
+        super().setUp()
+        ICP = self.env['ir.config_parameter'].sudo()
+        ICP.set_param('herbario.image_worker_count', 1)
+        ICP.set_param('herbario.iiif_tile_size', 256)
+        self.family = self.env['herbario.family'].create({'name': 'Melastomataceae'})
+        self.taxon = self.env['herbario.taxon'].create({
+            'family_id': self.family.id,
+            'genero': 'Miconia',
+            'especie': 'crocea',
+        })
+        self.image = self.env['herbario.image'].create({
+            'taxon_id': self.taxon.id,
+            'filename_original': 'pliego.jpg',
+            'image_data': make_image_b64(width=1000, height=600),
+        })
+        self.env['herbario.image']._cron_process_pending_images()
+
+    def test_01_parse_parameters(self):
+        """Test: Región, tamaño, rotación y calidad siguen la sintaxis IIIF 3.0"""
+        self.assertEqual(iiif.parse_region('full', 1000, 600), (0, 0, 1000, 600))
+        self.assertEqual(iiif.parse_region('square', 1000, 600), (200, 0, 600, 600))
+        self.assertEqual(iiif.parse_region('900,500,300,300', 1000, 600), (900, 500, 100, 100))
+        self.assertEqual(iiif.parse_size('500,', 1000, 600), (500, 300))
+        self.assertEqual(iiif.parse_size('!200,200', 1000, 600), (200, 120))
+        self.assertEqual(iiif.parse_rotation('!90'), (True, 90.0))
+        self.assertEqual(iiif.parse_quality_format('gray.png'), ('gray', 'png'))
+        with self.assertRaises(iiif.IIIFError):
+            iiif.parse_size('2000,', 1000, 600)
+        with self.assertRaises(iiif.IIIFError):
+            iiif.parse_region('1200,0,10,10', 1000, 600)
+
+        print("✅ Test 1 PASÓ: Parámetros IIIF validados")
+
+    def test_02_pyramid_generated(self):
+        """Test: El procesamiento genera la pirámide de teselas por hash"""
+        pyramid = self.image._get_iiif_pyramid_dir()
+        self.assertTrue(iiif.has_pyramid(pyramid))
+        self.assertEqual(iiif.scale_factors(1000, 600, 256), [1, 2, 4])
+        self.assertTrue(os.path.exists(iiif.tile_path(pyramid, 1, 3, 2)))
+
+        print("✅ Test 2 PASÓ: Pirámide de teselas generada")
+
+    def test_03_serve_tile_and_region(self):
+        """Test: Teselas y regiones arbitrarias devuelven el tamaño pedido"""
+        content, mimetype = self.image._iiif_image('256,256,256,256', '256,256', '0', 'default.jpg')
+        self.assertEqual(mimetype, 'image/jpeg')
+        self.assertEqual(Image.open(BytesIO(content)).size, (256, 256))
+
+        content, mimetype = self.image._iiif_image('pct:0,0,50,50', '250,', '90', 'default.png')
+        self.assertEqual(mimetype, 'image/png')
+        self.assertEqual(Image.open(BytesIO(content)).size, (150, 250))
+
+        print("✅ Test 3 PASÓ: Teselas y regiones servidas")
+
+    def test_04_exif_orientation(self):
+        """Test: Una foto con orientación EXIF 6 usa la imagen enderezada en info.json, teselas y regiones"""
+        image = self.env['herbario.image'].create({
+            'taxon_id': self.taxon.id,
+            'filename_original': 'vertical.jpg',
+            'image_data': make_rotated_jpeg_b64(),
+        })
+        self.assertEqual((image.image_width, image.image_height), (300, 600))
+        self.env['herbario.image']._cron_process_pending_images()
+        self.assertEqual((image.image_width, image.image_height), (300, 600))
+
+        # La rejilla de info.json coincide con la pirámide: 2 columnas x 3 filas a escala 1
+        info = iiif.build_info('http://localhost/herbario/iiif/1', image.image_width, image.image_height, 256)
+        self.assertEqual((info['width'], info['height']), (300, 600))
+        pyramid = image._get_iiif_pyramid_dir()
+        self.assertTrue(os.path.exists(iiif.tile_path(pyramid, 1, 1, 2)))
+        self.assertFalse(os.path.exists(iiif.tile_path(pyramid, 1, 2, 1)))
+
+        # Tesela pre-generada y región renderizada desde el original: la franja queda arriba en ambas
+        content, _mimetype = image._iiif_image('0,0,256,256', '256,256', '0', 'default.jpg')
+        tile = Image.open(BytesIO(content)).convert('RGB')
+        self.assertEqual(tile.size, (256, 256))
+        self.assertGreater(tile.getpixel((128, 20))[0] - tile.getpixel((128, 20))[1], 200)
+        self.assertGreater(min(tile.getpixel((128, 220))), 240)
+
+        content, _mimetype = image._iiif_image('full', '150,', '0', 'default.png')
+        region = Image.open(BytesIO(content)).convert('RGB')
+        self.assertEqual(region.size, (150, 300))
+        self.assertGreater(region.getpixel((75, 10))[0] - region.getpixel((75, 10))[1], 200)
+        self.assertGreater(min(region.getpixel((75, 280))), 240)
+
+        print("✅ Test 4 PASÓ: Orientación EXIF coherente en la API IIIF")
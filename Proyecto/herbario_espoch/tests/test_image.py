@@ -0,0 +1,327 @@
+import base64
+from io import BytesIO
+from unittest.mock import patch
+
+from PIL import Image
+
+import psycopg2
+
+from odoo import fields
+from odoo.tests import tagged
+from odoo.tools import mute_logger
+from odoo.exceptions import ValidationError
+
+from ..tools import image_processing, phash
+from .common import HerbarioTestCase
+
+
+def make_image_b64(width=640, height=480, color=(40, 120, 60), fmt='JPEG'):
+    """Genera una imagen sintética codificada en base64 para las pruebas."""
+    buffer = BytesIO()
+    Image.new('RGB', (width, height), color).save(buffer, format=fmt)
+    return base64.b64encode(buffer.getvalue())
+
+
+def make_gradient_b64(width=400, height=300, descending=True):
+    """Degradado horizontal: su hash perceptual es muy distinto al de una imagen lisa."""
+    gradient = Image.linear_gradient('L').rotate(-90 if descending else 90).resize((width, height))
+    buffer = BytesIO()
+    gradient.convert('RGB').save(buffer, format='JPEG')
+    return base64.b64encode(buffer.getvalue())
+
+
+@tagged('post_install', '-at_install', 'herbario')
+class TestImage(HerbarioTestCase):
+    """Tests para el modelo herbario.image"""
+
+    def setUp(self):
+        super().setUp()
+        self.env['ir.config_parameter'].sudo().set_param('herbario.image_worker_count', 1)
+
+    def _create_image(self, **kwargs):
+        vals = {
+            'taxon_id': self.taxon.id,
+            'filename_original': 'hoja.jpg',
+            'image_data': make_image_b64(),
+        }
+        vals.update(kwargs)
+        return self.env['herbario.image'].create(vals)
+
+    def test_01_upload_is_queued(self):
+        """Test: La subida guarda metadatos baratos y deja la imagen en cola"""
+        image = self._create_image()
+
+        self.assertEqual(image.processing_state, 'processing')
+        self.assertEqual((image.image_width, image.image_height), (640, 480))
+        self.assertEqual(image.mime_type, 'image/jpeg')
+        self.assertTrue(image.file_hash)
+        self.assertFalse(image.thumbnail, "Las miniaturas se generan en segundo plano")
+
+        print("✅ Test 1 PASÓ: Imagen encolada para procesamiento")
+
+    def test_02_process_pending_images(self):
+        """Test: El cron genera miniaturas y marca la imagen como procesada"""
+        image = self._create_image()
+        self.env['herbario.image']._cron_process_pending_images()
+
+        self.assertEqual(image.processing_state, 'done')
+        self.assertTrue(image.thumbnail)
+        self.assertTrue(image.thumbnail_medium)
+
+        print("✅ Test 2 PASÓ: Imagen procesada por el cron")
+
+    def test_03_invalid_image_rejected(self):
+        """Test: Un archivo que no es imagen se rechaza en la subida"""
+        with self.assertRaises(ValidationError):
+            self._create_image(image_data=base64.b64encode(b'no es una imagen'))
+
+        print("✅ Test 3 PASÓ: Archivo inválido rechazado")
+
+    def test_04_derivative_ladder(self):
+        """Test: El cron genera la escalera WebP sin ampliar la imagen original"""
+        self.env['ir.config_parameter'].sudo().set_param('herbario.image_derivative_sizes', '160,480,1024')
+        image = self._create_image()
+        self.env['herbario.image']._cron_process_pending_images()
+
+        derivatives = image.derivative_ids
+        self.assertEqual(derivatives.mapped('size'), [160, 480, 1024])
+        self.assertEqual(set(derivatives.mapped('image_format')), {'webp'})
+        # 1024 supera el original (640px): se guarda a tamaño real, sin ampliar
+        self.assertEqual(max(derivatives.mapped('width')), 640)
+        self.assertEqual(derivatives.filtered(lambda d: d.size == 160).width, 160)
+
+        # El mejor derivado es el menor peldaño que cubre el tamaño pedido
+        self.assertEqual(derivatives._select_for_size(300, ['avif', 'webp']).size, 480)
+        self.assertEqual(derivatives._select_for_size(2048, ['webp']).size, 1024)
+
+        print("✅ Test 4 PASÓ: Escalera de derivados generada")
+
+    def test_05_negotiate_formats(self):
+        """Test: El formato servido se negocia con la cabecera Accept"""
+        negotiate = image_processing.negotiate_derivative_formats
+        self.assertEqual(negotiate('webp', 'image/avif,image/webp,*/*'), ['avif', 'webp'])
+        self.assertEqual(negotiate('webp', 'image/webp,*/*'), ['webp'])
+        self.assertEqual(negotiate('avif', '*/*'), ['avif'])
+        self.assertEqual(negotiate('gif', ''), ['webp'])
+
+        print("✅ Test 5 PASÓ: Negociación de formato por Accept")
+
+    def test_06_thumbnails_in_filestore(self):
+        """Test: Las miniaturas se guardan como adjuntos y se sirven por URL"""
+        image = self._create_image()
+        self.assertFalse(image.thumbnail_url, "Sin miniatura mientras se procesa")
+        self.env['herbario.image']._cron_process_pending_images()
+
+        attachments = self.env['ir.attachment'].search([
+            ('res_model', '=', 'herbario.image'),
+            ('res_id', '=', image.id),
+            ('res_field', 'in', ['thumbnail', 'thumbnail_medium']),
+        ])
+        self.assertEqual(len(attachments), 2)
+        self.assertTrue(image.thumbnail_url.startswith(f'/web/image/herbario.image/{image.id}/thumbnail'))
+
+        print("✅ Test 6 PASÓ: Miniaturas en el filestore")
+
+    def test_07_identical_upload_shares_content(self):
+        """Test: Una imagen idéntica en otro taxón reutiliza el procesamiento y los blobs"""
+        other_taxon = self.env['herbario.taxon'].create({
+            'family_id': self.family.id,
+            'genero': 'Baccharis',
+            'especie': 'salicifolia',
+        })
+        image_data = make_image_b64()
+        first = self._create_image(image_data=image_data)
+        self.env['herbario.image']._cron_process_pending_images()
+
+        second = self._create_image(taxon_id=other_taxon.id, image_data=image_data)
+        self.assertEqual(first.file_hash, second.file_hash)
+        second._process_pending_images()
+
+        self.assertEqual(second.processing_state, 'done')
+        self.assertEqual(second.derivative_ids.mapped('size'), first.derivative_ids.mapped('size'))
+        Attachment = self.env['ir.attachment']
+        blobs = Attachment.search([
+            ('res_model', '=', 'herbario.image'),
+            ('res_field', '=', 'thumbnail'),
+            ('res_id', 'in', (first + second).ids),
+        ]).mapped('store_fname')
+        self.assertEqual(len(blobs), 2)
+        self.assertEqual(len(set(blobs)), 1, "Ambas miniaturas apuntan al mismo archivo del filestore")
+
+        print("✅ Test 7 PASÓ: Contenido idéntico compartido")
+
+    def test_08_near_duplicate_detection(self):
+        """Test: Un re-escaneo redimensionado se marca como casi duplicado"""
+        original = self._create_image(image_data=make_gradient_b64())
+        self.env['herbario.image']._cron_process_pending_images()
+        rescan = self._create_image(filename_original='reescaneo.jpg', image_data=make_gradient_b64(500, 375))
+        other = self._create_image(filename_original='otra.jpg', image_data=make_gradient_b64(descending=False))
+        self.env['herbario.image']._cron_process_pending_images()
+
+        self.assertNotEqual(original.file_hash, rescan.file_hash)
+        self.assertEqual(rescan.near_duplicate_of_id, original)
+        self.assertFalse(other.near_duplicate_of_id)
+
+        # La auditoría masiva llega al mismo resultado
+        (original + rescan + other).write({'near_duplicate_of_id': False})
+        self.env['herbario.image']._cron_audit_near_duplicates()
+        self.assertEqual(rescan.near_duplicate_of_id, original)
+
+        print("✅ Test 8 PASÓ: Casi duplicados detectados")
+
+    def test_09_bktree_search(self):
+        """Test: El árbol BK devuelve solo los hashes dentro del umbral"""
+        tree = phash.BKTree()
+        for index, value in enumerate([0b0000, 0b0001, 0b0111, 0b1111 << 60]):
+            tree.add(value, index)
+        self.assertEqual(tree.search(0, 1), [(0, 0), (1, 1)])
+        self.assertEqual(sorted(item for _d, item in tree.search(0b0011, 1)), [1, 2])
+        self.assertEqual(len(phash.chunks(2 ** 64 - 1)), len(phash.PHASH_CHUNK_BITS))
+
+        print("✅ Test 9 PASÓ: Búsqueda en árbol BK")
+
+    def test_10_memory_bounded_processing(self):
+        """Test: El pool procesa desde la ruta del filestore y respeta el tope de píxeles"""
+        image = self._create_image(image_data=make_image_b64(width=3000, height=2000))
+        self.env['herbario.image']._cron_process_pending_images()
+        self.assertEqual(image.processing_state, 'done')
+        self.assertEqual(Image.open(BytesIO(base64.b64decode(image.with_context(bin_size=False).thumbnail_medium))).size, (200, 133))
+        self.assertEqual(
+            set(image.derivative_ids.mapped('width')), {160, 480, 1024, 2048},
+            "draft() no debe reducir por debajo del derivado mayor"
+        )
+
+        with patch.object(image_processing, 'MAX_IMAGE_PIXELS', 1000):
+            with self.assertRaises(ValidationError):
+                self._create_image(filename_original='enorme.jpg', image_data=make_image_b64(color=(1, 2, 3)))
+
+        print("✅ Test 10 PASÓ: Procesamiento con memoria acotada")
+
+    def test_11_lqip_placeholder(self):
+        """Test: El procesamiento guarda un marcador LQIP diminuto en data URI"""
+        image = self._create_image(image_data=make_gradient_b64())
+        self.assertFalse(image.placeholder)
+        self.env['herbario.image']._cron_process_pending_images()
+
+        self.assertTrue(image.placeholder.startswith('data:image/jpeg;base64,'))
+        self.assertLess(len(image.placeholder), 1500, "El marcador debe ocupar unos cientos de bytes")
+        content = base64.b64decode(image.placeholder.split(',', 1)[1])
+        self.assertLessEqual(max(Image.open(BytesIO(content)).size), image_processing.PLACEHOLDER_SIZE)
+
+        print("✅ Test 11 PASÓ: Marcador LQIP generado")
+
+    def test_12_bulk_unlink_updates_primary_pointer(self):
+        """Test: Borrar muchas imágenes recalcula el puntero principal una vez y registra un solo log"""
+        images = self.env['herbario.image'].create([{
+            'taxon_id': self.taxon.id,
+            'filename_original': f'hoja_{index}.jpg',
+            'image_data': make_image_b64(color=(index, 80, 40)),
+        } for index in range(5)])
+        self.assertEqual(self.taxon.primary_image_id, images[0])
+        self.assertEqual(images.filtered('is_primary'), images[0])
+
+        AuditLog = self.env['herbario.audit.log']
+        logs_before = AuditLog.search_count([('res_model', '=', 'herbario.taxon'), ('res_id', '=', self.taxon.id)])
+        images[:4].unlink()
+
+        self.assertEqual(self.taxon.primary_image_id, images[4])
+        logs_after = AuditLog.search_count([('res_model', '=', 'herbario.taxon'), ('res_id', '=', self.taxon.id)])
+        self.assertEqual(logs_after - logs_before, 1)
+
+        print("✅ Test 12 PASÓ: Borrado por lotes con puntero principal almacenado")
+
+    def test_13_gallery_page_data(self):
+        """Test: La galería pagina las imágenes del taxón y devuelve solo datos ligeros"""
+        Image = self.env['herbario.image']
+        images = Image.create([{
+            'taxon_id': self.taxon.id,
+            'filename_original': f'pliego_{index}.jpg',
+            'image_data': make_image_b64(color=(index, 10, 200)),
+        } for index in range(3)])
+        images[2].deleted_at = '2024-01-01 00:00:00'
+
+        domain = Image._get_gallery_domain(self.taxon)
+        self.assertEqual(Image.search_count(domain), 2)
+        page = Image.search(domain, offset=1, limit=1)._get_gallery_data()
+
+        self.assertEqual(len(page), 1)
+        self.assertEqual(page[0]['id'], images[1].id)
+        self.assertEqual(page[0]['thumbnail_url'], f'/herbario/img/{images[1].id}/160.webp')
+        self.assertEqual((page[0]['width'], page[0]['height']), (640, 480))
+        self.assertNotIn('image_data', page[0])
+
+        print("✅ Test 13 PASÓ: Página de galería")
+
+    def test_14_original_url_is_content_addressed(self):
+        """Test: La URL del original cambia al reemplazar la imagen (caché inmutable)"""
+        image = self._create_image()
+        url = image._get_original_url()
+        self.assertEqual(url, f'/herbario/img/{image.id}/original/{image.file_hash}')
+        self.assertTrue(image._get_original_url(download=True).endswith('?download=1'))
+
+        image.write({'image_data': make_image_b64(color=(200, 0, 0))})
+        self.assertNotEqual(image._get_original_url(), url)
+
+        print("✅ Test 14 PASÓ: URL del original direccionada por contenido")
+
+    def test_15_single_primary_switch(self):
+        """Test: Cambiar la imagen principal deja una sola, también a nivel de base de datos"""
+        images = self.env['herbario.image'].concat(*(
+            self._create_image(image_data=make_image_b64(color=(index, 40, 80))) for index in range(3)
+        ))
+        self.assertEqual(images.filtered('is_primary'), images[0])
+
+        images[2].action_set_as_primary()
+        self.assertEqual(images.filtered('is_primary'), images[2])
+        self.assertEqual(self.taxon.primary_image_id, images[2])
+
+        images[1].write({'is_primary': True})
+        self.assertEqual(images.filtered('is_primary'), images[1])
+
+        # Una escritura directa que deje dos principales la rechaza la restricción
+        with mute_logger('odoo.sql_db'), self.assertRaises(psycopg2.IntegrityError), self.env.cr.savepoint():
+            self.env.cr.execute("UPDATE herbario_image SET is_primary = TRUE WHERE id = %s", (images[0].id,))
+
+        print("✅ Test 15 PASÓ: Una sola imagen principal por taxón")
+
+    def test_16_backfill_images_without_derivatives(self):
+        """Test: Las imágenes procesadas antes de los derivados se vuelven a encolar y los reciben"""
+        Image = self.env['herbario.image']
+        legacy = self._create_image()
+        removed = self._create_image(image_data=make_image_b64(color=(200, 30, 30)))
+        Image._cron_process_pending_images()
+        # Como quedaron antes de la escalera de derivados: procesadas y sin ninguno
+        (legacy + removed).derivative_ids.sudo().unlink()
+        removed.write({'deleted_at': fields.Datetime.now()})
+
+        self.assertEqual(Image._backfill_processing(), 1)
+        self.assertEqual(legacy.processing_state, 'processing')
+        self.assertEqual(removed.processing_state, 'done', "Las imágenes borradas no se encolan")
+
+        Image._cron_process_pending_images()
+        self.assertEqual(legacy.processing_state, 'done')
+        self.assertTrue(legacy.derivative_ids)
+        self.assertEqual(Image._backfill_processing(), 0)
+
+        print("✅ Test 16 PASÓ: Imágenes antiguas encoladas para generar derivados")
+
+    def test_17_backfill_images_without_phash(self):
+        """Test: Las imágenes sin hash perceptual se reprocesan y entran en la auditoría de casi duplicados"""
+        Image = self.env['herbario.image']
+        original = self._create_image(image_data=make_gradient_b64())
+        rescan = self._create_image(image_data=make_gradient_b64(500, 375))
+        Image._cron_process_pending_images()
+        # Subidas antes del hash perceptual: con derivados pero sin hash
+        (original + rescan).write({'phash': False, 'near_duplicate_of_id': False})
+        Image._cron_audit_near_duplicates()
+        self.assertFalse(rescan.near_duplicate_of_id, "Sin hash la auditoría no ve la imagen")
+
+        self.assertEqual(Image._backfill_processing(), 2)
+        Image._cron_process_pending_images()
+        self.assertTrue(original.phash and rescan.phash)
+
+        rescan.write({'near_duplicate_of_id': False})
+        Image._cron_audit_near_duplicates()
+        self.assertEqual(rescan.near_duplicate_of_id, original)
+
+        print("✅ Test 17 PASÓ: Hash perceptual completado para imágenes antiguas")
@@ -0,0 +1,108 @@
+import base64
+import os
+import shutil
+import tempfile
+import zipfile
+from io import BytesIO
+
+from odoo.tests import tagged
+
+from ..tools import bulk_ingest
+from .common import HerbarioTestCase
+from .test_image import make_image_b64
+
+
+@tagged('post_install', '-at_install', 'herbario')
+class TestImageBulkIngest(HerbarioTestCase):
+    """Tests para la carga masiva de imágenes desde ZIP o carpeta"""
+
+    def setUp(self):
+        super().setUp()
+        self.env['ir.config_parameter'].sudo().set_param('herbario.image_worker_count', 1)
+        self.specimen = self.env['herbario.specimen'].create({
+            'taxon_id': self.taxon.id,
+            'herbarium_id': self.herbarium.id,
+            'numero_cartulina': 4321,
+        })
+
+    def _make_zip(self, files):
+        buffer = BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            for name, content in files.items():
+                archive.writestr(name, content)
+        return base64.b64encode(buffer.getvalue())
+
+    def test_01_filename_index(self):
+        """Test: Los nombres de archivo se resuelven por código, cartulina o nombre científico"""
+        index = bulk_ingest.FilenameIndex(
+            [{'id': 1, 'codigo_herbario': 'CHEP-0000001', 'numero_cartulina': 12, 'taxon_id': 7},
+             {'id': 2, 'codigo_herbario': 'CHEP-0000002', 'numero_cartulina': 55, 'taxon_id': 7},
+             {'id': 3, 'codigo_herbario': 'CHEP-0000003', 'numero_cartulina': 55, 'taxon_id': 8}],
+            [{'id': 7, 'name': 'Miconia crocea'}],
+        )
+        self.assertEqual(index.match('fotos/chep_0000001 (2).JPG')[0], (1, 7))
+        self.assertEqual(index.match('12_b.jpg')[0], (1, 7))
+        self.assertEqual(index.match('Miconia-crocea.tif')[0], (False, 7))
+        self.assertIn('ambiguo', index.match('55.jpg')[1])
+        self.assertIsNone(index.match('122.jpg')[0], "La cartulina 122 no existe")
+        self.assertIsNone(index.match('CHEP-0000001.jpg', match_by='cartulina')[0])
+
+        print("✅ Test 1 PASÓ: Índice de nombres de archivo")
+
+    def test_02_ingest_zip(self):
+        """Test: El ZIP crea las imágenes que coinciden e informa las demás"""
+        photo = base64.b64decode(make_image_b64())
+        wizard = self.env['herbario.image.bulk.ingest'].create({
+            'source_type': 'zip',
+            'zip_file': self._make_zip({
+                f'{self.specimen.codigo_herbario}.jpg': photo,
+                '4321_2.jpg': base64.b64decode(make_image_b64(color=(10, 10, 10))),
+                'CHEP-9999999.jpg': photo,
+                'Baccharis_latifolia.txt': b'notas',
+                '__MACOSX/._4321.jpg': b'metadatos',
+                '4321.png': b'no es una imagen',
+            }),
+            'process_now': True,
+        })
+        upload = self.env['ir.attachment'].sudo().search([
+            ('res_model', '=', wizard._name),
+            ('res_field', '=', 'zip_file'),
+            ('res_id', '=', wizard.id),
+        ])
+        self.assertEqual(len(upload), 1, "El ZIP se guarda como adjunto en el filestore")
+        wizard.action_ingest()
+
+        self.assertFalse(upload.exists(), "El adjunto del ZIP se elimina tras la carga")
+        self.assertEqual(wizard.created_count, 2)
+        self.assertEqual(wizard.unmatched_count, 1)
+        self.assertEqual(wizard.skipped_count, 1)
+        self.assertIn('CHEP-9999999.jpg', wizard.report)
+        images = wizard.image_ids
+        self.assertEqual(images.specimen_id, self.specimen)
+        self.assertEqual(set(images.mapped('processing_state')), {'done'})
+        self.assertEqual(len(images.filtered('is_primary')), 1)
+
+        print("✅ Test 2 PASÓ: Carga masiva desde ZIP")
+
+    def test_03_ingest_directory_skips_duplicates(self):
+        """Test: La carga desde carpeta omite archivos ya cargados para el mismo registro"""
+        folder = tempfile.mkdtemp(prefix='herbario-ingest-')
+        self.addCleanup(shutil.rmtree, folder, ignore_errors=True)
+        photo = base64.b64decode(make_image_b64())
+        for name in ('Baccharis latifolia.jpg', 'Baccharis latifolia (2).jpg'):
+            with open(os.path.join(folder, name), 'wb') as image_file:
+                image_file.write(photo)
+
+        Ingest = self.env['herbario.image.bulk.ingest']
+        first = Ingest._ingest_path(folder, match_by='taxon', process_now=False)
+        second = Ingest._ingest_path(folder, match_by='taxon', process_now=False)
+
+        self.assertEqual(len(first['image_ids']), 1)
+        self.assertEqual(len(first['skipped']), 1)
+        self.assertEqual(second['image_ids'], [])
+        self.assertEqual(len(second['skipped']), 2)
+        image = self.env['herbario.image'].browse(first['image_ids'])
+        self.assertEqual(image.taxon_id, self.taxon)
+        self.assertEqual(image.processing_state, 'processing')
+
+        print("✅ Test 3 PASÓ: Duplicados omitidos en la carga desde carpeta")
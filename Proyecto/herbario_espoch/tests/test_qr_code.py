@@ -0,0 +1,177 @@
+import base64
+import hashlib
+import re
+from io import BytesIO
+from unittest.mock import patch
+
+from PIL import Image
+
+from odoo.exceptions import UserError
+from odoo.tests import tagged
+
+from ..tools import qr_render
+from .common import HerbarioTestCase
+
+
+@tagged('post_install', '-at_install', 'herbario')
+class TestQRCode(HerbarioTestCase):
+    """Tests para la generación de códigos QR por lotes y las hojas de etiquetas"""
+
+    def setUp(self):
+        super().setUp()
+        self.env['ir.config_parameter'].sudo().set_param('herbario.image_worker_count', 1)
+        self.specimens = self.env['herbario.specimen'].create([{
+            'taxon_id': self.taxon.id,
+            'herbarium_id': self.herbarium.id,
+            'numero_cartulina': 7000 + index,
+        } for index in range(5)])
+
+    def test_01_batch_creates_and_reuses_active_qr(self):
+        """Test: El lote reutiliza el QR activo existente y crea el resto de una vez"""
+        QRCode = self.env['herbario.qr.code']
+        existing = QRCode._get_or_create_active_qr(self.specimens[0])
+
+        qr_codes = QRCode._get_or_create_active_qr(self.specimens)
+
+        self.assertEqual(len(qr_codes), 5)
+        self.assertEqual(qr_codes[0], existing)
+        self.assertEqual(qr_codes.specimen_id, self.specimens)
+        for qr in qr_codes:
+            self.assertEqual(qr.status, 'active')
+            self.assertTrue(base64.b64decode(qr.qr_svg).startswith(b'<svg'))
+            self.assertTrue(qr.qr_url.endswith(f'/herbario/specimen/{qr.specimen_id.id}'))
+
+        # Una segunda pasada no crea nada nuevo
+        self.assertEqual(QRCode._get_or_create_active_qr(self.specimens), qr_codes)
+
+        print("✅ Test 1 PASÓ: QR por lotes creados y reutilizados")
+
+    def test_02_label_sheet_pdf(self):
+        """Test: El asistente compone las etiquetas en hojas A4 según la rejilla"""
+        wizard = self.env['herbario.qr.label.wizard'].with_context(
+            active_model='herbario.specimen', active_ids=self.specimens.ids
+        ).create({'columns': 2, 'rows': 2})
+        self.assertEqual(wizard.specimen_ids, self.specimens)
+
+        wizard.action_generate()
+
+        pdf = base64.b64decode(wizard.label_file)
+        self.assertTrue(pdf.startswith(b'%PDF'))
+        self.assertEqual(len(re.findall(rb'/Type /Page\b(?!s)', pdf)), 2)
+        self.assertEqual(wizard.label_count, 5)
+        self.assertEqual(wizard.page_count, 2)
+        self.assertEqual(wizard.created_count, 5)
+
+        print("✅ Test 2 PASÓ: Hoja de etiquetas A4")
+
+    def test_03_grid_must_fit(self):
+        """Test: Una rejilla que no cabe en la página se rechaza"""
+        wizard = self.env['herbario.qr.label.wizard'].create({
+            'specimen_ids': [(6, 0, self.specimens.ids)],
+            'columns': 3,
+            'rows': 8,
+            'margin_mm': 120,
+        })
+        with self.assertRaises(UserError):
+            wizard.action_generate()
+
+        print("✅ Test 3 PASÓ: Rejilla validada")
+
+    def test_04_render_cache(self):
+        """Test: Regenerar un QR sin cambios reutiliza la imagen en lugar de renderizarla"""
+        qr = self.env['herbario.qr.code']._get_or_create_active_qr(self.specimens[0])
+        self.assertTrue(qr.render_key)
+
+        with patch.object(qr_render, 'render_svg', wraps=qr_render.render_svg) as render:
+            action = qr.action_regenerate()
+            new_qr = self.env['herbario.qr.code'].browse(action['res_id'])
+            self.assertEqual(render.call_count, 0)
+            self.assertEqual(new_qr.render_key, qr.render_key)
+            self.assertEqual(new_qr.qr_svg, qr.qr_svg)
+
+            new_qr.write({'box_size': 12})
+            self.assertEqual(render.call_count, 1)
+            self.assertNotEqual(new_qr.render_key, qr.render_key)
+
+            # Volver a los parámetros originales es de nuevo un acierto de caché
+            new_qr.write({'box_size': 10})
+            self.assertEqual(render.call_count, 1)
+            self.assertEqual(new_qr.qr_svg, qr.qr_svg)
+
+        print("✅ Test 4 PASÓ: Caché de renderizado de QR")
+
+    def test_05_png_rasterized_on_demand(self):
+        """Test: El PNG se rasteriza a la resolución elegida solo cuando se pide"""
+        qr = self.env['herbario.qr.code']._get_or_create_active_qr(self.specimens[0])
+        self.assertFalse(qr.qr_image, "Crear el QR solo genera el SVG")
+
+        qr.write({'resolution': '1200'})
+        qr.action_download()
+        png = Image.open(BytesIO(base64.b64decode(qr.qr_image)))
+        self.assertEqual(png.size, (1200, 1200))
+
+        # Otro QR con el mismo contenido y resolución reutiliza el PNG
+        qr.write({'status': 'inactive'})
+        twin = self.env['herbario.qr.code'].create({
+            'specimen_id': self.specimens[0].id,
+            'qr_url': qr.qr_url,
+            'resolution': '1200',
+        })
+        with patch.object(qr_render, 'rasterize_svg', wraps=qr_render.rasterize_svg) as rasterize:
+            twin._ensure_qr_png()
+            self.assertEqual(rasterize.call_count, 0)
+        self.assertEqual(twin.qr_image, qr.qr_image)
+
+        # Cambiar la resolución descarta el PNG cacheado
+        twin.write({'resolution': '300'})
+        self.assertFalse(twin.qr_image)
+        twin._ensure_qr_png()
+        self.assertEqual(Image.open(BytesIO(base64.b64decode(twin.qr_image))).size, (300, 300))
+
+        print("✅ Test 5 PASÓ: PNG bajo demanda a la resolución elegida")
+
+    def test_06_symbol_metadata_stored(self):
+        """Test: Checksum, tamaño, versión y módulos se guardan al renderizar"""
+        qr = self.env['herbario.qr.code']._get_or_create_active_qr(self.specimens[0])
+        svg = base64.b64decode(qr.qr_svg)
+
+        self.assertEqual(qr.checksum, hashlib.sha256(svg).hexdigest())
+        self.assertEqual(qr.file_size_bytes, len(svg))
+        self.assertGreaterEqual(qr.symbol_version, 1)
+        self.assertEqual(qr.module_count, 17 + 4 * qr.symbol_version)
+        matrix = qr_render.make_matrix(qr.qr_url, qr.error_correction, qr.border)
+        self.assertEqual(len(matrix), qr.module_count + 2 * qr.border)
+
+        # Un QR que reutiliza el SVG de la caché hereda los mismos metadatos
+        new_qr = self.env['herbario.qr.code'].browse(qr.action_regenerate()['res_id'])
+        self.assertEqual(
+            (new_qr.checksum, new_qr.file_size_bytes, new_qr.symbol_version, new_qr.module_count),
+            (qr.checksum, qr.file_size_bytes, qr.symbol_version, qr.module_count),
+        )
+
+        print("✅ Test 6 PASÓ: Metadatos del símbolo guardados")
+
+    def test_07_png_preview_for_views(self):
+        """Test: Las vistas usan un PNG de vista previa que se guarda como imagen para cualquier usuario"""
+        QRCode = self.env['herbario.qr.code'].with_user(self.encargado_user)
+        qr = QRCode._get_or_create_active_qr(self.specimens[0].with_user(self.encargado_user))
+
+        preview = Image.open(BytesIO(base64.b64decode(qr.qr_preview)))
+        self.assertEqual(preview.size, (qr_render.PREVIEW_SIZE, qr_render.PREVIEW_SIZE))
+        attachments = self.env['ir.attachment'].sudo().search([
+            ('res_model', '=', 'herbario.qr.code'),
+            ('res_id', '=', qr.id),
+            ('res_field', 'in', ['qr_svg', 'qr_preview']),
+        ])
+        mimetypes = {attachment.res_field: attachment.mimetype for attachment in attachments}
+        self.assertEqual(mimetypes['qr_preview'], 'image/png')
+        # Sin permiso de editar vistas, el SVG queda como texto: por eso no se muestra en las vistas
+        self.assertEqual(mimetypes['qr_svg'], 'text/plain')
+
+        # Un QR que reutiliza el SVG de la caché también reutiliza la vista previa
+        with patch.object(qr_render, 'rasterize_svg', wraps=qr_render.rasterize_svg) as rasterize:
+            new_qr = self.env['herbario.qr.code'].browse(qr.action_regenerate()['res_id'])
+            self.assertEqual(rasterize.call_count, 0)
+        self.assertEqual(new_qr.qr_preview, qr.qr_preview)
+
+        print("✅ Test 7 PASÓ: Vista previa PNG del QR")
@@ -0,0 +1,99 @@
+from datetime import datetime
+
+from odoo.tests import tagged
+
+from .common import HerbarioTestCase
+
+IPHONE = 'Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) Mobile/15E148'
+IPAD = 'Mozilla/5.0 (iPad; CPU OS 17_0 like Mac OS X) Mobile/15E148'
+DESKTOP = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/120.0'
+BOT = 'Googlebot/2.1 (+http://www.google.com/bot.html)'
+
+
+@tagged('post_install', '-at_install', 'herbario')
+class TestQRScanDaily(HerbarioTestCase):
+    """Tests para el resumen diario de escaneos QR"""
+
+    def setUp(self):
+        super().setUp()
+        self.env['ir.config_parameter'].sudo().set_param('herbario.image_worker_count', 1)
+        self.env['ir.config_parameter'].sudo().set_param('herbario.scan_rollup_tz', 'UTC')
+        self.specimen = self.env['herbario.specimen'].create({
+            'taxon_id': self.taxon.id,
+            'herbarium_id': self.herbarium.id,
+        })
+        self.qr = self.env['herbario.qr.code']._get_or_create_active_qr(self.specimen)
+        self.Daily = self.env['herbario.qr.scan.daily']
+        # Empezar desde el último escaneo existente para no depender de otros datos
+        self.env.cr.execute("SELECT COALESCE(MAX(id), 0) FROM herbario_qr_scan_log")
+        self.env['ir.config_parameter'].sudo().set_param('herbario.scan_rollup_hwm', self.env.cr.fetchone()[0])
+
+    def _scan(self, user_agent, scanned_at, settled=True):
+        log = self.env['herbario.qr.scan.log'].create({
+            'qr_code_id': self.qr.id,
+            'user_agent': user_agent,
+            'scanned_at': scanned_at,
+        })
+        if settled:
+            # Fuera del margen de seguridad del cron
+            log.flush_recordset()
+            self.env.cr.execute(
+                "UPDATE herbario_qr_scan_log SET create_date = create_date - interval '1 hour' WHERE id = %s",
+                [log.id],
+            )
+        return log
+
+    def _counts(self):
+        rows = self.Daily.search([('qr_code_id', '=', self.qr.id)])
+        return {(str(row.day), row.device_class): row.scan_count for row in rows}
+
+    def test_01_incremental_rollup(self):
+        """Test: El resumen suma por día y dispositivo y avanza la marca de agua"""
+        self._scan(IPHONE, datetime(2025, 3, 1, 10))
+        self._scan(IPHONE, datetime(2025, 3, 1, 18))
+        self._scan(IPAD, datetime(2025, 3, 1, 12))
+        self._scan(DESKTOP, datetime(2025, 3, 2, 9))
+        self._scan(BOT, datetime(2025, 3, 2, 9))
+
+        self.assertEqual(self.Daily._rollup_scans(), 5)
+        self.assertEqual(self._counts(), {
+            ('2025-03-01', 'mobile'): 2,
+            ('2025-03-01', 'tablet'): 1,
+            ('2025-03-02', 'desktop'): 1,
+            ('2025-03-02', 'bot'): 1,
+        })
+        row = self.Daily.search([('qr_code_id', '=', self.qr.id)], limit=1)
+        self.assertEqual(row.taxon_id, self.taxon)
+        self.assertEqual(row.specimen_id, self.specimen)
+
+        # Una segunda pasada solo suma lo nuevo; lo recién insertado espera al margen
+        self._scan(IPHONE, datetime(2025, 3, 1, 20))
+        fresh = self._scan(IPHONE, datetime(2025, 3, 1, 21), settled=False)
+        self.assertEqual(self.Daily._rollup_scans(), 1)
+        self.assertEqual(self._counts()[('2025-03-01', 'mobile')], 3)
+        hwm = int(self.env['ir.config_parameter'].sudo().get_param('herbario.scan_rollup_hwm'))
+        self.assertLess(hwm, fresh.id)
+        self.assertEqual(self.Daily._rollup_scans(), 0)
+
+        print("✅ Test 1 PASÓ: Resumen incremental de escaneos")
+
+    def test_02_batches_and_stats(self):
+        """Test: El resumen por lotes da el mismo resultado y alimenta las consultas"""
+        for day in (3, 3, 4, 10):
+            self._scan(IPHONE, datetime(2025, 3, day, 12))
+        self._scan(BOT, datetime(2025, 3, 4, 12))
+
+        self.assertEqual(self.Daily._rollup_scans(batch_size=2), 2)
+        self.assertEqual(self.Daily._rollup_scans(batch_size=2), 2)
+        self.assertEqual(self.Daily._rollup_scans(batch_size=2), 1)
+
+        no_bots = [('device_class', '!=', 'bot'), ('qr_code_id', '=', self.qr.id)]
+        by_day = self.Daily._get_scan_stats('2025-03-01', '2025-03-31', 'day', domain=no_bots)
+        self.assertEqual([(row['key'], row['scans']) for row in by_day],
+                         [('2025-03-03', 2), ('2025-03-04', 1), ('2025-03-10', 1)])
+        top_taxa = self.Daily._get_scan_stats(group_by='taxon', limit=20, domain=no_bots)
+        self.assertEqual(top_taxa, [{'key': self.taxon.id, 'label': self.taxon.display_name, 'scans': 4}])
+        with self.assertRaises(ValueError):
+            self.Daily._get_scan_stats(group_by='hour')
+
+        print("✅ Test 2 PASÓ: Resumen por lotes y consultas agregadas")
@@ -0,0 +1,154 @@
+import base64
+import threading
+from io import BytesIO
+from unittest.mock import patch
+
+from reportlab.pdfgen import canvas
+
+from odoo.tests import tagged
+from odoo.tools.pdf import PdfFileReader
+
+from ..models.report_job import HerbarioReportJob
+from .common import HerbarioTestCase
+
+
+def _stub_pdf(specimen_ids):
+    """PDF mínimo con una página por espécimen, en lugar del reporte QWeb real."""
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer)
+    for specimen_id in specimen_ids:
+        pdf.drawString(72, 720, f'Espécimen {specimen_id}')
+        pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+def _page_count(pdf):
+    return PdfFileReader(BytesIO(pdf), strict=False).getNumPages()
+
+
+@tagged('post_install', '-at_install', 'herbario')
+class TestReportJob(HerbarioTestCase):
+    """Tests para los reportes PDF por bloques en segundo plano"""
+
+    def setUp(self):
+        super().setUp()
+        self.report = self.env['ir.actions.report'].create({
+            'name': 'Ficha de prueba',
+            'model': 'herbario.specimen',
+            'report_type': 'qweb-pdf',
+            'report_name': 'herbario_espoch.report_ficha_prueba',
+        })
+        self.specimens = self.env['herbario.specimen'].create([{
+            'taxon_id': self.taxon.id,
+            'herbarium_id': self.herbarium.id,
+            'numero_cartulina': 8000 + index,
+        } for index in range(7)])
+        self.calls = []
+        self.seen = []
+        # Los hilos y el encabezado del trabajo usan cursores propios: en modo de prueba
+        # comparten la transacción del test (serializados), como en HttpCase
+        self.registry.enter_test_mode(self.cr)
+        self.addCleanup(self.registry.leave_test_mode)
+
+    def _create_job(self):
+        return self.env['herbario.report.job'].create({
+            'report_id': self.report.id,
+            'specimen_ids': [(6, 0, self.specimens.ids)],
+            'chunk_size': 3,
+        })
+
+    def _render(self, job, specimen_ids):
+        # Lo que ve el hilo desde su cursor mientras el trabajo está en marcha
+        self.seen.append((threading.current_thread().name, job.state, job.chunk_count, job.done_chunks))
+        self.calls.append(list(specimen_ids))
+        return _stub_pdf(specimen_ids)
+
+    def test_01_chunks_are_merged(self):
+        """Test: Los bloques se renderizan por separado y se unen en un solo PDF"""
+        job = self._create_job()
+        with patch.object(HerbarioReportJob, '_render_chunk', lambda job, ids: self._render(job, ids)):
+            job._cron_process_report_jobs()
+
+        self.assertEqual(job.state, 'done')
+        self.assertEqual(sorted(self.calls), sorted(job._get_chunks()))
+        self.assertEqual(sorted(len(ids) for ids in self.calls), [1, 3, 3])
+        # Los bloques se renderizan en los hilos del pool, con el encabezado ya confirmado
+        self.assertTrue(all(name.startswith('herbario') for name, *_rest in self.seen))
+        self.assertEqual({(state, chunks) for _name, state, chunks, _done in self.seen}, {('running', 3)})
+        self.assertEqual(sorted(done for *_rest, done in self.seen), [0, 1, 2], "El progreso avanza con cada parte")
+        self.assertEqual((job.chunk_count, job.done_chunks, job.progress), (3, 3, 100.0))
+        self.assertEqual(_page_count(base64.b64decode(job.attachment_id.datas)), 7)
+        self.assertFalse(job._get_parts(), "Las partes se eliminan al publicar el PDF")
+        self.assertEqual(job.action_download()['url'], f'/web/content/{job.attachment_id.id}?download=true')
+
+        print("✅ Test 1 PASÓ: Bloques unidos en un PDF")
+
+    def test_02_failed_job_resumes(self):
+        """Test: Un trabajo fallido conserva sus bloques y al reintentar solo genera los que faltan"""
+        # Un solo trabajador: los bloques van en orden y falla siempre el último
+        self.env['ir.config_parameter'].sudo().set_param('herbario.report_worker_count', 1)
+        job = self._create_job()
+
+        def fail_on_last(job, ids):
+            if len(self.calls) == 2:
+                raise ValueError('Fallo de prueba')
+            return self._render(job, ids)
+
+        with patch.object(HerbarioReportJob, '_render_chunk', fail_on_last):
+            with self.assertRaises(ValueError):
+                job._run()
+        self.assertEqual(sorted(job._get_parts()), [0, 1])
+        self.assertEqual(job.done_chunks, 2)
+
+        with patch.object(HerbarioReportJob, '_render_chunk', lambda job, ids: self._render(job, ids)):
+            job._run()
+
+        self.assertEqual(len(self.calls), 3, "Solo se renderiza el bloque que faltaba")
+        self.assertEqual(self.calls[-1], job._get_chunks()[2])
+        self.assertEqual(job.state, 'done')
+        self.assertEqual(_page_count(base64.b64decode(job.attachment_id.datas)), 7)
+
+        print("✅ Test 2 PASÓ: Reanudación tras un fallo")
+
+    def test_03_cron_marks_failure(self):
+        """Test: El cron deja el trabajo como fallido con el error y permite reintentarlo"""
+        job = self._create_job()
+
+        def broken(job, ids):
+            raise ValueError('Reporte roto')
+
+        with patch.object(HerbarioReportJob, '_render_chunk', broken):
+            job._cron_process_report_jobs()
+        self.assertEqual(job.state, 'failed')
+        self.assertIn('Reporte roto', job.error)
+        self.assertFalse(job.attachment_id)
+
+        job.action_retry()
+        self.assertEqual(job.state, 'queued')
+        self.assertFalse(job.error)
+
+        print("✅ Test 3 PASÓ: Fallo registrado y reintento")
+
+    def test_04_default_report_installed(self):
+        """Test: Sin elegir reporte, el trabajo usa la ficha de espécimen instalada con el módulo"""
+        default_report = self.env.ref('herbario_espoch.action_report_herbario_specimen')
+        action = self.env['herbario.report.job']._create_for_specimens(self.specimens[:2])
+        job = self.env['herbario.report.job'].browse(action['res_id'])
+        self.assertEqual(job.report_id, default_report)
+
+        # La plantilla se renderiza con los campos reales del espécimen y su QR activo
+        qr = self.env['herbario.qr.code']._get_or_create_active_qr(self.specimens[0])
+        self.env['herbario.collection.site'].create({
+            'specimen_id': self.specimens[0].id,
+            'numero_coleccion': 'KM-101',
+            'latitude': -1.67,
+            'longitude': -78.65,
+        })
+        html, _format = self.env['ir.actions.report']._render_qweb_html(default_report, self.specimens[0].ids)
+        html = html.decode()
+        self.assertIn(self.specimens[0].codigo_herbario, html)
+        self.assertIn('KM-101', html)
+        self.assertIn(qr.qr_svg.decode(), html)
+
+        print("✅ Test 4 PASÓ: Reporte de fichas por defecto")
@@ -1,4 +1,7 @@
+import psycopg2
+
 from odoo.tests import tagged
+from odoo.tools import mute_logger
 from odoo.exceptions import ValidationError
 from datetime import date, timedelta
 from .common import HerbarioTestCase
@@ -155,4 +158,24 @@ class TestSpecimen(HerbarioTestCase):
         self.assertTrue(audit_log, "Debe existir log de eliminación")
         self.assertIn(codigo, audit_log.description)
         
-        print(f"✅ Test 8 PASÓ: Eliminación auditada")
\ No newline at end of file
+        print(f"✅ Test 8 PASÓ: Eliminación auditada")
+
+    def test_09_single_primary_collection_site(self):
+        """Test: Marcar una ubicación como principal desmarca la anterior en una sola sentencia"""
+        specimen = self.env['herbario.specimen'].create({
+            'taxon_id': self.taxon.id,
+            'herbarium_id': self.herbarium.id,
+        })
+        Site = self.env['herbario.collection.site']
+        first = Site.create({'specimen_id': specimen.id, 'is_primary': True})
+        second = Site.create({'specimen_id': specimen.id, 'is_primary': True})
+        self.assertFalse(first.is_primary)
+        self.assertTrue(second.is_primary)
+
+        first.action_set_as_primary()
+        self.assertEqual(specimen.collection_site_ids.filtered('is_primary'), first)
+
+        with mute_logger('odoo.sql_db'), self.assertRaises(psycopg2.IntegrityError), self.env.cr.savepoint():
+            self.env.cr.execute("UPDATE herbario_collection_site SET is_primary = TRUE WHERE id = %s", (second.id,))
+
+        print("✅ Test 9 PASÓ: Una sola ubicación principal por espécimen")
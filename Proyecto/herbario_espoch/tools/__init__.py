@@ -0,0 +1,11 @@
+from . import worker_pool
+from . import iiif
+from . import derivative_cache
+from . import phash
+from . import image_processing
+from . import bulk_ingest
+from . import qr_render
+from . import coordinates
+from . import utm
+from . import gazetteer
+from . import label_sheet
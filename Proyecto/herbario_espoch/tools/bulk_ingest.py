@@ -0,0 +1,134 @@
+"""
+Ingesta masiva de fotografías de pliegos desde un ZIP o una carpeta local.
+
+- Lectura en flujo: los archivos se recorren uno a uno y sus bytes solo se leen
+  cuando el nombre ya coincidió con un espécimen o taxón.
+- Índice en memoria: códigos de herbario, números de cartulina y nombres científicos
+  se cargan una vez y cada nombre de archivo se resuelve con búsquedas en diccionarios.
+- Inspección en el pool: el hash y la cabecera de cada archivo se calculan en
+  procesos trabajadores (funciones de módulo sin ORM, como en worker_pool).
+"""
+import os
+import re
+import unicodedata
+import zipfile
+
+from . import image_processing
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.tif', '.tiff')
+
+# Varias tomas del mismo pliego: CHEP-0000001_2.jpg, 1234 (2).jpg, Miconia_crocea-b.jpg
+_VARIANT_SUFFIX_RE = re.compile(r'(?:\s*\(\d+\)|[\s_\-](?:\d{1,2}|[a-z]))$', re.IGNORECASE)
+_SEPARATORS_RE = re.compile(r'[^0-9a-z]+')
+
+
+def normalize_key(value):
+    """Clave comparable: sin tildes, en minúsculas y sin separadores ('CHEP-0000001' -> 'chep0000001')."""
+    value = unicodedata.normalize('NFKD', value or '').encode('ascii', 'ignore').decode()
+    return _SEPARATORS_RE.sub('', value.lower())
+
+
+def candidate_stems(filename):
+    """Nombres a probar para un archivo: el nombre completo y el nombre sin sufijo de toma."""
+    stem = os.path.splitext(os.path.basename(filename))[0].strip()
+    stems = [stem]
+    stripped = _VARIANT_SUFFIX_RE.sub('', stem).strip()
+    if stripped and stripped != stem:
+        stems.append(stripped)
+    return stems
+
+
+def is_image_name(path):
+    """Descarta carpetas de metadatos (__MACOSX), archivos ocultos y extensiones que no son imagen."""
+    parts = path.replace('\\', '/').split('/')
+    if '__MACOSX' in parts or parts[-1].startswith('.'):
+        return False
+    return parts[-1].lower().endswith(IMAGE_EXTENSIONS)
+
+
+def iter_zip(fileobj):
+    """Recorre un ZIP: (nombre, tamaño, lector). Los bytes se descomprimen al llamar al lector."""
+    with zipfile.ZipFile(fileobj) as archive:
+        for info in archive.infolist():
+            if info.is_dir() or not is_image_name(info.filename):
+                continue
+            yield info.filename, info.file_size, (lambda info=info: archive.read(info))
+
+
+def _read_file(path):
+    with open(path, 'rb') as image_file:
+        return image_file.read()
+
+
+def iter_directory(path):
+    """Recorre una carpeta (recursivamente y en orden): (ruta relativa, tamaño, lector)."""
+    for dirpath, dirnames, filenames in os.walk(path):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            full_path = os.path.join(dirpath, filename)
+            relative = os.path.relpath(full_path, path)
+            if not is_image_name(relative):
+                continue
+            yield relative, os.path.getsize(full_path), (lambda full_path=full_path: _read_file(full_path))
+
+
+def inspect_job(job):
+    """Trabajo del pool: ``(nombre, bytes)`` -> ``(nombre, cabecera, error)``."""
+    name, image_bytes = job
+    try:
+        return name, image_processing.read_image_header(image_bytes), None
+    except image_processing.ImageTooLargeError:
+        return name, None, 'supera el máximo de píxeles'
+    except image_processing.InvalidImageError:
+        return name, None, 'no es una imagen válida'
+
+
+class FilenameIndex:
+    """
+    Índice en memoria de nombres de archivo hacia especímenes y taxones.
+
+    ``specimens``: dicts con id, codigo_herbario, numero_cartulina y taxon_id (entero).
+    ``taxa``: dicts con id y name.
+    """
+
+    def __init__(self, specimens, taxa):
+        self.by_codigo = {}
+        self.by_cartulina = {}
+        self.by_taxon = {}
+        for specimen in specimens:
+            target = (specimen['id'], specimen['taxon_id'])
+            if specimen.get('codigo_herbario'):
+                self.by_codigo[normalize_key(specimen['codigo_herbario'])] = target
+            if specimen.get('numero_cartulina'):
+                self.by_cartulina.setdefault(specimen['numero_cartulina'], []).append(target)
+        for taxon in taxa:
+            if taxon.get('name'):
+                self.by_taxon.setdefault(normalize_key(taxon['name']), []).append((False, taxon['id']))
+
+    def _lookup(self, stem, mode):
+        if mode == 'cartulina':
+            # Solo nombres puramente numéricos: '1234_2' no debe leerse como la cartulina 12342
+            return self.by_cartulina.get(int(stem), []) if stem.isdigit() else []
+        key = normalize_key(stem)
+        if mode == 'codigo':
+            target = self.by_codigo.get(key)
+            return [target] if target else []
+        return self.by_taxon.get(key, [])
+
+    def match(self, filename, match_by='auto'):
+        """
+        Devuelve ``((specimen_id, taxon_id), None)`` o ``(None, motivo)``.
+        En modo 'auto' se prueba código, luego cartulina y por último nombre científico.
+        """
+        modes = ('codigo', 'cartulina', 'taxon') if match_by == 'auto' else (match_by,)
+        for stem in candidate_stems(filename):
+            for mode in modes:
+                targets = self._lookup(stem, mode)
+                if len(targets) > 1:
+                    return None, f'ambiguo: {len(targets)} registros coinciden por {mode}'
+                if targets:
+                    specimen_id, taxon_id = targets[0]
+                    if not taxon_id:
+                        return None, 'el espécimen no tiene taxón'
+                    return (specimen_id, taxon_id), None
+        return None, 'sin coincidencia'
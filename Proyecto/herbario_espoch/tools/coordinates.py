@@ -0,0 +1,175 @@
+"""
+Lectura de coordenadas geográficas escritas a mano.
+
+Acepta, mezclados en un mismo lote, los formatos de las libretas de campo:
+
+- Decimal con hemisferio: ``01.34S 78.40W`` (o con coma decimal: ``1,34S 78,40W``)
+- Grados, minutos y segundos (DMS): ``1°20'30"S 78°24'15"W``
+- Grados y minutos decimales (DDM): ``1°20.5'S 78°24.25'W``
+- Decimal con signo: ``-1.34, -78.40`` o ``-1,34 -78,40``
+
+El hemisferio puede ir antes o después del número y se admite ``O`` (oeste). Si el
+par viene como longitud-latitud (``78.40W 1.34S``) se reordena por los hemisferios.
+
+Las expresiones se compilan una vez al importar el módulo: cada texto se separa en
+componentes (grados, minutos, segundos, signo) y la conversión a grados decimales y
+la validación de rangos se hacen con NumPy sobre el lote completo. Un texto que no se
+puede leer o que queda fuera de rango da ``nan``.
+"""
+import re
+
+import numpy as np
+
+_NUMBER = r'\d{1,3}(?:[.,]\d+)?'
+_PART = r'\d{1,2}(?:[.,]\d+)?'
+_HEMISPHERE = r'[NSEWO]'
+
+
+def _component(prefix, hemisphere_first):
+    """Una coordenada (latitud o longitud) con el hemisferio opcional antes o después."""
+    number = (
+        rf'(?P<{prefix}_deg>{_NUMBER})\s*[°º]?\s*'
+        rf"(?:(?P<{prefix}_min>{_PART})\s*['′’]\s*)?"
+        rf'(?:(?P<{prefix}_sec>{_PART})\s*(?:"|″|”|\'\'|′′)\s*)?'
+    )
+    if hemisphere_first:
+        return rf'(?P<{prefix}_hem>{_HEMISPHERE})\s*{number}'
+    return rf'{number}(?P<{prefix}_hem>{_HEMISPHERE})?'
+
+
+# Hemisferio detrás ("1.34S") o delante ("S 1.34"), sin mezclar estilos en un par
+_PAIR_RES = tuple(
+    re.compile(rf'^\s*{_component("a", first)}\s*[,;/]?\s*{_component("b", first)}\s*$', re.IGNORECASE)
+    for first in (False, True)
+)
+_SINGLE_RES = tuple(
+    re.compile(rf'^\s*{_component("a", first)}\s*$', re.IGNORECASE)
+    for first in (False, True)
+)
+_SIGNED_PAIR_RE = re.compile(
+    rf'^\s*(?P<a>[+-]?{_NUMBER})\s*[,;/\s]\s*(?P<b>[+-]?{_NUMBER})\s*$'
+)
+_SIGNED_RE = re.compile(rf'^\s*(?P<a>[+-]?{_NUMBER})\s*$')
+
+_LAT_HEMISPHERES = frozenset('NS')
+_LON_HEMISPHERES = frozenset('EWO')
+_NEGATIVE = frozenset('SWO')
+
+# Componente que no se pudo leer: produce nan en el cálculo vectorizado
+_INVALID = (np.nan, 0.0, 0.0, 1.0, None)
+
+
+def _has_decimals(text):
+    return '.' in text or ',' in text
+
+
+def _number(text):
+    return float(text.replace(',', '.')) if text else 0.0
+
+
+def _split(match, prefix):
+    """Componentes de una coordenada: (grados, minutos, segundos, signo, hemisferio)."""
+    hemisphere = (match.group(f'{prefix}_hem') or '').upper() or None
+    deg_text, min_text, sec_text = (match.group(f'{prefix}_{part}') for part in ('deg', 'min', 'sec'))
+    # Solo el último componente escrito puede llevar decimales (1.5°20' no tiene sentido)
+    if (min_text and _has_decimals(deg_text)) or (sec_text and (not min_text or _has_decimals(min_text))):
+        return _INVALID
+    sign = -1.0 if hemisphere in _NEGATIVE else 1.0
+    return _number(deg_text), _number(min_text), _number(sec_text), sign, hemisphere
+
+
+def _signed(text):
+    value = _number(text.lstrip('+-'))
+    return value, 0.0, 0.0, (-1.0 if text.startswith('-') else 1.0), None
+
+
+def _to_decimal(components, limit):
+    """Grados decimales de una lista de componentes, con nan donde no son válidos."""
+    if not components:
+        return np.empty(0)
+    deg, minutes, seconds, sign = np.array([component[:4] for component in components], dtype=float).T
+    value = sign * (deg + minutes / 60.0 + seconds / 3600.0)
+    valid = (minutes < 60) & (seconds < 60) & (np.abs(value) <= limit)
+    return np.where(valid, value, np.nan)
+
+
+def parse_pairs(texts):
+    """
+    Lee pares latitud/longitud. Devuelve dos arrays ``float`` del largo de ``texts``
+    (latitud y longitud en grados decimales) con ``nan`` en los textos no válidos.
+    """
+    texts = list(texts)
+    lat_parts = []
+    lon_parts = []
+    for text in texts:
+        first = second = _INVALID
+        if text and isinstance(text, str):
+            match = _PAIR_RES[0].match(text) or _PAIR_RES[1].match(text)
+            if match:
+                first, second = _split(match, 'a'), _split(match, 'b')
+                if first[4] in _LON_HEMISPHERES and second[4] in _LAT_HEMISPHERES:
+                    first, second = second, first
+                if first[4] in _LON_HEMISPHERES or second[4] in _LAT_HEMISPHERES:
+                    first = second = _INVALID
+            else:
+                match = _SIGNED_PAIR_RE.match(text)
+                if match:
+                    first, second = _signed(match.group('a')), _signed(match.group('b'))
+        lat_parts.append(first)
+        lon_parts.append(second)
+    return _to_decimal(lat_parts, 90.0), _to_decimal(lon_parts, 180.0)
+
+
+def parse_values(texts, axis='lat'):
+    """
+    Lee coordenadas sueltas de un eje (``'lat'`` o ``'lon'``): ``-1,34``, ``1.34S``,
+    ``1°20'30"S``... Devuelve un array ``float`` con ``nan`` en los textos no válidos.
+    """
+    allowed = _LAT_HEMISPHERES if axis == 'lat' else _LON_HEMISPHERES
+    parts = []
+    for text in texts:
+        component = _INVALID
+        if text and isinstance(text, str):
+            match = _SIGNED_RE.match(text)
+            if match:
+                component = _signed(match.group('a'))
+            else:
+                match = _SINGLE_RES[0].match(text) or _SINGLE_RES[1].match(text)
+                if match:
+                    component = _split(match, 'a')
+                    if component[4] and component[4] not in allowed:
+                        component = _INVALID
+        parts.append(component)
+    return _to_decimal(parts, 90.0 if axis == 'lat' else 180.0)
+
+
+def format_pair(latitude, longitude, digits=4):
+    """Texto ``01.3400S 78.4000W`` de un par en grados decimales."""
+    return (
+        f"{abs(latitude):.{digits}f}{'S' if latitude < 0 else 'N'} "
+        f"{abs(longitude):.{digits}f}{'W' if longitude < 0 else 'E'}"
+    )
+
+
+# Las claves de los puntos son enteros en diezmillonésimas de grado: no dependen de la
+# precisión con la que se redondeó cada punto y caben en un entero de 32 bits
+KEY_SCALE = 10 ** 7
+
+
+def snap(latitude, longitude, precision=5):
+    """
+    Redondea puntos a ``precision`` decimales (0 a 7; 5 decimales son ~1 m). Devuelve
+    ``(latitudes, longitudes, claves de latitud, claves de longitud)``: dos puntos que
+    quedan en el mismo sitio al redondear tienen las mismas claves.
+    """
+    precision = min(max(int(precision), 0), 7)
+    latitude = np.round(np.asarray(latitude, dtype=float), precision)
+    longitude = np.round(np.asarray(longitude, dtype=float), precision)
+    # 180 y -180 son el mismo meridiano
+    longitude = np.where(longitude >= 180.0, longitude - 360.0, longitude)
+    return (
+        latitude,
+        longitude,
+        np.rint(latitude * KEY_SCALE).astype(np.int64),
+        np.rint(longitude * KEY_SCALE).astype(np.int64),
+    )
@@ -0,0 +1,161 @@
+"""
+Caché en disco de derivados de imagen generados bajo demanda.
+
+- Clave: hash del archivo original + parámetros de la transformación ya normalizados,
+  así dos URLs equivalentes comparten la misma entrada.
+- LRU: cada acierto actualiza el mtime del archivo; al superar el tope se borran
+  las entradas menos usadas hasta quedar por debajo del LOW_WATERMARK.
+- Coalescencia: un cerrojo por clave (flock, válido entre los workers de Odoo y sus
+  hilos) garantiza que una imagen popular se redimensiona una sola vez; el resto de
+  peticiones espera y lee el resultado.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: solo coalescencia dentro del proceso
+    fcntl = None
+
+_logger = logging.getLogger(__name__)
+
+# Tras una expulsión la caché queda al 90 % del tope para no expulsar en cada escritura
+LOW_WATERMARK = 0.9
+# Cada cuántas escrituras de este proceso se comprueba el tamaño total
+EVICT_EVERY = 50
+LOCK_SUFFIX = '.lock'
+
+
+class DerivativeCache:
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._writes = 0
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    @staticmethod
+    def make_key(file_hash, **params):
+        """Clave estable a partir del hash del original y los parámetros de la transformación."""
+        parts = [file_hash] + [f'{name}={params[name]}' for name in sorted(params)]
+        return hashlib.sha256('|'.join(parts).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def _thread_lock(self, key):
+        with self._locks_guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _read_hit(self, path):
+        try:
+            with open(path, 'rb') as cached:
+                content = cached.read()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)  # marca de uso para el LRU
+        except OSError:
+            pass
+        return content
+
+    def get_or_create(self, key, producer):
+        """Devuelve el derivado cacheado o lo genera con ``producer()`` una sola vez."""
+        path = self._path(key)
+        content = self._read_hit(path)
+        if content is not None:
+            return content
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._thread_lock(key):
+            with open(path + LOCK_SUFFIX, 'a') as lock_file:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    # Otra petición pudo generarlo mientras esperábamos el cerrojo
+                    content = self._read_hit(path)
+                    if content is not None:
+                        return content
+                    content = producer()
+                    self._write(path, content)
+                finally:
+                    if fcntl:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        with self._locks_guard:
+            self._locks.pop(key, None)
+
+        self._writes += 1
+        if self._writes % EVICT_EVERY == 0:
+            self.evict()
+        return content
+
+    def _write(self, path, content):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                tmp_file.write(content)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def _entries(self):
+        if not os.path.isdir(self.root):
+            return []
+        entries = []
+        for bucket in os.scandir(self.root):
+            if not bucket.is_dir():
+                continue
+            for entry in os.scandir(bucket.path):
+                if entry.name.endswith(LOCK_SUFFIX) or entry.name.startswith('.tmp-'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def evict(self):
+        """Borra las entradas menos usadas si la caché supera el tope. Devuelve los bytes liberados."""
+        entries = self._entries()
+        total = sum(size for _mtime, size, _path in entries)
+        if total <= self.max_bytes:
+            return 0
+        target = self.max_bytes * LOW_WATERMARK
+        freed = 0
+        for _mtime, size, path in sorted(entries):
+            if total - freed <= target:
+                break
+            try:
+                os.unlink(path)
+                freed += size
+            except FileNotFoundError:
+                continue
+            lock_path = path + LOCK_SUFFIX
+            if os.path.exists(lock_path):
+                try:
+                    os.unlink(lock_path)
+                except OSError:
+                    pass
+        _logger.info("Caché de derivados: liberados %s bytes (total %s, tope %s)", freed, total, self.max_bytes)
+        return freed
+
+
+_caches = {}
+_caches_guard = threading.Lock()
+
+
+def get_cache(root, max_bytes):
+    """Una instancia por directorio y proceso; el tope se actualiza si cambia la configuración."""
+    with _caches_guard:
+        cache = _caches.get(root)
+        if cache is None:
+            cache = _caches[root] = DerivativeCache(root, max_bytes)
+        cache.max_bytes = max_bytes
+        return cache
@@ -0,0 +1,106 @@
+"""
+Búsqueda del punto conocido más cercano para geocodificar sitios de colección.
+
+Los puntos (centroides de vecindades y localidades) se guardan como vectores unitarios
+en 3D: la distancia euclídea entre ellos (la cuerda) ordena igual que la distancia
+sobre la esfera y no hay saltos en el antimeridiano ni cerca de los polos. El índice
+es un árbol k-d de NumPy con hojas de varios puntos; cada consulta recorre solo las
+ramas que pueden contener un punto más cercano que el mejor encontrado.
+"""
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def to_unit_vectors(latitude, longitude):
+    """Arrays de grados decimales -> array (n, 3) de vectores unitarios."""
+    phi = np.radians(np.asarray(latitude, dtype=float))
+    lam = np.radians(np.asarray(longitude, dtype=float))
+    cos_phi = np.cos(phi)
+    return np.column_stack((cos_phi * np.cos(lam), cos_phi * np.sin(lam), np.sin(phi)))
+
+
+def centroids(groups, latitude, longitude):
+    """
+    Centroide esférico por grupo: promedia los vectores unitarios de cada grupo.
+    Devuelve ``(grupos únicos, vectores unitarios de sus centroides)``.
+    """
+    vectors = to_unit_vectors(latitude, longitude)
+    keys, inverse = np.unique(np.asarray(groups), return_inverse=True)
+    sums = np.zeros((len(keys), 3))
+    np.add.at(sums, inverse, vectors)
+    norms = np.linalg.norm(sums, axis=1, keepdims=True)
+    return keys, sums / np.where(norms == 0, 1.0, norms)
+
+
+def chord_to_km(chord):
+    """Longitud de la cuerda entre vectores unitarios -> distancia sobre la Tierra en km."""
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(np.asarray(chord) / 2, 0.0, 1.0))
+
+
+class KDTree:
+    """Árbol k-d para el vecino más cercano sobre un array (n, k) de puntos."""
+
+    def __init__(self, points, leaf_size=16):
+        self.points = np.asarray(points, dtype=float)
+        self.leaf_size = max(1, leaf_size)
+        # Nodo interno: (eje, corte, hijo izquierdo, hijo derecho); hoja: (None, None, índices, None)
+        self.nodes = []
+        if len(self.points):
+            self._build(np.arange(len(self.points)))
+
+    def __len__(self):
+        return len(self.points)
+
+    def _build(self, indices):
+        node_id = len(self.nodes)
+        self.nodes.append(None)
+        if len(indices) <= self.leaf_size:
+            self.nodes[node_id] = (None, None, indices, None)
+            return node_id
+        points = self.points[indices]
+        axis = int(np.argmax(points.max(axis=0) - points.min(axis=0)))
+        order = np.argsort(points[:, axis], kind='stable')
+        middle = len(indices) // 2
+        split = points[order[middle], axis]
+        left = self._build(indices[order[:middle]])
+        right = self._build(indices[order[middle:]])
+        self.nodes[node_id] = (axis, split, left, right)
+        return node_id
+
+    def _query_one(self, point):
+        best_index, best_distance = -1, np.inf
+        # (nodo, cota inferior de la distancia al cuadrado hasta cualquier punto del nodo)
+        stack = [(0, 0.0)]
+        while stack:
+            node_id, bound = stack.pop()
+            if bound >= best_distance:
+                continue
+            axis, split, left, right = self.nodes[node_id]
+            if axis is None:
+                distances = ((self.points[left] - point) ** 2).sum(axis=1)
+                nearest = int(np.argmin(distances))
+                if distances[nearest] < best_distance:
+                    best_index, best_distance = int(left[nearest]), float(distances[nearest])
+                continue
+            offset = point[axis] - split
+            near, far = (left, right) if offset < 0 else (right, left)
+            # Primero el lado cercano: se apila al final para desapilarlo antes
+            stack.append((far, max(bound, offset * offset)))
+            stack.append((near, bound))
+        return best_index, np.sqrt(best_distance)
+
+    def query(self, points):
+        """
+        Vecino más cercano de cada punto. Devuelve ``(índices, distancias)``; con el
+        árbol vacío los índices son -1 y las distancias ``inf``.
+        """
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+        indices = np.full(len(points), -1, dtype=int)
+        distances = np.full(len(points), np.inf)
+        if not self.nodes:
+            return indices, distances
+        for row, point in enumerate(points):
+            if np.isfinite(point).all():
+                indices[row], distances[row] = self._query_one(point)
+        return indices, distances
@@ -0,0 +1,401 @@
+"""
+IIIF Image API 3.0 y Presentation API 3.0 para las imágenes del herbario.
+
+- Pirámide de teselas pre-generada en disco (una por hash de archivo): las peticiones
+  que coinciden con una tesela se sirven leyendo un JPEG pequeño, sin tocar el original.
+- Cualquier otra petición {region}/{size}/{rotation}/{quality}.{format} se renderiza
+  desde el original (en JPEG con draft() para decodificar ya reducido) y se guarda en
+  la caché de derivados, de modo que cada transformación se calcula una sola vez.
+- Todo se expresa sobre la imagen enderezada según su orientación EXIF: las
+  dimensiones de info.json, la pirámide y los recortes del original.
+- Constructores de info.json y del manifiesto de presentación por espécimen.
+"""
+import math
+import os
+import shutil
+import tempfile
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+RESAMPLE_LANCZOS = Image.Resampling.LANCZOS if hasattr(Image, 'Resampling') else Image.ANTIALIAS
+
+IMAGE_CONTEXT = 'http://iiif.io/api/image/3/context.json'
+PRESENTATION_CONTEXT = 'http://iiif.io/api/presentation/3/context.json'
+IMAGE_PROFILE = 'level2'
+
+DEFAULT_TILE_SIZE = 512
+TILE_QUALITY = 85
+COMPLETE_MARKER = '.complete'
+
+# Límites anunciados en info.json para peticiones que no son teselas
+MAX_WIDTH = 4096
+MAX_HEIGHT = 4096
+MAX_AREA = MAX_WIDTH * MAX_HEIGHT
+
+# Orientación EXIF; las 5 a 8 giran 90° (fotos verticales de móvil) e intercambian ancho y alto
+EXIF_ORIENTATION_TAG = 0x0112
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+QUALITIES = ('default', 'color', 'gray', 'bitonal')
+FORMATS = {
+    'jpg': ('JPEG', 'image/jpeg'),
+    'png': ('PNG', 'image/png'),
+    'webp': ('WEBP', 'image/webp'),
+}
+
+
+class IIIFError(ValueError):
+    """Parámetro IIIF inválido; el controlador responde 400."""
+
+
+# ==================== PIRÁMIDE DE TESELAS ====================
+
+def oriented_size(image):
+    """(ancho, alto) de la imagen ya enderezada según el EXIF, leyendo solo la cabecera."""
+    if image.getexif().get(EXIF_ORIENTATION_TAG) in TRANSPOSED_ORIENTATIONS:
+        return image.height, image.width
+    return image.size
+
+
+def scale_factors(width, height, tile_size):
+    """Factores 1, 2, 4... hasta que la imagen reducida cabe en una sola tesela."""
+    factors = [1]
+    while math.ceil(max(width, height) / factors[-1]) > tile_size:
+        factors.append(factors[-1] * 2)
+    return factors
+
+
+def content_dir(root, file_hash):
+    """Directorio de todo lo derivado de un contenido (una pirámide por tamaño de tesela)."""
+    return os.path.join(root, file_hash[:2], file_hash)
+
+
+def pyramid_dir(root, file_hash, tile_size):
+    """Directorio de la pirámide. Va por hash: imágenes idénticas comparten teselas."""
+    return os.path.join(content_dir(root, file_hash), str(tile_size))
+
+
+def tile_path(directory, scale, col, row):
+    return os.path.join(directory, str(scale), f'{col}_{row}.jpg')
+
+
+def has_pyramid(directory):
+    return bool(directory) and os.path.exists(os.path.join(directory, COMPLETE_MARKER))
+
+
+def generate_pyramid(image, directory, tile_size=DEFAULT_TILE_SIZE):
+    """
+    Corta la imagen en teselas de tile_size px para cada factor de escala; cada nivel
+    se reduce a partir del anterior. Se escribe en un directorio temporal que se
+    renombra al terminar, así nunca se sirve una pirámide a medias.
+    Devuelve False si la pirámide ya existía.
+    """
+    if has_pyramid(directory):
+        return False
+    parent = os.path.dirname(directory)
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=parent)
+    try:
+        width, height = image.size
+        level = image if image.mode == 'RGB' else image.convert('RGB')
+        for scale in scale_factors(width, height, tile_size):
+            if scale > 1:
+                level = level.resize((math.ceil(width / scale), math.ceil(height / scale)), RESAMPLE_LANCZOS)
+            os.makedirs(os.path.join(tmp_dir, str(scale)))
+            for row in range(math.ceil(level.height / tile_size)):
+                for col in range(math.ceil(level.width / tile_size)):
+                    box = (
+                        col * tile_size,
+                        row * tile_size,
+                        min((col + 1) * tile_size, level.width),
+                        min((row + 1) * tile_size, level.height),
+                    )
+                    level.crop(box).save(tile_path(tmp_dir, scale, col, row), format='JPEG', quality=TILE_QUALITY)
+        open(os.path.join(tmp_dir, COMPLETE_MARKER), 'w').close()
+        if os.path.exists(directory):
+            # Otro proceso terminó antes la misma pirámide (mismo hash)
+            shutil.rmtree(tmp_dir)
+            return False
+        os.rename(tmp_dir, directory)
+        return True
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+def match_tile(region, size, width, height, tile_size):
+    """
+    Si la petición (región y tamaño ya resueltos) es exactamente una tesela de la
+    pirámide devuelve (escala, columna, fila); si no, None.
+    """
+    x, y, w, h = region
+    for scale in scale_factors(width, height, tile_size):
+        span = tile_size * scale
+        if x % span or y % span:
+            continue
+        if (w, h) != (min(span, width - x), min(span, height - y)):
+            continue
+        if size == (math.ceil(w / scale), math.ceil(h / scale)):
+            return scale, x // span, y // span
+    return None
+
+
+# ==================== PARÁMETROS DE LA PETICIÓN ====================
+
+def _numbers(value, cast):
+    try:
+        numbers = [cast(part) for part in value.split(',')]
+    except ValueError:
+        raise IIIFError(f"Valor numérico inválido: {value}")
+    if any(n < 0 for n in numbers):
+        raise IIIFError(f"Los valores no pueden ser negativos: {value}")
+    return numbers
+
+
+def parse_region(region, width, height):
+    """Devuelve (x, y, w, h) en píxeles del original, recortado a los bordes."""
+    if region == 'full':
+        return 0, 0, width, height
+    if region == 'square':
+        side = min(width, height)
+        return (width - side) // 2, (height - side) // 2, side, side
+
+    if region.startswith('pct:'):
+        values = _numbers(region[4:], float)
+        if len(values) != 4:
+            raise IIIFError(f"Región inválida: {region}")
+        x, y, w, h = (
+            round(values[0] * width / 100), round(values[1] * height / 100),
+            round(values[2] * width / 100), round(values[3] * height / 100),
+        )
+    else:
+        values = _numbers(region, int)
+        if len(values) != 4:
+            raise IIIFError(f"Región inválida: {region}")
+        x, y, w, h = values
+
+    if w <= 0 or h <= 0 or x >= width or y >= height:
+        raise IIIFError(f"La región queda fuera de la imagen: {region}")
+    return x, y, min(w, width - x), min(h, height - y)
+
+
+def _fit_limits(w, h):
+    """Reduce (w, h) manteniendo proporción hasta cumplir maxWidth/maxHeight/maxArea."""
+    ratio = min(1.0, MAX_WIDTH / w, MAX_HEIGHT / h, math.sqrt(MAX_AREA / (w * h)))
+    return max(1, int(w * ratio)), max(1, int(h * ratio))
+
+
+def parse_size(size, region_width, region_height):
+    """Devuelve (ancho, alto) de salida según la sintaxis de tamaño de IIIF 3.0."""
+    upscale = size.startswith('^')
+    if upscale:
+        size = size[1:]
+
+    if size == 'max':
+        w, h = region_width, region_height
+        if upscale:
+            w, h = MAX_WIDTH, round(region_height * MAX_WIDTH / region_width)
+        return _fit_limits(w, h)
+
+    if size.startswith('pct:'):
+        pct = _numbers(size[4:], float)[0]
+        w, h = round(region_width * pct / 100), round(region_height * pct / 100)
+    elif size.startswith('!'):
+        values = _numbers(size[1:], int)
+        if len(values) != 2:
+            raise IIIFError(f"Tamaño inválido: {size}")
+        ratio = min(values[0] / region_width, values[1] / region_height)
+        if not upscale:
+            ratio = min(ratio, 1.0)
+        w, h = round(region_width * ratio), round(region_height * ratio)
+    elif size.endswith(','):
+        w = _numbers(size[:-1], int)[0]
+        h = round(region_height * w / region_width)
+    elif size.startswith(','):
+        h = _numbers(size[1:], int)[0]
+        w = round(region_width * h / region_height)
+    else:
+        values = _numbers(size, int)
+        if len(values) != 2:
+            raise IIIFError(f"Tamaño inválido: {size}")
+        w, h = values
+
+    if w < 1 or h < 1:
+        raise IIIFError(f"El tamaño resultante es vacío: {size}")
+    if not upscale and (w > region_width or h > region_height):
+        raise IIIFError(f"Ampliar la imagen requiere el prefijo '^': {size}")
+    if w > MAX_WIDTH or h > MAX_HEIGHT or w * h > MAX_AREA:
+        raise IIIFError(f"El tamaño supera los límites del servidor: {size}")
+    return w, h
+
+
+def parse_rotation(rotation):
+    """Devuelve (espejo, grados) con grados en [0, 360]."""
+    mirror = rotation.startswith('!')
+    try:
+        degrees = float(rotation[1:] if mirror else rotation)
+    except ValueError:
+        raise IIIFError(f"Rotación inválida: {rotation}")
+    if not 0 <= degrees <= 360:
+        raise IIIFError(f"La rotación debe estar entre 0 y 360: {rotation}")
+    return mirror, degrees % 360
+
+
+def parse_quality_format(quality_format):
+    quality, _sep, fmt = quality_format.rpartition('.')
+    if quality not in QUALITIES or fmt not in FORMATS:
+        raise IIIFError(f"Calidad o formato no soportado: {quality_format}")
+    return quality, fmt
+
+
+# ==================== RENDER ====================
+
+def render(image, region, size, mirror=False, rotation=0, quality='default', fmt='jpg'):
+    """
+    Renderiza una petición desde el original abierto con Image.open (aún sin decodificar).
+    En JPEG, draft() decodifica directamente a 1/2, 1/4 o 1/8 cuando basta para el tamaño
+    pedido, lo que evita cargar en memoria el original completo. La región se refiere a
+    la imagen enderezada, como las teselas: el original se endereza antes de recortarlo.
+    """
+    orientation = image.getexif().get(EXIF_ORIENTATION_TAG)
+    full_width, full_height = oriented_size(image)
+    x, y, w, h = region
+    if image.format == 'JPEG':
+        draft_size = (math.ceil(full_width * size[0] / w), math.ceil(full_height * size[1] / h))
+        if orientation in TRANSPOSED_ORIENTATIONS:
+            draft_size = draft_size[::-1]
+        image.draft('RGB', draft_size)
+    if orientation and orientation != 1:
+        image = ImageOps.exif_transpose(image)
+    scale_x = image.width / full_width
+    scale_y = image.height / full_height
+    box = (
+        round(x * scale_x), round(y * scale_y),
+        max(round((x + w) * scale_x), round(x * scale_x) + 1),
+        max(round((y + h) * scale_y), round(y * scale_y) + 1),
+    )
+    result = image.crop(box).resize(size, RESAMPLE_LANCZOS)
+
+    if mirror:
+        result = ImageOps.mirror(result)
+    if rotation:
+        # IIIF rota en sentido horario; Pillow en antihorario
+        has_alpha = fmt != 'jpg'
+        result = result.convert('RGBA' if has_alpha else 'RGB')
+        result = result.rotate(-rotation, expand=True, fillcolor=(0, 0, 0, 0) if has_alpha else (255, 255, 255))
+
+    if quality == 'gray':
+        result = result.convert('L')
+    elif quality == 'bitonal':
+        result = result.convert('1')
+    elif result.mode not in ('RGB', 'RGBA') or (fmt == 'jpg' and result.mode != 'RGB'):
+        result = result.convert('RGB')
+
+    pil_format, mimetype = FORMATS[fmt]
+    output = BytesIO()
+    result.save(output, format=pil_format)
+    return output.getvalue(), mimetype
+
+
+def handle_request(open_original, width, height, pyramid, tile_size, region, size, rotation, quality_format,
+                   cache=None, file_hash=None):
+    """
+    Resuelve una petición de la Image API. ``open_original`` es una función que abre el
+    original con Image.open (solo se llama si la petición no es una tesela pre-generada
+    ni está en ``cache``, una DerivativeCache). Devuelve (contenido, tipo MIME).
+    """
+    region_box = parse_region(region, width, height)
+    size_wh = parse_size(size, region_box[2], region_box[3])
+    mirror, degrees = parse_rotation(rotation)
+    quality, fmt = parse_quality_format(quality_format)
+
+    if has_pyramid(pyramid) and not mirror and not degrees and quality in ('default', 'color') and fmt == 'jpg':
+        tile = match_tile(region_box, size_wh, width, height, tile_size)
+        if tile:
+            path = tile_path(pyramid, *tile)
+            if os.path.exists(path):
+                with open(path, 'rb') as tile_file:
+                    return tile_file.read(), 'image/jpeg'
+
+    def produce():
+        with open_original() as image:
+            return render(image, region_box, size_wh, mirror, degrees, quality, fmt)[0]
+
+    if cache is None or not file_hash:
+        return produce(), FORMATS[fmt][1]
+    # Parámetros ya normalizados: 'full/max' y '0,0,W,H/W,H' comparten entrada
+    key = cache.make_key(
+        file_hash, region=region_box, size=size_wh, mirror=mirror,
+        rotation=degrees, quality=quality, format=fmt)
+    return cache.get_or_create(key, produce), FORMATS[fmt][1]
+
+
+# ==================== DOCUMENTOS JSON-LD ====================
+
+def build_info(service_id, width, height, tile_size):
+    """info.json de la Image API 3.0 para una imagen."""
+    return {
+        '@context': IMAGE_CONTEXT,
+        'id': service_id,
+        'type': 'ImageService3',
+        'protocol': 'http://iiif.io/api/image',
+        'profile': IMAGE_PROFILE,
+        'width': width,
+        'height': height,
+        'maxWidth': MAX_WIDTH,
+        'maxHeight': MAX_HEIGHT,
+        'maxArea': MAX_AREA,
+        'tiles': [{
+            'width': tile_size,
+            'height': tile_size,
+            'scaleFactors': scale_factors(width, height, tile_size),
+        }],
+        'extraQualities': ['gray', 'bitonal'],
+        'extraFormats': ['webp'],
+        'extraFeatures': ['mirroring', 'rotationArbitrary', 'regionSquare', 'sizeUpscaling'],
+    }
+
+
+def build_canvas(canvas_id, service_id, width, height, label):
+    """Canvas de presentación con la imagen pintada y su servicio IIIF."""
+    return {
+        'id': canvas_id,
+        'type': 'Canvas',
+        'label': {'es': [label]},
+        'width': width,
+        'height': height,
+        'items': [{
+            'id': f'{canvas_id}/page',
+            'type': 'AnnotationPage',
+            'items': [{
+                'id': f'{canvas_id}/annotation',
+                'type': 'Annotation',
+                'motivation': 'painting',
+                'target': canvas_id,
+                'body': {
+                    'id': f'{service_id}/full/max/0/default.jpg',
+                    'type': 'Image',
+                    'format': 'image/jpeg',
+                    'width': width,
+                    'height': height,
+                    'service': [{'id': service_id, 'type': 'ImageService3', 'profile': IMAGE_PROFILE}],
+                },
+            }],
+        }],
+    }
+
+
+def build_manifest(manifest_id, label, metadata, canvases):
+    """Manifiesto de la Presentation API 3.0. ``metadata`` es una lista de (etiqueta, valor)."""
+    return {
+        '@context': PRESENTATION_CONTEXT,
+        'id': manifest_id,
+        'type': 'Manifest',
+        'label': {'es': [label]},
+        'metadata': [
+            {'label': {'es': [key]}, 'value': {'none': [str(value)]}}
+            for key, value in metadata if value
+        ],
+        'items': canvases,
+    }
@@ -0,0 +1,365 @@
+"""
+Procesamiento de imágenes del herbario.
+
+Funciones puras (sin ORM) para que puedan ejecutarse en los procesos del pool:
+- read_image_header: metadatos baratos leyendo solo la cabecera del archivo.
+- process_image: miniaturas, EXIF, escalera de derivados WebP/AVIF, marcador LQIP y
+  pirámide de teselas IIIF, el trabajo pesado que se hace en segundo plano.
+
+Memoria acotada: el original se lee desde su ruta en el filestore, el hash se calcula
+por bloques y solo hay un mapa de bits vivo a la vez, que se reduce en su sitio.
+"""
+import base64
+import binascii
+import hashlib
+import json
+import tempfile
+from datetime import datetime
+from io import BytesIO
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+from PIL.ExifTags import TAGS
+
+from . import iiif, phash
+
+# Mapear formato de Pillow a tipo MIME
+FORMAT_TO_MIME = {
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+    'TIFF': 'image/tiff',
+}
+
+# Miniaturas generadas para cada imagen: campo -> lado máximo en px
+THUMBNAIL_SIZES = {
+    'thumbnail': 80,
+    'thumbnail_medium': 200,
+}
+
+# Marcador de baja calidad (LQIP): lado máximo en px y calidad JPEG. Ocupa unos cientos
+# de bytes y se incrusta como data URI para pintar algo antes de que llegue la imagen.
+PLACEHOLDER_SIZE = 16
+PLACEHOLDER_QUALITY = 40
+
+# Escalera de derivados por defecto (lado máximo en px)
+DEFAULT_DERIVATIVE_SIZES = (160, 480, 1024, 2048)
+
+# Formatos de derivados: clave -> formato de Pillow, MIME y parámetros de codificación
+DERIVATIVE_FORMATS = {
+    'webp': {'format': 'WEBP', 'mime': 'image/webp', 'params': {'quality': 80, 'method': 4}},
+    'avif': {'format': 'AVIF', 'mime': 'image/avif', 'params': {'quality': 60}},
+}
+
+# Orden de preferencia al negociar con la cabecera Accept (el más compacto primero)
+DERIVATIVE_FORMAT_PREFERENCE = ('avif', 'webp')
+
+RESAMPLE_LANCZOS = Image.Resampling.LANCZOS if hasattr(Image, 'Resampling') else Image.ANTIALIAS
+
+EXIF_DATE_FORMAT = '%Y:%m:%d %H:%M:%S'
+
+# Tope de píxeles decodificados: el mismo umbral en el que Pillow avisa de una posible
+# bomba de descompresión. Por encima la imagen se rechaza antes de decodificarla.
+MAX_IMAGE_PIXELS = 89478485
+# Bloques de lectura para el hash y para decodificar base64 (múltiplo de 4 caracteres)
+STREAM_CHUNK_SIZE = 1024 * 1024
+# Por encima de este tamaño el original decodificado desde base64 se vuelca a disco
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+
+class InvalidImageError(Exception):
+    """El archivo no es una imagen que Pillow pueda reconocer."""
+
+
+class ImageTooLargeError(InvalidImageError):
+    """La imagen supera MAX_IMAGE_PIXELS una vez decodificada."""
+
+
+def open_image(source):
+    """
+    Abre ``source`` (ruta, archivo abierto o bytes) sin decodificar los píxeles y
+    comprueba el tope de píxeles a partir de la cabecera.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = BytesIO(source)
+    try:
+        # Image.open es perezoso: solo lee la cabecera, los píxeles se decodifican al usarlos.
+        image = Image.open(source)
+    except Image.DecompressionBombError as e:
+        raise ImageTooLargeError(str(e))
+    except UnidentifiedImageError as e:
+        raise InvalidImageError(str(e))
+    if image.width * image.height > MAX_IMAGE_PIXELS:
+        image.close()
+        raise ImageTooLargeError(
+            f'{image.width}x{image.height} px supera el máximo de {MAX_IMAGE_PIXELS} píxeles'
+        )
+    return image
+
+
+def hash_stream(fileobj):
+    """SHA-256 y tamaño de un archivo leyéndolo por bloques; lo deja de nuevo al principio."""
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in iter(lambda: fileobj.read(STREAM_CHUNK_SIZE), b''):
+        digest.update(chunk)
+        size += len(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest(), size
+
+
+def spool_base64(image_data_b64):
+    """
+    Decodifica base64 por bloques en un archivo temporal (en memoria hasta SPOOL_MAX_SIZE,
+    en disco por encima), sin crear una segunda copia completa del original.
+    """
+    if isinstance(image_data_b64, str):
+        image_data_b64 = image_data_b64.encode()
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    try:
+        view = memoryview(image_data_b64)
+        for start in range(0, len(view), STREAM_CHUNK_SIZE):
+            spool.write(base64.b64decode(view[start:start + STREAM_CHUNK_SIZE]))
+    except binascii.Error:
+        # base64 con saltos de línea: los bloques no caen en múltiplos de 4, se decodifica de una vez
+        spool.seek(0)
+        spool.truncate()
+        spool.write(base64.b64decode(image_data_b64))
+    spool.seek(0)
+    return spool
+
+
+def read_image_header(source):
+    """
+    Devuelve tamaño, hash SHA-256, dimensiones y tipo MIME sin decodificar los píxeles.
+    Las dimensiones son las de la imagen enderezada según el EXIF, como la pirámide IIIF.
+    ``source`` es una ruta, un archivo abierto o bytes; el hash se calcula por bloques.
+    Es lo bastante barato para ejecutarse dentro de la petición HTTP (onchange, create).
+    """
+    if isinstance(source, str):
+        with open(source, 'rb') as fileobj:
+            return read_image_header(fileobj)
+    if isinstance(source, (bytes, bytearray)):
+        source = BytesIO(source)
+    file_hash, file_size = hash_stream(source)
+    image = open_image(source)
+    width, height = iiif.oriented_size(image)
+    return {
+        'file_size': file_size,
+        'image_width': width,
+        'image_height': height,
+        'file_hash': file_hash,
+        'mime_type': FORMAT_TO_MIME.get(image.format, 'application/octet-stream'),
+    }
+
+
+def extract_exif(image):
+    """Extrae cámara y fecha de captura del EXIF como diccionario, o None."""
+    try:
+        exif = image._getexif() if hasattr(image, '_getexif') else None
+        if not exif:
+            return None
+        exif_dict = {}
+        for tag_id, value in exif.items():
+            tag = TAGS.get(tag_id, tag_id)
+            if tag in ['Make', 'Model', 'DateTime', 'DateTimeOriginal']:
+                exif_dict[tag.lower()] = str(value).strip('\x00 ')
+
+        # Formar el nombre de la cámara
+        camera_parts = [exif_dict[key] for key in ('make', 'model') if exif_dict.get(key)]
+        if camera_parts:
+            exif_dict['camera'] = ' '.join(camera_parts)
+
+        # Fecha (EXIF usa 'YYYY:MM:DD HH:MM:SS')
+        raw_date = exif_dict.get('datetimeoriginal') or exif_dict.get('datetime')
+        if raw_date:
+            try:
+                exif_dict['date_taken'] = datetime.strptime(raw_date, EXIF_DATE_FORMAT).strftime('%Y-%m-%d %H:%M:%S')
+            except ValueError:
+                pass
+        return exif_dict or None
+    except Exception:
+        return None
+
+
+def avif_supported():
+    """Indica si Pillow puede codificar AVIF (Pillow >= 11.2 o el plugin pillow-avif-plugin)."""
+    try:
+        import pillow_avif  # noqa: F401 (el plugin registra el formato al importarse)
+    except ImportError:
+        pass
+    Image.init()
+    return 'AVIF' in Image.SAVE
+
+
+def parse_derivative_sizes(value):
+    """Convierte '160,480,1024' en una tupla ordenada de tamaños; vacío o inválido -> ladder por defecto."""
+    sizes = set()
+    for part in (value or '').split(','):
+        part = part.strip()
+        if part.isdigit() and int(part) > 0:
+            sizes.add(int(part))
+    return tuple(sorted(sizes)) or DEFAULT_DERIVATIVE_SIZES
+
+
+def _derivative_rungs(width, height, sizes):
+    """
+    Peldaños a generar para una imagen. No se amplía nunca: los peldaños mayores que
+    el original se omiten, salvo el primero de ellos, que guarda el original a tamaño real.
+    """
+    longest = max(width, height)
+    rungs = [size for size in sizes if size < longest]
+    larger = [size for size in sizes if size >= longest]
+    if larger:
+        rungs.append(larger[0])
+    return rungs
+
+
+def _draft(image, size):
+    """
+    En JPEG, decodifica directamente a 1/2, 1/4 u 1/8 del original si aun así el lado
+    mayor sigue siendo al menos ``size``. En otros formatos no hace nada.
+    """
+    if image.format != 'JPEG' or not size:
+        return
+    scale = min(1.0, size / max(image.size))
+    image.draft('RGB', (max(1, round(image.width * scale)), max(1, round(image.height * scale))))
+
+
+def _prepare_bitmap(image):
+    """
+    Decodifica, endereza según el EXIF y pasa a RGB/RGBA. Cuando una operación crea un
+    mapa de bits nuevo, el anterior se libera en el acto para no tener dos a la vez.
+    """
+    image.load()
+    orientation = image.getexif().get(iiif.EXIF_ORIENTATION_TAG)
+    if orientation and orientation != 1:
+        transposed = ImageOps.exif_transpose(image)
+        image.close()
+        image = transposed
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    mode = 'RGBA' if has_alpha else 'RGB'
+    if image.mode != mode:
+        converted = image.convert(mode)
+        image.close()
+        image = converted
+    return image
+
+
+def _encode(image, pil_format, **params):
+    output = BytesIO()
+    image.save(output, format=pil_format, **params)
+    return output.getvalue()
+
+
+def make_placeholder(image):
+    """
+    Reduce la imagen a PLACEHOLDER_SIZE px (en su sitio) y la devuelve como data URI JPEG.
+    El navegador la estira con background-size: cover, lo que da el efecto difuminado.
+    """
+    image.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), RESAMPLE_LANCZOS)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    data = _encode(image, 'JPEG', quality=PLACEHOLDER_QUALITY, optimize=True)
+    return 'data:image/jpeg;base64,' + base64.b64encode(data).decode()
+
+
+def negotiate_derivative_formats(requested, accept_header):
+    """
+    Orden de formatos a intentar para una petición: los que el navegador anuncia en
+    Accept, del más compacto al menos. Si no anuncia ninguno (curl, navegadores
+    antiguos con */*), se respeta el formato de la URL.
+    """
+    accept_header = accept_header or ''
+    accepted = [
+        fmt for fmt in DERIVATIVE_FORMAT_PREFERENCE
+        if DERIVATIVE_FORMATS[fmt]['mime'] in accept_header
+    ]
+    if accepted:
+        return accepted
+    return [requested] if requested in DERIVATIVE_FORMATS else ['webp']
+
+
+def process_image(source, derivative_sizes=(), derivative_formats=(),
+                  pyramid_dir=None, tile_size=iiif.DEFAULT_TILE_SIZE):
+    """
+    Genera miniaturas, derivados, teselas IIIF y extrae el EXIF. Es la parte costosa del procesamiento.
+    ``source`` es la ruta del original en el filestore (o sus bytes).
+
+    Las salidas se ordenan de mayor a menor y el mapa de bits se reduce en su sitio de una
+    a la siguiente, así nunca hay copias a resolución completa. Solo la pirámide IIIF
+    necesita el original entero; si ya existe, draft() decodifica el JPEG directamente a
+    la escala más pequeña que basta para la salida mayor.
+    """
+    original = open_image(source)
+    try:
+        result = {}
+        # El EXIF está en la cabecera: se lee antes de decodificar los píxeles
+        exif_dict = extract_exif(original)
+        if exif_dict:
+            result['exif_data'] = json.dumps(exif_dict)
+            result['exif_camera'] = exif_dict.get('camera', '')
+            result['exif_date'] = exif_dict.get('date_taken', False)
+        # Dimensiones enderezadas, antes de que draft() reduzca el original
+        result['image_width'], result['image_height'] = iiif.oriented_size(original)
+
+        # Tamaño -> salidas que se codifican al alcanzarlo
+        outputs = {}
+        if derivative_sizes and derivative_formats:
+            for size in _derivative_rungs(original.width, original.height, derivative_sizes):
+                outputs.setdefault(size, []).extend(('derivative', fmt) for fmt in derivative_formats)
+        for field_name, size in THUMBNAIL_SIZES.items():
+            outputs.setdefault(size, []).append(('thumbnail', field_name))
+
+        build_pyramid = pyramid_dir and not iiif.has_pyramid(pyramid_dir)
+        if not build_pyramid:
+            _draft(original, max(outputs))
+        image = _prepare_bitmap(original)
+
+        if build_pyramid:
+            # Las teselas se escriben directamente en disco; no vuelven por el pool
+            iiif.generate_pyramid(image, pyramid_dir, tile_size)
+
+        derivatives = []
+        for size in sorted(outputs, reverse=True):
+            if max(image.size) > size:
+                image.thumbnail((size, size), RESAMPLE_LANCZOS)
+            for kind, name in outputs[size]:
+                if kind == 'thumbnail':
+                    result[name] = base64.b64encode(_encode(image, 'PNG'))
+                    continue
+                spec = DERIVATIVE_FORMATS[name]
+                data = _encode(image, spec['format'], **spec['params'])
+                derivatives.append({
+                    'size': size,
+                    'image_format': name,
+                    'width': image.width,
+                    'height': image.height,
+                    'file_size': len(data),
+                    'data': base64.b64encode(data),
+                })
+        if derivatives:
+            result['derivatives'] = derivatives
+
+        # El dHash reduce a 9x8: basta con la miniatura más pequeña
+        result['phash'] = phash.to_hex(phash.dhash(image))
+        result['placeholder'] = make_placeholder(image)
+        image.close()
+        return result
+    finally:
+        original.close()
+
+
+def process_image_job(job):
+    """
+    Punto de entrada del pool de procesos.
+    ``job`` es una tupla (image_id, ruta o bytes del original, opciones de process_image);
+    devuelve (image_id, valores, error).
+    """
+    image_id, source, options = job
+    try:
+        return image_id, process_image(source, **options), False
+    except ImageTooLargeError as e:
+        return image_id, {}, f'La imagen es demasiado grande para procesarla: {e}'
+    except InvalidImageError:
+        return image_id, {}, 'El archivo no es un formato de imagen válido o está corrupto.'
+    except Exception as e:
+        return image_id, {}, str(e) or e.__class__.__name__
@@ -0,0 +1,139 @@
+"""
+Hojas de etiquetas A4 con códigos QR para imprimir y pegar en los pliegos.
+
+- Rejilla configurable: columnas, filas, margen de página y separación entre etiquetas.
+- Cada etiqueta lleva el símbolo QR y, opcionalmente, el código de herbario y el
+  nombre científico. El símbolo se dibuja como vector a partir del SVG guardado, así
+  que es nítido a cualquier tamaño de etiqueta. En celdas anchas el texto va a la derecha del QR; en celdas
+  estrechas va debajo.
+- Se genera con reportlab (dependencia de Odoo) sin pasar por QWeb/wkhtmltopdf, que
+  con miles de etiquetas es mucho más lento.
+"""
+from io import BytesIO
+
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfgen import canvas
+
+from . import qr_render
+
+CODE_FONT = ('Helvetica-Bold', 8)
+NAME_FONT = ('Helvetica-Oblique', 7)
+LINE_SPACING = 1.2
+PADDING_MM = 1.5
+# Relación ancho/alto a partir de la cual el texto se coloca a la derecha del QR
+HORIZONTAL_RATIO = 1.6
+MAX_NAME_LINES = 3
+
+
+def get_cell_size(columns, rows, margin_mm, gap_mm, pagesize=A4):
+    """Tamaño (ancho, alto) en puntos de cada etiqueta; ValueError si la rejilla no cabe."""
+    if columns < 1 or rows < 1:
+        raise ValueError('La rejilla necesita al menos una columna y una fila.')
+    page_width, page_height = pagesize
+    width = (page_width - 2 * margin_mm * mm - (columns - 1) * gap_mm * mm) / columns
+    height = (page_height - 2 * margin_mm * mm - (rows - 1) * gap_mm * mm) / rows
+    if width <= 2 * PADDING_MM * mm or height <= 2 * PADDING_MM * mm:
+        raise ValueError('La rejilla no cabe en la página con esos márgenes.')
+    return width, height
+
+
+def _draw_text(pdf, lines, x, y_top, width, align_center=False):
+    """Dibuja las líneas (texto, fuente) desde ``y_top`` hacia abajo. Devuelve la y final."""
+    y = y_top
+    for text, (font, size) in lines:
+        y -= size * LINE_SPACING
+        pdf.setFont(font, size)
+        if align_center:
+            pdf.drawCentredString(x + width / 2, y, text)
+        else:
+            pdf.drawString(x, y, text)
+    return y
+
+
+def _label_lines(label, width, show_code, show_name):
+    lines = []
+    if show_code and label.get('code'):
+        lines.extend((text, CODE_FONT) for text in simpleSplit(label['code'], CODE_FONT[0], CODE_FONT[1], width)[:1])
+    if show_name and label.get('name'):
+        wrapped = simpleSplit(label['name'], NAME_FONT[0], NAME_FONT[1], width)
+        lines.extend((text, NAME_FONT) for text in wrapped[:MAX_NAME_LINES])
+    return lines
+
+
+def _text_height(lines):
+    return sum(size * LINE_SPACING for _text, (_font, size) in lines)
+
+
+def _draw_symbol(pdf, svg, x, y, side):
+    """Dibuja el QR (SVG de qr_render) como rectángulos vectoriales en un cuadrado de lado ``side``."""
+    count, runs = qr_render.parse_svg(svg)
+    module = side / count
+    path = pdf.beginPath()
+    for column, row, width in runs:
+        path.rect(x + column * module, y + side - (row + 1) * module, width * module, module)
+    pdf.setFillGray(0)
+    pdf.drawPath(path, stroke=0, fill=1)
+
+
+def _draw_label(pdf, label, x, y, width, height, show_code, show_name):
+    """Dibuja una etiqueta con su esquina inferior izquierda en (x, y)."""
+    pad = PADDING_MM * mm
+    inner_width, inner_height = width - 2 * pad, height - 2 * pad
+
+    if width >= height * HORIZONTAL_RATIO:
+        side = inner_height
+        _draw_symbol(pdf, label['svg'], x + pad, y + pad, side)
+        text_x = x + 2 * pad + side
+        text_width = inner_width - side - pad
+        lines = _label_lines(label, text_width, show_code, show_name)
+        # Texto centrado verticalmente junto al QR
+        top = y + height / 2 + _text_height(lines) / 2
+        _draw_text(pdf, lines, text_x, top, text_width)
+    else:
+        lines = _label_lines(label, inner_width, show_code, show_name)
+        side = max(min(inner_width, inner_height - _text_height(lines)), 0)
+        qr_y = y + height - pad - side
+        _draw_symbol(pdf, label['svg'], x + (width - side) / 2, qr_y, side)
+        _draw_text(pdf, lines, x + pad, qr_y, inner_width, align_center=True)
+
+
+def build_label_sheet(labels, columns=3, rows=8, margin_mm=10, gap_mm=2,
+                      show_code=True, show_name=True, cut_marks=False, title=None):
+    """
+    Compone las etiquetas en páginas A4 y devuelve los bytes del PDF.
+
+    ``labels``: iterable de dicts con ``svg`` (bytes del QR), ``code`` y ``name``.
+    Las etiquetas se colocan por filas, de izquierda a derecha y de arriba abajo.
+    """
+    width, height = get_cell_size(columns, rows, margin_mm, gap_mm)
+    page_width, page_height = A4
+    per_page = columns * rows
+
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4, pageCompression=1)
+    if title:
+        pdf.setTitle(title)
+    pdf.setLineWidth(0.25)
+    pdf.setStrokeGray(0.75)
+
+    count = 0
+    for count, label in enumerate(labels, start=1):
+        position = (count - 1) % per_page
+        if position == 0 and count > 1:
+            pdf.showPage()
+            pdf.setLineWidth(0.25)
+            pdf.setStrokeGray(0.75)
+        row, column = divmod(position, columns)
+        x = margin_mm * mm + column * (width + gap_mm * mm)
+        y = page_height - margin_mm * mm - (row + 1) * height - row * gap_mm * mm
+        if cut_marks:
+            pdf.rect(x, y, width, height, stroke=1, fill=0)
+        _draw_label(pdf, label, x, y, width, height, show_code, show_name)
+
+    if not count:
+        raise ValueError('No hay etiquetas para imprimir.')
+    pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
@@ -0,0 +1,103 @@
+"""
+Hash perceptual (dHash de 64 bits) para detectar imágenes casi duplicadas.
+
+Re-escaneos, recortes leves y re-exportaciones cambian el SHA-256 pero apenas cambian
+el dHash: la distancia de Hamming entre ambos hashes mide cuánto se parecen.
+
+- Índice multi-tramo: el hash se parte en PHASH_CHUNK_BITS tramos que se guardan en
+  columnas indexadas. Por el principio del palomar, dos hashes a distancia <= número de
+  tramos - 1 coinciden en al menos un tramo, así que la base de datos filtra candidatos
+  por igualdad en lugar de comparar contra toda la tabla.
+- BKTree: índice en memoria para la auditoría masiva, que consulta todas las imágenes.
+"""
+from PIL import Image
+
+HASH_SIZE = 8
+HASH_BITS = HASH_SIZE * HASH_SIZE
+# Tramos del índice multi-tramo (suman 64 bits); garantiza distancias de hasta 4
+PHASH_CHUNK_BITS = (13, 13, 13, 13, 12)
+MAX_INDEXED_DISTANCE = len(PHASH_CHUNK_BITS) - 1
+
+RESAMPLE_BOX = Image.Resampling.BOX if hasattr(Image, 'Resampling') else Image.BOX
+
+
+def dhash(image):
+    """
+    dHash: reduce a 9x8 en grises y compara cada píxel con su vecino derecho.
+    Devuelve el hash como entero de 64 bits.
+    """
+    small = image.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), RESAMPLE_BOX)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def to_hex(value):
+    return f'{value:016x}'
+
+
+def from_hex(value):
+    return int(value, 16)
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+def chunks(value):
+    """Parte el hash en los tramos del índice multi-tramo (del bit más alto al más bajo)."""
+    result = []
+    shift = HASH_BITS
+    for bits in PHASH_CHUNK_BITS:
+        shift -= bits
+        result.append((value >> shift) & ((1 << bits) - 1))
+    return result
+
+
+class BKTree:
+    """
+    Árbol BK sobre la distancia de Hamming. Cada nodo guarda sus hijos por distancia;
+    la desigualdad triangular permite descartar ramas enteras en cada búsqueda.
+    """
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, value, item):
+        self.size += 1
+        if self.root is None:
+            self.root = (value, [item], {})
+            return
+        node = self.root
+        while True:
+            node_value, items, children = node
+            distance = hamming(value, node_value)
+            if distance == 0:
+                items.append(item)
+                return
+            child = children.get(distance)
+            if child is None:
+                children[distance] = (value, [item], {})
+                return
+            node = child
+
+    def search(self, value, max_distance):
+        """Devuelve [(distancia, item)] a distancia <= max_distance, ordenados por distancia."""
+        if self.root is None:
+            return []
+        found = []
+        stack = [self.root]
+        while stack:
+            node_value, items, children = stack.pop()
+            distance = hamming(value, node_value)
+            if distance <= max_distance:
+                found.extend((distance, item) for item in items)
+            low, high = distance - max_distance, distance + max_distance
+            stack.extend(child for d, child in children.items() if low <= d <= high)
+        found.sort(key=lambda pair: pair[0])
+        return found
@@ -0,0 +1,162 @@
+"""
+Renderizado de códigos QR fuera del ORM.
+
+Las funciones reciben datos planos (contenido y parámetros del símbolo) y devuelven
+bytes, así pueden ejecutarse en los procesos de worker_pool al generar QR por lotes.
+
+- Vector como original: el símbolo se guarda como un SVG mínimo con un único ``path``
+  (una tira por cada racha de módulos oscuros de una fila), en unidades de módulo.
+  Ocupa unos pocos KB sea cual sea la resolución de impresión.
+- Raster bajo demanda: el PNG a la resolución pedida se rasteriza desde ese SVG sin
+  volver a codificar el contenido.
+- Los bytes del símbolo dependen solo de (contenido, corrección, caja, borde, formato):
+  ``render_key`` resume esos parámetros y permite reutilizar un QR ya renderizado.
+"""
+import hashlib
+import re
+from io import BytesIO
+
+import qrcode
+from PIL import Image
+
+ERROR_CORRECTION_MAP = {
+    'L': qrcode.constants.ERROR_CORRECT_L,  # 7%
+    'M': qrcode.constants.ERROR_CORRECT_M,  # 15%
+    'Q': qrcode.constants.ERROR_CORRECT_Q,  # 25%
+    'H': qrcode.constants.ERROR_CORRECT_H,  # 30%
+}
+
+DEFAULT_BOX_SIZE = 10
+DEFAULT_BORDER = 4
+QR_FORMAT = 'svg'
+
+_VIEWBOX_RE = re.compile(rb'viewBox="0 0 (\d+) (\d+)"')
+_RUN_RE = re.compile(rb'M(\d+) (\d+)h(\d+)')
+
+# Lado del PNG pequeño que se muestra en las vistas del backend
+PREVIEW_SIZE = 256
+
+RESAMPLE_NEAREST = Image.Resampling.NEAREST if hasattr(Image, 'Resampling') else Image.NEAREST
+
+
+def render_key(payload, error_correction='H', box_size=DEFAULT_BOX_SIZE, border=DEFAULT_BORDER,
+               image_format=QR_FORMAT):
+    """Clave de contenido del símbolo, con los mismos valores por defecto que ``render_svg``."""
+    parts = [
+        payload or '',
+        error_correction if error_correction in ERROR_CORRECTION_MAP else 'H',
+        str(box_size or DEFAULT_BOX_SIZE),
+        str(border or DEFAULT_BORDER),
+        image_format,
+    ]
+    return hashlib.sha256('\x1f'.join(parts).encode()).hexdigest()
+
+
+def raster_key(svg_key, size):
+    """Clave del PNG rasterizado a ``size`` píxeles desde el SVG con clave ``svg_key``."""
+    return hashlib.sha256(f'{svg_key}\x1fpng\x1f{size}'.encode()).hexdigest()
+
+
+def make_matrix(payload, error_correction='H', border=DEFAULT_BORDER):
+    """Matriz de módulos (filas de booleanos, borde incluido) del símbolo que codifica ``payload``."""
+    qr = qrcode.QRCode(
+        version=None,
+        error_correction=ERROR_CORRECTION_MAP.get(error_correction, qrcode.constants.ERROR_CORRECT_H),
+        border=border or DEFAULT_BORDER,
+    )
+    qr.add_data(payload)
+    qr.make(fit=True)
+    return qr.get_matrix()
+
+
+def _runs(matrix):
+    """Rachas horizontales de módulos oscuros: (x, y, ancho)."""
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < len(row):
+            if row[x]:
+                start = x
+                while x < len(row) and row[x]:
+                    x += 1
+                yield start, y, x - start
+            else:
+                x += 1
+
+
+def render_svg(payload, error_correction='H', box_size=DEFAULT_BOX_SIZE, border=DEFAULT_BORDER):
+    """
+    Genera el SVG del símbolo. El ``viewBox`` está en módulos; ``box_size`` solo fija el
+    tamaño intrínseco (píxeles por módulo) con el que se muestra si nadie lo escala.
+    """
+    matrix = make_matrix(payload, error_correction, border)
+    count = len(matrix)
+    side = count * (box_size or DEFAULT_BOX_SIZE)
+    path = ''.join(f'M{x} {y}h{width}v1h-{width}z' for x, y, width in _runs(matrix))
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{side}" height="{side}" '
+        f'viewBox="0 0 {count} {count}" shape-rendering="crispEdges">'
+        f'<rect width="{count}" height="{count}" fill="#fff"/>'
+        f'<path d="{path}" fill="#000"/></svg>'
+    ).encode()
+
+
+def parse_svg(svg):
+    """Lee un SVG de ``render_svg``: ``(módulos por lado, [(x, y, ancho), ...])``."""
+    match = _VIEWBOX_RE.search(svg)
+    if not match:
+        raise ValueError('El SVG no fue generado por render_svg.')
+    runs = [tuple(int(value) for value in run) for run in _RUN_RE.findall(svg)]
+    return int(match.group(1)), runs
+
+
+def rasterize_svg(svg, size):
+    """
+    PNG de ``size`` x ``size`` píxeles. Cada módulo ocupa un número entero de píxeles
+    (bordes nítidos para los lectores) y el sobrante se reparte como margen blanco.
+    """
+    count, runs = parse_svg(svg)
+    modules = Image.new('1', (count, count), 1)
+    for x, y, width in runs:
+        modules.paste(0, (x, y, x + width, y + 1))
+    module_px = max(1, size // count)
+    scaled = modules.resize((count * module_px, count * module_px), RESAMPLE_NEAREST)
+    if scaled.width == size:
+        image = scaled
+    else:
+        image = Image.new('1', (max(size, scaled.width),) * 2, 1)
+        offset = (image.width - scaled.width) // 2
+        image.paste(scaled, (offset, offset))
+    buffer = BytesIO()
+    image.save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
+
+
+def symbol_info(svg, border=DEFAULT_BORDER):
+    """Metadatos del símbolo que se guardan junto al SVG: checksum, tamaño, versión y módulos."""
+    match = _VIEWBOX_RE.search(svg)
+    if not match:
+        raise ValueError('El SVG no fue generado por render_svg.')
+    modules = int(match.group(1)) - 2 * (border or DEFAULT_BORDER)
+    return {
+        'checksum': hashlib.sha256(svg).hexdigest(),
+        'file_size_bytes': len(svg),
+        # Versión 1 = 21 módulos por lado; cada versión suma 4
+        'symbol_version': (modules - 17) // 4,
+        'module_count': modules,
+    }
+
+
+def render_job(job):
+    """
+    Trabajo del pool: ``(clave, contenido, corrección, tamaño de caja, borde)`` ->
+    ``(clave, svg, metadatos, png de vista previa)``.
+    """
+    key, payload, error_correction, box_size, border = job
+    svg = render_svg(payload, error_correction, box_size, border)
+    return key, svg, symbol_info(svg, border), rasterize_svg(svg, PREVIEW_SIZE)
+
+
+def raster_job(job):
+    """Trabajo del pool: ``(clave, svg, tamaño)`` -> ``(clave, png)``."""
+    key, svg, size = job
+    return key, rasterize_svg(svg, size)
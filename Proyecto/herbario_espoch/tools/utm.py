@@ -0,0 +1,155 @@
+"""
+Conversión UTM <-> WGS84 por lotes.
+
+Usa las series de Krüger (en la forma de Karney, hasta n³), con error de milímetros
+dentro de la zona, aplicadas con NumPy sobre arrays completos: convertir decenas de
+miles de puntos es una sola pasada de operaciones vectoriales.
+
+Las libretas de campo ecuatorianas escriben la zona con la letra del hemisferio, no con
+la banda MGRS: ``17S`` es la zona 17 sur (no la banda S del hemisferio norte). Textos
+aceptados, con coma o punto decimal::
+
+    17S 758000 9850000
+    17 S 758000E 9850000N
+    Zona 18S E: 180500 N: 9975000
+"""
+import re
+
+import numpy as np
+
+# Elipsoide WGS84
+_A = 6378137.0
+_F = 1 / 298.257223563
+_N = _F / (2 - _F)
+_RECTIFYING_RADIUS = _A / (1 + _N) * (1 + _N ** 2 / 4 + _N ** 4 / 64)
+_ALPHA = (
+    _N / 2 - 2 * _N ** 2 / 3 + 5 * _N ** 3 / 16,
+    13 * _N ** 2 / 48 - 3 * _N ** 3 / 5,
+    61 * _N ** 3 / 240,
+)
+_BETA = (
+    _N / 2 - 2 * _N ** 2 / 3 + 37 * _N ** 3 / 96,
+    _N ** 2 / 48 + _N ** 3 / 15,
+    17 * _N ** 3 / 480,
+)
+_DELTA = (
+    2 * _N - 2 * _N ** 2 / 3 - 2 * _N ** 3,
+    7 * _N ** 2 / 3 - 8 * _N ** 3 / 5,
+    56 * _N ** 3 / 15,
+)
+_ECCENTRICITY_TERM = 2 * np.sqrt(_N) / (1 + _N)
+
+SCALE_FACTOR = 0.9996
+FALSE_EASTING = 500000.0
+FALSE_NORTHING_SOUTH = 10000000.0
+
+_EASTING = r'\d{5,7}(?:[.,]\d+)?'
+# Junto al ecuador el norte del hemisferio norte tiene pocas cifras (5532 m a 0,05° N)
+_NORTHING = r'\d{1,7}(?:[.,]\d+)?'
+_UTM_RE = re.compile(
+    rf'^\s*(?:zona\s*)?(?P<zone>\d{{1,2}})\s*(?P<hem>[NS])\b[\s,;]*'
+    rf'(?:E\s*[:=]?\s*)?(?P<easting>{_EASTING})\s*(?:m\s*)?E?\b[\s,;]*'
+    rf'(?:N\s*[:=]?\s*)?(?P<northing>{_NORTHING})\s*(?:m\s*)?N?\s*$',
+    re.IGNORECASE,
+)
+
+
+def parse(texts):
+    """
+    Separa textos UTM en arrays ``(zona, sur, este, norte)`` del largo de ``texts``.
+    Los textos no válidos quedan con zona 0 y coordenadas ``nan``.
+    """
+    rows = []
+    for text in texts:
+        match = _UTM_RE.match(text) if text and isinstance(text, str) else None
+        if match and 1 <= int(match.group('zone')) <= 60:
+            rows.append((
+                int(match.group('zone')),
+                match.group('hem').upper() == 'S',
+                float(match.group('easting').replace(',', '.')),
+                float(match.group('northing').replace(',', '.')),
+            ))
+        else:
+            rows.append((0, False, np.nan, np.nan))
+    if not rows:
+        return np.empty(0, dtype=int), np.empty(0, dtype=bool), np.empty(0), np.empty(0)
+    zone, south, easting, northing = zip(*rows)
+    return np.array(zone), np.array(south), np.array(easting, dtype=float), np.array(northing, dtype=float)
+
+
+def _central_meridian(zone):
+    return np.radians(np.asarray(zone) * 6.0 - 183.0)
+
+
+def to_latlon(zone, south, easting, northing):
+    """Arrays UTM -> arrays ``(latitud, longitud)`` en grados decimales."""
+    xi = (np.asarray(northing, dtype=float) - np.where(south, FALSE_NORTHING_SOUTH, 0.0)) \
+        / (SCALE_FACTOR * _RECTIFYING_RADIUS)
+    eta = (np.asarray(easting, dtype=float) - FALSE_EASTING) / (SCALE_FACTOR * _RECTIFYING_RADIUS)
+
+    xi_prime = xi.copy()
+    eta_prime = eta.copy()
+    for j, beta in enumerate(_BETA, start=1):
+        xi_prime -= beta * np.sin(2 * j * xi) * np.cosh(2 * j * eta)
+        eta_prime -= beta * np.cos(2 * j * xi) * np.sinh(2 * j * eta)
+
+    chi = np.arcsin(np.sin(xi_prime) / np.cosh(eta_prime))
+    latitude = chi.copy()
+    for j, delta in enumerate(_DELTA, start=1):
+        latitude += delta * np.sin(2 * j * chi)
+    longitude = _central_meridian(zone) + np.arctan2(np.sinh(eta_prime), np.cos(xi_prime))
+    return np.degrees(latitude), np.degrees(longitude)
+
+
+def zone_for(longitude):
+    """Zona UTM (1-60) de cada longitud."""
+    return (np.floor((np.asarray(longitude, dtype=float) + 180.0) / 6.0).astype(int) % 60) + 1
+
+
+def from_latlon(latitude, longitude, zone=None):
+    """
+    Arrays ``(latitud, longitud)`` -> arrays ``(zona, sur, este, norte)``. Sin ``zone``
+    se usa la zona de cada longitud; con ella se puede forzar una zona vecina.
+    """
+    phi = np.radians(np.asarray(latitude, dtype=float))
+    zone = zone_for(longitude) if zone is None else np.broadcast_to(np.asarray(zone), phi.shape)
+    lam = np.radians(np.asarray(longitude, dtype=float)) - _central_meridian(zone)
+
+    sin_phi = np.sin(phi)
+    t = np.sinh(np.arctanh(sin_phi) - _ECCENTRICITY_TERM * np.arctanh(_ECCENTRICITY_TERM * sin_phi))
+    xi_prime = np.arctan2(t, np.cos(lam))
+    eta_prime = np.arctanh(np.sin(lam) / np.sqrt(1 + t * t))
+
+    xi = xi_prime.copy()
+    eta = eta_prime.copy()
+    for j, alpha in enumerate(_ALPHA, start=1):
+        xi += alpha * np.sin(2 * j * xi_prime) * np.cosh(2 * j * eta_prime)
+        eta += alpha * np.cos(2 * j * xi_prime) * np.sinh(2 * j * eta_prime)
+
+    south = phi < 0
+    easting = FALSE_EASTING + SCALE_FACTOR * _RECTIFYING_RADIUS * eta
+    northing = np.where(south, FALSE_NORTHING_SOUTH, 0.0) + SCALE_FACTOR * _RECTIFYING_RADIUS * xi
+    return zone, south, easting, northing
+
+
+def parse_to_latlon(texts):
+    """Textos UTM -> arrays ``(latitud, longitud)``, con ``nan`` en los no válidos."""
+    zone, south, easting, northing = parse(texts)
+    latitude, longitude = to_latlon(zone, south, easting, northing)
+    # Fuera de rango: el texto no era un UTM razonable (p. ej. norte de otro hemisferio)
+    valid = (np.abs(latitude) <= 90) & (np.abs(easting - FALSE_EASTING) < FALSE_EASTING)
+    return np.where(valid, latitude, np.nan), np.where(valid, longitude, np.nan)
+
+
+def format_utm(zone, south, easting, northing):
+    """Texto ``17S 758000 9850000`` (metros enteros) de un punto UTM."""
+    return f"{int(zone)}{'S' if south else 'N'} {easting:.0f} {northing:.0f}"
+
+
+def format_many(latitude, longitude):
+    """Arrays ``(latitud, longitud)`` -> lista de textos UTM."""
+    zone, south, easting, northing = from_latlon(latitude, longitude)
+    return [
+        format_utm(*values)
+        for values in zip(zone.tolist(), south.tolist(), easting.tolist(), northing.tolist())
+    ]
@@ -0,0 +1,63 @@
+"""
+Pool de procesos para las tareas pesadas del herbario.
+
+Las funciones que se envían al pool deben ser funciones de módulo sin acceso
+al ORM: reciben datos planos y devuelven diccionarios que el proceso principal
+escribe en la base de datos.
+
+Para trabajos que pasan casi todo el tiempo esperando a otro proceso (wkhtmltopdf)
+o a la base de datos, ``map_in_threads`` usa hilos en lugar de procesos.
+"""
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+_logger = logging.getLogger(__name__)
+
+
+def default_worker_count():
+    """Número de procesos por defecto: los núcleos disponibles, con un máximo de 4."""
+    return max(1, min(4, os.cpu_count() or 1))
+
+
+def map_in_pool(func, items, max_workers=None):
+    """
+    Aplica ``func`` a cada elemento de ``items`` en procesos trabajadores y
+    devuelve los resultados en el mismo orden.
+
+    Con un solo trabajador (o un solo elemento) se ejecuta en el proceso actual,
+    lo que evita el coste de crear el pool y facilita las pruebas.
+    """
+    items = list(items)
+    if not items:
+        return []
+    if max_workers is None:
+        max_workers = default_worker_count()
+    max_workers = min(max_workers, len(items))
+    if max_workers <= 1:
+        return [func(item) for item in items]
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(func, items))
+    except (OSError, BrokenProcessPool):
+        _logger.warning("Pool de procesos no disponible, se procesa de forma secuencial.", exc_info=True)
+        return [func(item) for item in items]
+
+
+def map_in_threads(func, items, max_workers=None):
+    """
+    Como ``map_in_pool`` pero con hilos, así ``func`` puede ser un cierre sobre el
+    registro y abrir su propio cursor. Devuelve los resultados en el mismo orden y
+    con un solo trabajador se ejecuta en el hilo actual.
+    """
+    items = list(items)
+    if not items:
+        return []
+    if max_workers is None:
+        max_workers = default_worker_count()
+    max_workers = min(max_workers, len(items))
+    if max_workers <= 1:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='herbario') as executor:
+        return list(executor.map(func, items))